@@ -0,0 +1,410 @@
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from speach import elan
+import config
+from eaf_parser import EAF_Parser
+from tier_map import TierMap
+from eaf_template import EafTemplate
+from single_eaf_glosser import SingleEafGlosser
+from input_files_handler import InputFilesHandler
+from glosses_dictionary_parser import glossesDictionaryParser
+from preprocessing import preprocessor
+from preprocessing.annotation_cleaner import AnnotationCleaner
+from preprocessing.segmentation_cache import SegmentationCache
+from preprocessing.language_identifier import LanguageIdentifier
+from pipeline_metrics import PipelineMetrics
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class RequestError(Exception):
+    """
+    An invalid request (e.g., an eaf file whose tiers format is invalid). It is answered with 400 Bad Request.
+    """
+
+
+class AnalyzerResources:
+    """
+    The resources of the pipeline (the glossing dictionary, the misspellings rules, the words not to segment, the
+    paralinguistic items and the capitalized words), loaded once from the paths of config, and the modification times
+    of their files when they were loaded, so a change can be detected (see AnalyzerService.watch_resources).
+    """
+
+    def __init__(self):
+        self.files_stats = get_files_stats(self.get_paths())     # before loading, so a change during it is detected
+        input_files_reader = InputFilesHandler()
+        dicts_parser = glossesDictionaryParser()
+        self.gram_dict, self.lexical_dict = dicts_parser.parse_dicts_from_file(config.GLOSSES_DICT_PATH,
+                                                                                 config.GLOSSES_DICT_WORKSHEET_NAME,
+                                                                                 config.GLOSSES_DICT_CACHE_PATH)
+        self.adverbs = dicts_parser.get_adverbs_set()
+        self.dicts_fingerprint = dicts_parser.get_dicts_fingerprint()
+        self.spelling_corrector = AnnotationCleaner.create_spelling_corrector()      # compiled once, not per request
+        self.paralinguistic_items = input_files_reader.read_json_into_dict(config.PARALINGUISTIC_ITEMS_PATH)
+        self.words_not_to_segment = input_files_reader.read_json_into_dict(config.WORDS_NOT_TO_SEGMENT)
+        self.capitalized_words = input_files_reader.read_capitalized_words_file(config.CAPITALIZED_WORDS_LIST_PATH)
+        self.load_time = time.time()
+
+    @staticmethod
+    def get_paths():
+        return {"glossing dictionary": config.GLOSSES_DICT_PATH,
+                "misspellings correction": AnnotationCleaner.MISSPELLINGS_DICTS_PATH,
+                "words not to segment": config.WORDS_NOT_TO_SEGMENT,
+                "paralinguistic items": config.PARALINGUISTIC_ITEMS_PATH,
+                "capitalized words": config.CAPITALIZED_WORDS_LIST_PATH}
+
+
+class AnalyzerService:
+    """
+    Analyzes eaf files or raw utterances with resources which are kept loaded, and loaded again when their files
+    change. The requests are processed one at a time, and they don't write to any input file.
+    """
+    RELOAD_CHECK_INTERVAL = 1.0             # seconds between the checks of the resource files
+    DEFAULT_MAX_REQUESTS = 4
+    SPEAKER = "A"                           # the speaker of the tiers of raw utterances
+    UTTERANCE_DURATION = 1000               # milliseconds, the (arbitrary) duration of each raw utterance
+
+    def __init__(self, auto_detect_english: bool = True, max_requests: int = DEFAULT_MAX_REQUESTS,
+                 reload_check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.auto_detect_english = auto_detect_english
+        self.max_requests = max_requests
+        self.reload_check_interval = reload_check_interval
+        self.metrics = PipelineMetrics()
+        with self.metrics.time("resources loading"):
+            self.resources = AnalyzerResources()
+        self.segmentation_cache = SegmentationCache()
+        self.segmentation_cache.load(config.SEGMENTATION_CACHE_PATH)     # the segmentations of the batch runs, if any
+        self.language_identifier = None
+        if auto_detect_english:
+            self.language_identifier = LanguageIdentifier()
+            self.language_identifier.identify_english(["This loads the language profiles."])
+        self.processing_lock = threading.Lock()             # held while a request is processed
+        self.admission_lock = threading.Lock()              # held while active_requests is checked or changed
+        self.active_requests = 0                            # the requests which wait or are processed
+        self.rejected_requests = 0
+        self.stop_event = threading.Event()
+        self.watcher = None
+
+    def start_watching(self):
+        self.watcher = threading.Thread(target=self.watch_resources, name="resources watcher", daemon=True)
+        self.watcher.start()
+
+    def stop_watching(self):
+        self.stop_event.set()
+        if self.watcher is not None:
+            self.watcher.join()
+
+    def watch_resources(self):
+        """
+        Checks the resource files periodically, and loads the resources again if one of them changed. The requests
+        are not blocked while the resources are loaded. If they cannot be loaded (e.g., a file is being written), the
+        previous resources are kept, and the loading is tried again when the files change again.
+        """
+        failed_files_stats = None           # the stats of the files when the resources could not be loaded
+        while not self.stop_event.wait(self.reload_check_interval):
+            files_stats = get_files_stats(AnalyzerResources.get_paths())
+            if files_stats != self.resources.files_stats and files_stats != failed_files_stats:
+                failed_files_stats = None if self.reload_resources() else files_stats
+
+    def reload_resources(self):
+        """
+        :return: True if the resources were loaded again, False if they could not be loaded
+        """
+        start = time.perf_counter()
+        try:
+            resources = AnalyzerResources()
+        except Exception as e:
+            print("The resources could not be loaded again, so the previous ones are kept: " + repr(e))
+            return False
+        seconds = time.perf_counter() - start
+        with self.processing_lock:
+            self.resources = resources
+            self.metrics.add_time("resources loading", "", seconds)
+            self.metrics.count("resources reloads")
+        print("The resources were loaded again ({:.2f}s)".format(seconds))
+        return True
+
+    def try_admit(self):
+        """
+        :return: True if the request may be processed (then release must be called when it is done), False if there
+                 are already max_requests requests
+        """
+        with self.admission_lock:
+            if self.active_requests >= self.max_requests:
+                self.rejected_requests += 1
+                return False
+            self.active_requests += 1
+            return True
+
+    def release(self):
+        with self.admission_lock:
+            self.active_requests -= 1
+
+    def analyze_eaf(self, eaf_bytes: bytes, compact: bool = False):
+        """
+        Processes an eaf file as main.process_single_file_in_memory does (preprocessing, tokenization and glossing).
+        :return: the output eaf file, as bytes
+        """
+        with self.processing_lock, self.metrics.time("eaf request"):
+            try:
+                eaf = elan.parse_eaf_stream(io.BytesIO(eaf_bytes))
+            except Exception as e:
+                raise RequestError("The eaf file could not be parsed: " + str(e))
+            if not TierMap.of(eaf).speakers:
+                raise RequestError("The eaf file has no tx tiers.")
+            glosser = self.process_doc(eaf, "the eaf file of the request")
+            output_file = io.BytesIO()
+            with self.metrics.time("saving"):
+                glosser.eaf_parser.write_file(output_file, compact)
+            return output_file.getvalue()
+
+    def analyze_utterances(self, utterances: list):
+        """
+        Processes raw utterances, as if they were the tx annotations (with their fte annotations) of a single speaker
+        in an eaf file.
+        :param utterances: a list of dicts of the form {"tx": text, "fte": translation}, where "fte" is optional
+        :return: a list of the results of the utterances, in their order: {"tx": the cleaned tx, "orig": the
+                 original tx, "fte": the translation, "morphemes": [{"mb": morpheme, "ge": gloss, "ps": part of
+                 speech}]}
+        """
+        document = EafTemplate((self.SPEAKER,), "urn:nl-mpi-tools-elan-eaf:analyzer-service")
+        for i, utterance in enumerate(utterances):
+            if not isinstance(utterance, dict) or not isinstance(utterance.get("tx"), str) \
+                    or not isinstance(utterance.get("fte", ""), str):
+                raise RequestError("Utterance " + str(i) + " must be an object with a \"tx\" string and an optional "
+                                   "\"fte\" string.")
+            document.add_utterance(self.SPEAKER, i * self.UTTERANCE_DURATION, (i + 1) * self.UTTERANCE_DURATION,
+                                   str(i + 1), utterance["tx"], utterance.get("fte", ""))
+        with self.processing_lock, self.metrics.time("utterances request"):
+            eaf = elan.parse_eaf_stream(io.BytesIO(document.to_bytes()))
+            glosser = self.process_doc(eaf, "the utterances of the request")
+            self.metrics.count("requested utterances", len(utterances))
+            return get_utterances_results(glosser.eaf_parser, self.SPEAKER)
+
+    def process_doc(self, eaf: elan.Doc, name: str):
+        """
+        Preprocesses, tokenizes and glosses a Doc in place. It must be called while processing_lock is held.
+        :param name: the name of the document in messages
+        :return: the SingleEafGlosser of the Doc
+        """
+        resources = self.resources
+        capitalized_words = set(resources.capitalized_words)    # the new capitalized words are used only here
+        with self.metrics.time("preprocessing"):
+            cur_preprocessor = preprocessor.Preprocessor(name, None, None, self.auto_detect_english,
+                                                         capitalized_words, resources.words_not_to_segment,
+                                                         resources.paralinguistic_items, resources.adverbs, eaf,
+                                                         self.segmentation_cache, self.language_identifier,
+                                                         self.metrics, resources.spelling_corrector)
+            if not cur_preprocessor.preprocess_file():
+                raise RequestError("The tiers format of " + name + " is invalid: each tx tier must have fte and "
+                                   "orig tiers.")
+        with self.metrics.time("tokenization"):
+            EAF_Parser(eaf).tokenize_all_tx_tiers()
+        with self.metrics.time("glossing"):
+            glosser = SingleEafGlosser(name, capitalized_words, resources.paralinguistic_items, eaf, self.metrics,
+                                       resources.spelling_corrector)
+            glosser.gloss_file(resources.gram_dict, resources.lexical_dict)
+        return glosser
+
+    def get_status(self):
+        """
+        :return: a dict of the state of the service: when the resources were loaded, the fingerprint of the glossing
+                 dictionary, the settings, the number of requests waiting or being processed and the counters
+        """
+        resources = self.resources
+        with self.processing_lock:
+            counters = dict(self.metrics.counters)
+        return {"resources_loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(resources.load_time)),
+                "glossing_dictionary_fingerprint": resources.dicts_fingerprint,
+                "resources_paths": AnalyzerResources.get_paths(),
+                "auto_detect_english": self.auto_detect_english,
+                "max_requests": self.max_requests,
+                "active_requests": self.active_requests,
+                "rejected_requests": self.rejected_requests,
+                "counters": counters}
+
+    def get_metrics(self):
+        """
+        :return: the metrics of the service (the times of the requests and of their stages, and counters), in the
+                 Prometheus text exposition format
+        """
+        with self.processing_lock:
+            return self.metrics.to_prometheus()
+
+
+class AnalyzerRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP interface of AnalyzerService:
+    POST /utterances - a JSON object {"utterances": [{"tx": text, "fte": translation}, ...]}; answered with a JSON
+                       object {"utterances": [...]} (see AnalyzerService.analyze_utterances)
+    POST /eaf        - an eaf file; answered with the processed eaf file (add ?compact=1 for no indentation)
+    GET /status      - a JSON object of the state of the service (see AnalyzerService.get_status)
+    GET /metrics     - the metrics of the service, in the Prometheus text exposition format
+    If there are already max_requests requests, a POST request is answered with 503 Service Unavailable.
+    """
+    server_version = "KhoekhoeAnalyzer/1.0"
+    MAX_REQUEST_SIZE = 256 << 20            # bytes
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlsplit(self.path).path
+        if path == "/status":
+            self.send_json(200, service.get_status())
+        elif path == "/metrics":
+            self.send_body(200, service.get_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self.send_json(404, {"error": "Unknown path " + path})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path not in ("/utterances", "/eaf"):
+            self.send_json(404, {"error": "Unknown path " + url.path})
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.close_connection = True
+            self.send_json(411, {"error": "The request has no Content-Length"})
+            return
+        if not (length.isascii() and length.isdigit()):         # a non-negative integer
+            self.close_connection = True
+            self.send_json(400, {"error": "Invalid Content-Length " + length})
+            return
+        length = int(length)
+        if length > self.MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self.send_json(413, {"error": "The request is larger than " + str(self.MAX_REQUEST_SIZE) + " bytes"})
+            return
+        if not service.try_admit():             # before reading the body, so a rejected request costs nothing
+            self.close_connection = True        # the body is not read
+            self.send_json(503, {"error": "Too many requests, try again later"}, {"Retry-After": "1"})
+            return
+        try:
+            body = self.rfile.read(length)
+            if url.path == "/utterances":
+                try:
+                    request = json.loads(body)
+                except ValueError as e:
+                    raise RequestError("The request is not valid JSON: " + str(e))
+                if not isinstance(request, dict) or not isinstance(request.get("utterances"), list):
+                    raise RequestError("The request must be a JSON object with an \"utterances\" list.")
+                self.send_json(200, {"utterances": service.analyze_utterances(request["utterances"])})
+            else:
+                compact = url.query in ("compact", "compact=1", "compact=true")
+                self.send_body(200, service.analyze_eaf(body, compact), "application/xml")
+        except RequestError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": repr(e)})
+            raise
+        finally:
+            service.release()
+
+    def send_json(self, status: int, obj, headers: dict = None):
+        self.send_body(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"),
+                       "application/json; charset=utf-8", headers)
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AnalyzerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: AnalyzerService):
+        super().__init__(address, AnalyzerRequestHandler)
+        self.service = service
+
+
+def get_files_stats(paths: dict):
+    """
+    :return: {name : (modification time, size) of the file, or None if it is missing}
+    """
+    files_stats = {}
+    for name, path in paths.items():
+        try:
+            file_stat = os.stat(path)
+            files_stats[name] = (file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            files_stats[name] = None
+    return files_stats
+
+
+def get_utterances_results(eaf_parser: EAF_Parser, speaker: str):
+    """
+    :return: the results of the tx annotations of the speaker (see AnalyzerService.analyze_utterances)
+    """
+    tiers = eaf_parser.tiers
+    speaker_tiers = eaf_parser.tier_map.speakers[speaker]
+    annotations_by_ref = {}         # {tier type : {ref_id : [annotations]}}
+    for tier_type in ("fte", "orig", "mb", "ge", "ps"):
+        by_ref = annotations_by_ref[tier_type] = {}
+        for annotation in tiers[speaker_tiers[tier_type]]:
+            by_ref.setdefault(annotation.ref_id, []).append(annotation)
+    results = []
+    for tx_annotation in tiers[speaker_tiers["tx"]]:
+        result = {"tx": tx_annotation.value}
+        for tier_type in ("orig", "fte"):
+            annotations = annotations_by_ref[tier_type].get(tx_annotation.ID)
+            result[tier_type] = annotations[0].value if annotations else ""
+        morphemes = []
+        for mb_annotation in annotations_by_ref["mb"].get(tx_annotation.ID, []):
+            morpheme = {"mb": mb_annotation.value}
+            for tier_type in ("ge", "ps"):
+                annotations = annotations_by_ref[tier_type].get(mb_annotation.ID)
+                morpheme[tier_type] = annotations[0].value if annotations else ""
+            morphemes.append(morpheme)
+        result["morphemes"] = morphemes
+        results.append(result)
+    return results
+
+
+def parse_input_args(args):
+    args_parser = argparse.ArgumentParser(description="A local HTTP service which analyzes Khoekhoe ELAN files and "
+                                                      "utterances with warm resources")
+    args_parser.add_argument("--host", default=DEFAULT_HOST, help="the address to listen on (default: 127.0.0.1)")
+    args_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the port to listen on (default: 8765)")
+    args_parser.add_argument("--max-requests", type=int, default=AnalyzerService.DEFAULT_MAX_REQUESTS,
+                             help="the maximal number of requests which may wait or be processed at once; more "
+                                  "requests are rejected with 503 (default: 4)")
+    args_parser.add_argument("--reload-interval", type=float, default=AnalyzerService.RELOAD_CHECK_INTERVAL,
+                             help="seconds between the checks of the resource files for changes (default: 1)")
+    args_parser.add_argument("--no-english-detection", action="store_true",
+                             help="do not detect English parts automatically")
+    parsed_args = args_parser.parse_args(args)
+    if parsed_args.max_requests < 1 or parsed_args.reload_interval <= 0:
+        args_parser.error("--max-requests and --reload-interval must be positive")
+    return parsed_args
+
+
+def run_service():
+    args = parse_input_args(sys.argv[1:])
+    service = AnalyzerService(not args.no_english_detection, args.max_requests, args.reload_interval)
+    server = AnalyzerServer((args.host, args.port), service)
+    service.start_watching()
+    print("The analyzer service is listening on http://" + args.host + ":" + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop_watching()
+
+
+if __name__ == '__main__':
+    run_service()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from speach import elan
+import config
+from eaf_parser import EAF_Parser
+from single_eaf_glosser import SingleEafGlosser
+from input_files_handler import InputFilesHandler
+from glosses_dictionary_parser import glossesDictionaryParser
+from preprocessing import preprocessor
+from preprocessing.segmentation_cache import SegmentationCache
+from preprocessing.language_identifier import LanguageIdentifier
+from benchmarks.corpus_generator import SyntheticCorpusGenerator
+
+RESULTS_VERSION = 1         # must be incremented whenever the structure of the results changes
+STAGES = ("parse", "preprocess", "tokenize", "gloss", "save")
+DEFAULT_UTTERANCES = (1, 10, 100, 1000, 10000)
+
+
+class Benchmark:
+    """
+    Times each stage of the processing (parsing, Preprocessor.preprocess_file, EAF_Parser.tokenize_all_tx_tiers,
+    SingleEafGlosser.gloss_file and saving) of synthetic files of several sizes (see SyntheticCorpusGenerator).
+    Each run of a file starts cold (a new segmentation cache and language identifier, and a copy of the capitalized
+    words), so the repeats are independent, and the median and the minimum of the repeats are reported.
+    The resources are loaded from the paths of config, as in a normal run, and no resource file is changed.
+    """
+
+    def __init__(self, auto_detect_english: bool = True, repeat: int = 3, seed: int = 0):
+        self.auto_detect_english = auto_detect_english
+        self.repeat = repeat
+        self.seed = seed
+        input_files_reader = InputFilesHandler()
+        dicts_parser = glossesDictionaryParser()
+        self.gram_dict, self.lexical_dict = dicts_parser.parse_dicts_from_file(config.GLOSSES_DICT_PATH,
+                                                                                 config.GLOSSES_DICT_WORKSHEET_NAME,
+                                                                                 config.GLOSSES_DICT_CACHE_PATH)
+        self.adverbs = dicts_parser.get_adverbs_set()
+        self.paralinguistic_items = input_files_reader.read_json_into_dict(config.PARALINGUISTIC_ITEMS_PATH)
+        self.words_not_to_segment = input_files_reader.read_json_into_dict(config.WORDS_NOT_TO_SEGMENT)
+        self.capitalized_words = input_files_reader.read_capitalized_words_file(config.CAPITALIZED_WORDS_LIST_PATH)
+        self.generator = SyntheticCorpusGenerator(self.gram_dict, self.lexical_dict, self.capitalized_words, seed)
+
+    def run(self, utterances_nums, speakers_nums):
+        """
+        :return: the results, as a dict (see write_results)
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as work_directory:
+            for speakers_num in speakers_nums:
+                for utterances_num in utterances_nums:
+                    input_path = os.path.join(work_directory, "synthetic.eaf")
+                    output_path = os.path.join(work_directory, "synthetic_output.eaf")
+                    self.generator.generate_file(input_path, utterances_num, speakers_num)
+                    runs = [self.run_file(input_path, output_path) for _ in range(self.repeat)]
+                    result = {"utterances": utterances_num,
+                              "speakers": speakers_num,
+                              "morphemes": runs[0]["morphemes"],
+                              "stages": summarize_runs([run["timings"] for run in runs])}
+                    print(format_result(result))
+                    results.append(result)
+        return {"version": RESULTS_VERSION,
+                "commit": get_commit(),
+                "environment": {"python": platform.python_version(), "platform": platform.platform()},
+                "settings": {"auto_detect_english": self.auto_detect_english, "repeat": self.repeat,
+                             "seed": self.seed},
+                "results": results}
+
+    def run_file(self, input_path: str, output_path: str):
+        """
+        Processes a single file once, as main.process_single_file_in_memory does, timing each stage.
+        :return: {"timings": {stage : seconds}, "morphemes": number of mb annotations}
+        """
+        timings = {}
+        start = time.perf_counter()
+        eaf = elan.read_eaf(input_path)
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        capitalized_words = set(self.capitalized_words)
+        language_identifier = LanguageIdentifier(seed=self.seed) if self.auto_detect_english else None
+        cur_preprocessor = preprocessor.Preprocessor(input_path, None, None, self.auto_detect_english,
+                                                     capitalized_words, self.words_not_to_segment,
+                                                     self.paralinguistic_items, self.adverbs, eaf,
+                                                     SegmentationCache(), language_identifier)
+        if not cur_preprocessor.preprocess_file():
+            raise Exception("The synthetic file " + input_path + " could not be preprocessed.")
+        timings["preprocess"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        eaf_parser = EAF_Parser(eaf)
+        eaf_parser.tokenize_all_tx_tiers()
+        timings["tokenize"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        glosser = SingleEafGlosser(input_path, capitalized_words, self.paralinguistic_items, eaf)
+        glosser.gloss_file(self.gram_dict, self.lexical_dict)
+        timings["gloss"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        glosser.save_file(output_path)
+        timings["save"] = time.perf_counter() - start
+
+        morphemes_num = sum(len(eaf_parser.tiers[mb_idx].annotations) for mb_idx in eaf_parser.get_mb_indexes())
+        return {"timings": timings, "morphemes": morphemes_num}
+
+
+def summarize_runs(runs_timings: list[dict]):
+    """
+    :return: {stage : {"median": seconds, "min": seconds}}, including the total of all the stages
+    """
+    summary = {}
+    for stage in STAGES + ("total",):
+        if stage == "total":
+            values = [sum(timings.values()) for timings in runs_timings]
+        else:
+            values = [timings[stage] for timings in runs_timings]
+        summary[stage] = {"median": round(statistics.median(values), 6), "min": round(min(values), 6)}
+    return summary
+
+
+def format_result(result: dict):
+    stages = ", ".join(stage + " " + "{:.3f}s".format(result["stages"][stage]["median"]) for stage in STAGES)
+    return "{} utterances, {} speakers ({} morphemes): total {:.3f}s ({})".format(
+        result["utterances"], result["speakers"], result["morphemes"], result["stages"]["total"]["median"], stages)
+
+
+def get_commit():
+    """
+    :return: the current git commit of the repository, or None if it is unknown
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results: dict, results_path: str):
+    """
+    Writes the results as JSON with sorted keys, so files of different runs differ only in their values.
+    """
+    with open(results_path, "w", encoding="utf-8") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
+
+
+def compare_results(baseline: dict, results: dict):
+    """
+    Compares the median times of each stage in the configurations that appear in both results.
+    :return: a list of lines of the form: "<utterances> utterances, <speakers> speakers, <stage>: <baseline time> ->
+             <time> (<ratio>x)". A ratio lower than 1 means that the stage became faster.
+    """
+    baseline_results = {(result["utterances"], result["speakers"]): result for result in baseline["results"]}
+    lines = []
+    for result in results["results"]:
+        baseline_result = baseline_results.get((result["utterances"], result["speakers"]))
+        if baseline_result is None:
+            continue
+        for stage in STAGES + ("total",):
+            old = baseline_result["stages"][stage]["median"]
+            new = result["stages"][stage]["median"]
+            ratio = "{:.2f}x".format(new / old) if old else "-"
+            lines.append("{} utterances, {} speakers, {}: {:.4f}s -> {:.4f}s ({})".format(
+                result["utterances"], result["speakers"], stage, old, new, ratio))
+    return lines
+
+
+def parse_input_args(args):
+    args_parser = argparse.ArgumentParser(description="Benchmark of the processing stages on synthetic ELAN files")
+    args_parser.add_argument("--utterances", type=int, nargs="+", default=list(DEFAULT_UTTERANCES),
+                             help="numbers of utterances per file (default: 1 10 100 1000 10000)")
+    args_parser.add_argument("--speakers", type=int, nargs="+", default=[1],
+                             help="numbers of speakers per file (default: 1)")
+    args_parser.add_argument("--repeat", type=int, default=3, help="runs of each file (default: 3)")
+    args_parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic files (default: 0)")
+    args_parser.add_argument("--no-english-detection", action="store_true",
+                             help="do not detect English parts automatically")
+    args_parser.add_argument("--output", default="benchmark_results.json",
+                             help="the JSON results file (default: benchmark_results.json)")
+    args_parser.add_argument("--compare", metavar="BASELINE_JSON",
+                             help="results of a previous run (e.g., of another commit) to compare with")
+    parsed_args = args_parser.parse_args(args)
+    if parsed_args.repeat < 1 or min(parsed_args.utterances) < 1 or min(parsed_args.speakers) < 1:
+        args_parser.error("--utterances, --speakers and --repeat must be positive integers")
+    return parsed_args
+
+
+def run_benchmark():
+    args = parse_input_args(sys.argv[1:])
+    benchmark = Benchmark(not args.no_english_detection, args.repeat, args.seed)
+    results = benchmark.run(args.utterances, args.speakers)
+    write_results(results, args.output)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        print("\n".join(compare_results(baseline, results)))
+
+
+if __name__ == '__main__':
+    run_benchmark()
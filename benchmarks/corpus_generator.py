@@ -0,0 +1,82 @@
+import random
+import string
+from eaf_template import EafTemplate
+
+
+class SyntheticCorpusGenerator:
+    """
+    Generates synthetic ELAN files with the tier template of the project's files (see EafTemplate), for benchmarking.
+    The tx annotations are made of the morphemes of the glossing dictionary (stems with suffixes attached, particles
+    and clitics) and of capitalized words, and the fte annotations are made of the glosses of the same morphemes, so
+    all the stages have realistic work to do.
+    Only the ref, tx and fte tiers have annotations, as in the files before processing.
+    The files are deterministic: the same seed, vocabulary and sizes always generate the same file.
+    """
+    SPEAKERS = string.ascii_uppercase + string.ascii_lowercase      # the speaker is the last char of the tier names
+    NONVERBAL_FTE_LINES = ("[backchannel]", "[laughter]", "[cough]")
+    UTTERANCE_DURATION = 10000              # milliseconds
+    MIN_WORDS = 2
+    MAX_WORDS = 12
+
+    def __init__(self, gram_glossing_dict: dict, lex_glossing_dict: dict, capitalized_words, seed: int = 0):
+        """
+        :param gram_glossing_dict: the grammatical dictionary, as returned by glossesDictionaryParser.parse_dicts
+        :param lex_glossing_dict: the lexical dictionary
+        :param capitalized_words: the capitalized words (e.g., the words of capitalized_words.txt)
+        """
+        self.seed = seed
+        self.stems = sorted(mb for mb in lex_glossing_dict if mb and mb[0] not in "-=")
+        self.suffixes = sorted(mb[1:] for mb in gram_glossing_dict if mb.startswith("-") and len(mb) > 1)
+        self.clitics = sorted(mb[1:] for mb in gram_glossing_dict if mb.startswith("=") and len(mb) > 1)
+        self.particles = sorted(mb for mb in gram_glossing_dict if mb and mb[0] not in "-=")
+        self.capitalized_words = sorted(word for word in capitalized_words if word)
+        self.glosses = {mb: [lemma.ge.replace("_", " ") for lemma in senses]
+                        for mb, senses in lex_glossing_dict.items()}
+        if not self.stems:
+            raise Exception("The lexical dictionary is empty, so there is no vocabulary for the synthetic files.")
+
+    def generate_file(self, output_path: str, utterances_num: int, speakers_num: int = 1):
+        """
+        Generates a file with utterances_num utterances, which are divided between speakers_num speakers.
+        :return: None
+        """
+        if not 1 <= speakers_num <= len(self.SPEAKERS):
+            raise Exception("The number of speakers must be between 1 and " + str(len(self.SPEAKERS)) + ".")
+        rnd = random.Random(str(self.seed) + ":" + str(utterances_num) + ":" + str(speakers_num))
+        speakers = self.SPEAKERS[:speakers_num]
+        document = EafTemplate(speakers, "urn:nl-mpi-tools-elan-eaf:synthetic-" + str(self.seed))
+        for i in range(utterances_num):
+            speaker = speakers[i % speakers_num]
+            tx_value, fte_value = self.generate_utterance(rnd)
+            document.add_utterance(speaker, i * self.UTTERANCE_DURATION, (i + 1) * self.UTTERANCE_DURATION,
+                                   "SYNTH_" + speaker + "." + str(i + 1).zfill(5), tx_value, fte_value)
+        with open(output_path, "wb") as output_file:
+            output_file.write(document.to_bytes())
+
+    def generate_utterance(self, rnd: random.Random):
+        """
+        :return: a tuple of the tx and fte values of a new utterance
+        """
+        if rnd.random() < 0.03:                                 # a backchannel or another nonverbal utterance
+            return rnd.choice(("hmm", "ah", "ahh")), rnd.choice(self.NONVERBAL_FTE_LINES)
+        words = []
+        translation = []
+        for _ in range(rnd.randint(self.MIN_WORDS, self.MAX_WORDS)):
+            kind = rnd.random()
+            if kind < 0.1 and self.capitalized_words:
+                word = rnd.choice(self.capitalized_words)
+                translation.append(word)
+            elif kind < 0.35 and self.particles:
+                word = rnd.choice(self.particles)
+            else:
+                stem = rnd.choice(self.stems)
+                word = stem
+                if self.suffixes and rnd.random() < 0.5:
+                    word += rnd.choice(self.suffixes)
+                if self.clitics and rnd.random() < 0.05:
+                    word += rnd.choice(self.clitics)
+                translation.append(rnd.choice(self.glosses[stem]))
+            words.append(word)
+        tx_value = " ".join(words)
+        fte_value = " ".join(translation)
+        return tx_value[:1].upper() + tx_value[1:] + ".", fte_value[:1].upper() + fte_value[1:] + "."
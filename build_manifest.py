@@ -0,0 +1,65 @@
+import json
+import os
+
+
+class BuildManifest:
+    """
+    Records, for each processed input file, the content hashes of the file and of the resources it was processed with,
+    the settings which affect the output and the capitalized words which the file consulted. In the next runs, files
+    whose input, resources, settings and consulted capitalized words are unchanged (and whose output file exists) are
+    up to date, and they don't need to be processed again.
+    """
+    VERSION = 2             # must be incremented whenever the processing changes in a way that affects the output files
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.files = {}     # {input file name : {"input": hash, "resources": {resource name : hash}, "settings": dict,
+                            #                     "capitalized words": {word : whether it was a capitalized word}}}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+        if isinstance(manifest, dict) and manifest.get("version") == self.VERSION:
+            self.files = manifest["files"]
+
+    def is_up_to_date(self, file_name: str, output_path: str, input_hash: str, resources_hashes: dict, settings: dict,
+                      capitalized_words: set):
+        """
+        :param capitalized_words: the current capitalized words. A file is stale only if one of the words it consulted
+                                  was added to them (or removed), and not whenever the capitalized words file changes.
+        """
+        entry = self.files.get(file_name)
+        return entry is not None and os.path.exists(output_path) and entry["input"] == input_hash \
+            and entry["resources"] == resources_hashes and entry["settings"] == settings \
+            and all((word in capitalized_words) == is_capitalized
+                    for word, is_capitalized in entry["capitalized words"].items())
+
+    def update(self, file_name: str, input_hash: str, resources_hashes: dict, settings: dict,
+               capitalized_lookups: dict):
+        """
+        :param capitalized_lookups: {word : whether it was a capitalized word}, for the words which were consulted when
+                                    the file was processed (see AnnotationCleaner.decapitalize_annotation)
+        """
+        self.files[file_name] = {"input": input_hash, "resources": resources_hashes, "settings": settings,
+                                 "capitalized words": capitalized_lookups}
+
+    def get_capitalized_lookups(self, file_name: str):
+        return self.files[file_name]["capitalized words"]
+
+    def retain(self, file_names):
+        """
+        Removes the entries of files which are no longer in the input directory.
+        """
+        file_names = set(file_names)
+        self.files = {file_name: entry for file_name, entry in self.files.items() if file_name in file_names}
+
+    def save(self):
+        manifest = {"version": self.VERSION, "files": self.files}
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)      # the manifest is replaced at once, so it is never read half-written
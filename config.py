@@ -0,0 +1,18 @@
+# The paths of the input and output files and the resources, shared by main, the benchmarks and the analyzer service
+GLOSSES_DICT_PATH = "input\\ISF_Khoekhoe_dictionary_for_glosses.xlsx"
+# GLOSSES_DICT_PATH = "input/ISF_Khoekhoe_dictionary_for_glosses.xlsx"        # for macOS
+INPUT_DIRECTORY_PATH = "input"
+OUTPUT_DIRECTORY_PATH = "output"
+CAPITALIZED_WORDS_LIST_PATH = "input\\capitalized_words.txt"
+# CAPITALIZED_WORDS_LIST_PATH = "input/capitalized_words.txt"                 # for macOS
+WORDS_NOT_TO_SEGMENT = "input\\words_not_to_segment.json"
+# WORDS_NOT_TO_SEGMENT = "input/words_not_to_segment.json"                    # for macOS
+PARALINGUISTIC_ITEMS_PATH = "input\\paralinguistic_items.json"
+# PARALINGUISTIC_ITEMS_PATH = "input/paralinguistic_items.json"               # for macOS
+GLOSSES_DICT_WORKSHEET_NAME = "KK_dict_for_glosses"
+GLOSSES_DICT_CACHE_PATH = "input\\ISF_Khoekhoe_dictionary_for_glosses.cache"
+# GLOSSES_DICT_CACHE_PATH = "input/ISF_Khoekhoe_dictionary_for_glosses.cache"   # for macOS
+SEGMENTATION_CACHE_PATH = "input\\segmentation.cache"
+# SEGMENTATION_CACHE_PATH = "input/segmentation.cache"                         # for macOS
+BUILD_MANIFEST_PATH = "build_manifest.json"                                     # next to the output directory
+MORPHEME_INDEX_PATH = "morpheme_index.cache"                                    # next to the output directory
@@ -1,21 +1,30 @@
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
 from speach.elan import *
 import re
+from tier_map import TierMap
 
 
 class EAF_Parser:
+    XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>\n'        # as written by ELAN
+    INDENT = "    "
+    SPEACH_VERSION = "0.1a15.post1"         # the speach version whose internals are used (see check_speach_internals)
 
     def __init__(self, eaf: Doc):
         self.eaf = eaf
-        self.xml = self.eaf.to_xml_str()
-        self.tree = ET.ElementTree(ET.fromstring(self.xml))
-        self.root = self.tree.getroot()
+        check_speach_internals(eaf)
+        self.root = self.eaf._Doc__xml_root     # the XML tree that speach has already parsed (instead of re-parsing to_xml_str())
+        self.tier_elements = {}                 # {tier_id : TIER Element}
+        self.tx_tier_elements = []              # the TIER Elements of the tx tiers, in the order of the document
+        self.max_ann_id = 0                     # the highest numeric value of an annotation id
+        self.index_xml_tree()
+        self.tier_map = TierMap.of(eaf)         # shared by all the parsers (and stages) of the same Doc
+        self.tiers = self.tier_map.tiers
         tiers_indexes = self.find_tiers_indexes()
         self.tx_indexes, self.fte_indexes, self.orig_indexes, self.ge_indexes, self.ps_indexes, self.mb_indexes = \
             tiers_indexes[0], tiers_indexes[1], tiers_indexes[2], tiers_indexes[3], tiers_indexes[4], tiers_indexes[5]
         self.cur_available_ann_id = None
         self.prev_mb_id = None
+        self.ref_id_indexes = {}                # {tier_id : {ref_id : annotation}}, see get_ref_id_index
 
     def tokenize_all_tx_tiers(self):
         """
@@ -23,23 +32,30 @@ class EAF_Parser:
         :return: None
         """
         self.cur_available_ann_id = 'a' + str(self.find_max_ann_id() + 1)
+        for tx_tier in self.tx_tier_elements:
+            self.tokenize_single_tx_tier(tx_tier)
+
+    def index_xml_tree(self):
+        """
+        Indexes the TIER Elements by their ids and finds the max annotation id, in a single pass over the XML tree.
+        Both are kept up to date with the annotations which are appended by this parser (see append_new_ann).
+        :return: None
+        """
         for elem in self.root.iter():
-            if elem.tag == "TIER" and elem.attrib["LINGUISTIC_TYPE_REF"] == "tx":
-                self.tokenize_single_tx_tier(elem)
+            if elem.tag == "TIER":
+                self.tier_elements[elem.attrib["TIER_ID"]] = elem
+                if elem.attrib["LINGUISTIC_TYPE_REF"] == "tx":
+                    self.tx_tier_elements.append(elem)
+            ann_id = elem.attrib.get('ANNOTATION_ID')
+            if ann_id is not None:
+                self.max_ann_id = max(self.max_ann_id, get_ann_id_number(ann_id))
 
     def find_max_ann_id(self):
         """
         Finds the annotation id with the highest numeric value.
         :return: integer of the max id
         """
-        max_id = 0
-        for elem in self.tree.iter():
-            if 'ANNOTATION_ID' in elem.attrib.keys():
-                cur_id = elem.attrib['ANNOTATION_ID']
-                cur_id = int(re.sub(r"\D", "", cur_id))  # removing all non-numeric chars and converting into int
-                if cur_id > max_id:
-                    max_id = cur_id
-        return max_id
+        return self.max_ann_id
 
     def increment_available_id(self):
         cur_id = int(self.cur_available_ann_id[1:])
@@ -47,7 +63,7 @@ class EAF_Parser:
 
     def tokenize_single_tx_tier(self, tx_tier: ET.Element):
         """
-        Performs the ELAN feature "Tier>Tokenize Tier..." on \tx tier, and writes the results in \mb, \ge and \ps.
+        Performs the ELAN feature "Tier>Tokenize Tier..." on \\tx tier, and writes the results in \\mb, \\ge and \\ps.
         :return: None
         """
         tier_elements = self.get_equivalent_tier_elements(tx_tier)
@@ -70,20 +86,9 @@ class EAF_Parser:
         :return: A tuple of mb, ge and ps tier Elements
         """
         tx_tier_id = tx_tier.attrib['TIER_ID']
-        mb_tier_id = "mb@" + tx_tier_id[-1]
-        ge_tier_id = "ge@" + tx_tier_id[-1]
-        ps_tier_id = "ps@" + tx_tier_id[-1]
-        mb_tier = None
-        ge_tier = None
-        ps_tier = None
-        for elem in self.root.iter():
-            if elem.tag == "TIER":
-                if elem.attrib["TIER_ID"] == mb_tier_id:
-                    mb_tier = elem
-                elif elem.attrib["TIER_ID"] == ge_tier_id:
-                    ge_tier = elem
-                elif elem.attrib["TIER_ID"] == ps_tier_id:
-                    ps_tier = elem
+        mb_tier = self.tier_elements.get("mb@" + tx_tier_id[-1])
+        ge_tier = self.tier_elements.get("ge@" + tx_tier_id[-1])
+        ps_tier = self.tier_elements.get("ps@" + tx_tier_id[-1])
         if mb_tier is None or ge_tier is None or ps_tier is None:
             raise Exception("One of the tiers is missing. Make sure that all files are in the correct form.")
 
@@ -98,27 +103,98 @@ class EAF_Parser:
             self.prev_mb_id = mb_id
             new_ge_ann = self.create_new_ann(mb_id, token)
             new_ps_ann = self.create_new_ann(mb_id, token)
-            mb_tier.append(new_mb_ann)
-            ge_tier.append(new_ge_ann)
-            ps_tier.append(new_ps_ann)
+            self.append_new_ann(mb_tier, new_mb_ann)      # mb must be registered first, because ge and ps refer to it
+            self.append_new_ann(ge_tier, new_ge_ann)
+            self.append_new_ann(ps_tier, new_ps_ann)
+
+    def copy_mb_to_ge_and_ps(self):
+        """
+        Copies the \\mb annotations of already tokenized tiers (which may have been corrected manually) to their
+        \\ge and \\ps annotations, as tokenize_single_tx_ann does. Missing \\ge and \\ps annotations (e.g., of \\mb
+        annotations which were added manually) are created, and the \\ge and \\ps annotations are ordered like the
+        \\mb annotations they refer to, so they are aligned by index (as SingleEafGlosser expects).
+        :return: None
+        """
+        self.cur_available_ann_id = 'a' + str(self.find_max_ann_id() + 1)
+        for ge_idx in self.ge_indexes:
+            mb_tier = self.tiers[self.get_mb_idx_according_to_ge(ge_idx)]
+            self.copy_mb_to_dependent_tier(mb_tier, ge_idx)
+            self.copy_mb_to_dependent_tier(mb_tier, self.tier_map.ge_to_ps[ge_idx])
+
+    def copy_mb_to_dependent_tier(self, mb_tier: Tier, tier_idx: int):
+        tier = self.tiers[tier_idx]
+        tier_element = self.tier_elements[tier.ID]
+        annotations_by_ref_id = self.get_ref_id_index(tier_idx)
+        for mb_annotation in mb_tier:
+            annotation = annotations_by_ref_id.get(mb_annotation.ID)
+            if annotation is None:
+                self.append_new_ann(tier_element, self.create_new_ann(mb_annotation.ID, mb_annotation.value))
+            else:
+                annotation.value = mb_annotation.value
+
+        mb_positions = {mb_annotation.ID: i for i, mb_annotation in enumerate(mb_tier)}
+        for annotation in tier:
+            if annotation.ref_id not in mb_positions:
+                raise Exception("The annotation " + annotation.ID + " in tier " + tier.ID +
+                                " refers to a missing annotation of tier " + mb_tier.ID + ".")
+        tier.annotations.sort(key=lambda ann: mb_positions[ann.ref_id])
+        tier_element[:] = sorted(tier_element, key=lambda elem: mb_positions[elem[0].attrib['ANNOTATION_REF']])
+
+    def append_new_ann(self, tier: ET.Element, new_ann: ET.Element):
+        """
+        Appends a new annotation to the tier Element and registers it in the Doc object,
+        so the Doc stays up to date in memory and there is no need to save and re-read the file.
+        :return: None
+        """
+        tier.append(new_ann)
+        self.max_ann_id = max(self.max_ann_id, get_ann_id_number(new_ann[0].attrib['ANNOTATION_ID']))
+        tier_obj = self.eaf[tier.attrib['TIER_ID']]
+        ann = tier_obj._add_annotation_xml(new_ann)
+        ann.resolve(self.eaf)
+        self.eaf._register_ann(ann)
+        self.add_to_ref_id_index(tier_obj, ann)
 
     def create_new_ann(self, ann_ref_id, value, prev_ann_id=None):
-        new_ann = ET.Element("ANNOTATION")
-        new_ref_ann = ET.Element("REF_ANNOTATION",
-                                 {"ANNOTATION_ID": self.cur_available_ann_id, "ANNOTATION_REF": ann_ref_id})
+        while self.eaf.annotation(self.cur_available_ann_id) is not None:     # added to the Doc not through this parser
+            self.increment_available_id()
+        new_ann = self.root.makeelement("ANNOTATION", {})
+        new_ref_ann = self.root.makeelement("REF_ANNOTATION",
+                                            {"ANNOTATION_ID": self.cur_available_ann_id, "ANNOTATION_REF": ann_ref_id})
         if prev_ann_id is not None:
             new_ref_ann.attrib["PREVIOUS_ANNOTATION"] = prev_ann_id
         self.increment_available_id()
-        new_value = ET.Element("ANNOTATION_VALUE")
+        new_value = self.root.makeelement("ANNOTATION_VALUE", {})
         new_value.text = value
         new_ref_ann.append(new_value)
         new_ann.append(new_ref_ann)
         return new_ann
 
+    def get_ref_id_index(self, tier_idx: int):
+        """
+        Indexes the annotations of a tier by their ref_id (i.e., the ID of the parent annotation).
+        The index is built only once for each tier, and it is kept up to date with the annotations which are added
+        by this parser (see add_to_ref_id_index).
+        :return: dict in the following format: {ref_id : annotation}. If several annotations refer to the same parent,
+                 the first one is kept.
+        """
+        tier = self.tiers[tier_idx]
+        index = self.ref_id_indexes.get(tier.ID)
+        if index is None:
+            index = {}
+            for annotation in tier:
+                index.setdefault(annotation.ref_id, annotation)
+            self.ref_id_indexes[tier.ID] = index
+        return index
+
+    def add_to_ref_id_index(self, tier: Tier, annotation):
+        index = self.ref_id_indexes.get(tier.ID)
+        if index is not None:                   # otherwise, the index is not built yet and will include annotation
+            index.setdefault(annotation.ref_id, annotation)
+
     def get_tx_fte_annotations_mapping(self):
         tx_to_fte = {}
         for fte_idx in self.fte_indexes:
-            cur_fte_tier = self.eaf.tiers()[fte_idx]
+            cur_fte_tier = self.tiers[fte_idx]
             for fte_annotation in cur_fte_tier:
                 tx_to_fte[fte_annotation.ref_id] = fte_annotation.ID
         return tx_to_fte
@@ -128,56 +204,21 @@ class EAF_Parser:
         Finds the mapping between the indexes of tx tiers to the corresponding indexes of orig tiers
         :return: dict in the following format: {tx_tier_idx : orig_tier_idx}
         """
-        tx_to_orig = {}
-        for orig_idx in self.orig_indexes:
-            for tx_idx in self.tx_indexes:
-                if self.eaf.tiers()[orig_idx].parent_ref == self.eaf.tiers()[tx_idx].name:
-                    tx_to_orig[tx_idx] = orig_idx
-                    break
-        return tx_to_orig
+        return self.tier_map.tx_to_orig
 
     def get_mb_idx_according_to_ge(self, ge_idx: int):
-        for mb_idx in self.mb_indexes:
-            if self.eaf.tiers()[mb_idx].name == self.eaf.tiers()[ge_idx].parent_ref:
-                return mb_idx
+        return self.tier_map.ge_to_mb.get(ge_idx)
 
     def get_ge_to_ps_tiers_mapping(self):
         """
         Finds the mapping between the indexes of ge tiers to the corresponding indexes of ps tiers
         :return: dict in the following format: {ge_tier_idx : ps_tier_idx}
         """
-        ge_to_ps = {}
-        for ge_idx in self.ge_indexes:
-            for ps_idx in self.ps_indexes:
-                # ge and ps have the same parent (which is mb tier)
-                if self.eaf.tiers()[ge_idx].parent_ref == self.eaf.tiers()[ps_idx].parent_ref:
-                    ge_to_ps[ge_idx] = ps_idx
-                    break
-        return ge_to_ps
+        return self.tier_map.ge_to_ps               # ge and ps have the same parent (which is mb tier)
 
     def find_tiers_indexes(self):
-        tx_indexes = []
-        fte_indexes = []
-        orig_indexes = []
-        ge_indexes = []
-        ps_indexes = []
-        mb_index = []
-
-        for i in range(len(self.eaf.tiers())):
-            cur_tier = self.eaf.tiers()[i]
-            if cur_tier.linguistic_type.ID == "tx":
-                tx_indexes.append(i)
-            elif "fte" in cur_tier.name:
-                fte_indexes.append(i)
-            elif cur_tier.linguistic_type.ID == "orig":
-                orig_indexes.append(i)
-            elif "ge" in cur_tier.name:
-                ge_indexes.append(i)
-            elif cur_tier.linguistic_type.ID == "ps":
-                ps_indexes.append(i)
-            elif cur_tier.linguistic_type.ID == "mb":
-                mb_index.append(i)
-        return tx_indexes, fte_indexes, orig_indexes, ge_indexes, ps_indexes, mb_index
+        return self.tier_map.tx_indexes, self.tier_map.fte_indexes, self.tier_map.orig_indexes, \
+            self.tier_map.ge_indexes, self.tier_map.ps_indexes, self.tier_map.mb_indexes
 
     def get_tx_indexes(self):
         return self.tx_indexes
@@ -197,9 +238,46 @@ class EAF_Parser:
     def get_orig_indexes(self):
         return self.orig_indexes
 
-    def save_file(self, output_path: str):
-        new_xml_str = (ET.tostring(self.root, method='xml')).decode('utf8')
-        doc = xml.dom.minidom.parseString(new_xml_str)
-        formatted_xml = doc.toprettyxml(indent="  ", newl='')
-        with open(output_path, 'w', encoding='utf8') as output_file:
-            output_file.write(formatted_xml)
+    def save_file(self, output_path: str, compact: bool = False):
+        """
+        Writes the XML tree to output_path. The tree is serialized directly into the file, without building the whole
+        XML string (or another DOM) in memory.
+        :param compact: if True, the indentation is skipped (the whitespace of the tree is written as it is)
+        :return: None
+        """
+        with open(output_path, 'wb') as output_file:
+            self.write_file(output_file, compact)
+
+    def write_file(self, output_file, compact: bool = False):
+        """
+        Writes the XML tree to a binary file object (e.g., an open file or io.BytesIO), as save_file does.
+        :return: None
+        """
+        if not compact:
+            ET.indent(self.root, space=self.INDENT)             # replaces the existing whitespace between the elements
+        output_file.write(self.XML_DECLARATION)
+        ET.ElementTree(self.root).write(output_file, encoding="UTF-8", xml_declaration=False)
+        output_file.write(b"\n")
+
+
+def check_speach_internals(eaf: Doc):
+    """
+    EAF_Parser works on speach's own XML tree and registers the new annotations in the Doc through speach's internal
+    API (Doc's private XML root, Tier._add_annotation_xml and Doc._register_ann), which is not part of speach's public
+    interface and may change in another version.
+    :return: None. Raises an Exception if the installed speach doesn't have these internals
+    """
+    missing = [name for obj, name in ((eaf, "_Doc__xml_root"), (Tier, "_add_annotation_xml"), (Doc, "_register_ann"))
+               if getattr(obj, name, None) is None]
+    if missing:
+        raise Exception("The installed speach version is not supported (missing: " + ", ".join(missing) + "). "
+                        "Install the supported version with: pip install speach==" + EAF_Parser.SPEACH_VERSION)
+
+
+def get_ann_id_number(ann_id: str):
+    """
+    :return: the numeric value of an annotation id (e.g., 12 for "a12"), ignoring all non-numeric chars
+    """
+    if ann_id[1:].isdecimal() and not ann_id[0].isdecimal():        # the common case, avoiding the regex
+        return int(ann_id[1:])
+    return int(re.sub(r"\D", "", ann_id))
@@ -0,0 +1,528 @@
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+from eaf_parser import EAF_Parser, get_ann_id_number
+from tier_map import TierMap
+
+ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}     # as escaped by ElementTree
+
+
+class TierHeader:
+    """
+    A TIER element of a streamed file without its annotations: its attributes and its place in the file.
+    It has the attributes of speach's Tier which TierMap uses (name, parent_ref and linguistic_type.ID).
+    """
+    __slots__ = ("ID", "parent_ref", "linguistic_type", "attributes", "start", "content_end", "end")
+
+    def __init__(self, attributes: dict, start: int):
+        self.ID = attributes["TIER_ID"]
+        self.parent_ref = attributes.get("PARENT_REF")
+        self.linguistic_type = LinguisticTypeHeader(attributes["LINGUISTIC_TYPE_REF"])
+        self.attributes = attributes
+        self.start = start          # the byte offset of the tier in the file
+        self.content_end = None     # the byte offset of the tier's end tag (None if the tier has no annotations)
+        self.end = None             # the byte offset of the next element (so the whitespace after the tier is included)
+
+    @property
+    def name(self):
+        return self.ID
+
+
+class LinguisticTypeHeader:
+    __slots__ = ("ID",)
+
+    def __init__(self, linguistic_type_id: str):
+        self.ID = linguistic_type_id
+
+
+class AnnotationRecord:
+    """
+    An annotation of a streamed file: the tag of its inner element (ALIGNABLE_ANNOTATION or REF_ANNOTATION), the
+    attributes of that element (ANNOTATION_ID, TIME_SLOT_REF1 and TIME_SLOT_REF2 or ANNOTATION_REF,
+    PREVIOUS_ANNOTATION etc.) and its value, which may be changed before the annotation is written.
+    """
+    __slots__ = ("tag", "attributes", "value")
+
+    def __init__(self, tag: str, attributes: dict, value: str):
+        self.tag = tag
+        self.attributes = attributes
+        self.value = value
+
+    @property
+    def ID(self):
+        return self.attributes["ANNOTATION_ID"]
+
+    @property
+    def ref_id(self):
+        """
+        :return: the id of the parent annotation, or None for time alignable annotations
+        """
+        return self.attributes.get("ANNOTATION_REF")
+
+    @classmethod
+    def from_element(cls, annotation_element: ET.Element):
+        """
+        :param annotation_element: an ANNOTATION Element
+        """
+        inner_element = annotation_element[0]
+        value_element = inner_element.find("ANNOTATION_VALUE")
+        value = value_element.text if value_element is not None and value_element.text is not None else ""
+        return cls(inner_element.tag, dict(inner_element.attrib), value)
+
+    def to_xml(self):
+        """
+        :return: the ANNOTATION element, as bytes serialized and indented like the annotations written by
+                 EAF_Parser.save_file (with ElementTree)
+        """
+        indent = "\n" + EAF_Parser.INDENT * 2
+        attributes = "".join(" " + name + '="' + escape(value, ATTRIBUTE_ENTITIES) + '"'
+                             for name, value in self.attributes.items())
+        value = "<ANNOTATION_VALUE>" + escape(self.value) + "</ANNOTATION_VALUE>" if self.value \
+            else "<ANNOTATION_VALUE />"
+        return (indent + "<ANNOTATION>" +
+                indent + EAF_Parser.INDENT + "<" + self.tag + attributes + ">" +
+                indent + EAF_Parser.INDENT * 2 + value +
+                indent + EAF_Parser.INDENT + "</" + self.tag + ">" +
+                indent + "</ANNOTATION>").encode("utf-8")
+
+
+class UtteranceRecord:
+    """
+    A single utterance of a speaker: its tx annotation, the fte and orig annotations of the tx annotation (or None),
+    and its mb annotations, with the ge and ps annotations of the mb annotations (in the order of the mb annotations).
+    """
+    __slots__ = ("speaker", "tx", "fte", "orig", "mb", "ge", "ps")
+
+    def __init__(self, speaker: str, tx: AnnotationRecord):
+        self.speaker = speaker
+        self.tx = tx
+        self.fte = None
+        self.orig = None
+        self.mb = []
+        self.ge = []
+        self.ps = []
+
+    def get_annotations(self):
+        """
+        :return: a list of (tier type, AnnotationRecord) pairs of all the annotations of the utterance
+        """
+        annotations = [("tx", self.tx)]
+        for tier_type, annotation in (("fte", self.fte), ("orig", self.orig)):
+            if annotation is not None:
+                annotations.append((tier_type, annotation))
+        for tier_type, tier_annotations in (("mb", self.mb), ("ge", self.ge), ("ps", self.ps)):
+            annotations.extend((tier_type, annotation) for annotation in tier_annotations)
+        return annotations
+
+
+class EafStreamReader:
+    """
+    Reads an eaf file as a stream of utterance records (see UtteranceRecord), speaker by speaker, without parsing the
+    whole document into memory like elan.read_eaf does.
+    """
+
+    def __init__(self, eaf_path: str):
+        self.path = eaf_path
+        self.tiers = []                 # TierHeader of all the tiers, in the order of the file
+        self.header_end = None          # the byte offset of the first element after HEADER
+        self.depth = 0
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        with open(eaf_path, "rb") as eaf_file:
+            self.parser.ParseFile(eaf_file)
+        self.parser = None
+        self.tier_map = TierMap(self.tiers)
+
+    def start_element(self, tag: str, attributes: dict):
+        self.depth += 1
+        if self.depth != 2:                         # only the children of ANNOTATION_DOCUMENT
+            return
+        offset = self.parser.CurrentByteIndex
+        if self.tiers and self.tiers[-1].end is None:
+            self.tiers[-1].end = offset
+        if tag == "TIER":
+            self.tiers.append(TierHeader(attributes, offset))
+        elif tag != "HEADER" and self.header_end is None:
+            self.header_end = offset
+
+    def end_element(self, tag: str):
+        self.depth -= 1
+        if self.depth == 1 and tag == "TIER":
+            self.tiers[-1].content_end = self.parser.CurrentByteIndex
+        elif self.depth == 0 and self.tiers and self.tiers[-1].end is None:     # the end of ANNOTATION_DOCUMENT
+            self.tiers[-1].end = self.parser.CurrentByteIndex
+
+    def __iter__(self):
+        for speaker, speaker_tiers in self.tier_map.speakers.items():
+            yield from self.read_speaker(speaker, speaker_tiers)
+
+    def read_speaker(self, speaker: str, speaker_tiers: dict):
+        """
+        :param speaker_tiers: {tier type : tier index}, see TierMap.map_speakers
+        :return: a generator of the UtteranceRecord of the speaker, in the order of the tx tier
+        """
+        cursors = self.open_cursors(speaker_tiers)
+        try:
+            for tx_annotation in cursors["tx"].read_all():
+                record = UtteranceRecord(speaker, tx_annotation)
+                for tier_type in ("fte", "orig"):
+                    if tier_type in cursors:
+                        annotations = cursors[tier_type].take(tx_annotation.ID)
+                        setattr(record, tier_type, annotations[0] if annotations else None)
+                if "mb" in cursors:
+                    record.mb = cursors["mb"].take(tx_annotation.ID)
+                for tier_type in ("ge", "ps"):
+                    if tier_type in cursors:
+                        for mb_annotation in record.mb:
+                            getattr(record, tier_type).extend(cursors[tier_type].take(mb_annotation.ID))
+                yield record
+            for cursor in cursors.values():
+                if not cursor.is_exhausted():
+                    raise Exception("Tier " + cursor.tier.ID + " in " + self.path + " has annotations which could "
+                                    "not be joined with their parent annotations, so the file cannot be streamed.")
+        finally:
+            for cursor in cursors.values():
+                cursor.close()
+
+    def open_cursors(self, speaker_tiers: dict):
+        """
+        :return: {tier type : TierCursor} of the speaker's tiers
+        """
+        cursors = {}
+        if "tx" not in speaker_tiers:
+            return cursors
+        tx_tier = self.tiers[speaker_tiers["tx"]]
+        runs = {"tx": self.find_runs(tx_tier, None)}          # {tier type : runs of the tier}
+        orders = {}             # {"tx" or "mb" : the order of their annotations}, built only if needed (see get_order)
+        for tier_type, parent_type in (("fte", "tx"), ("orig", "tx"), ("mb", "tx"), ("ge", "mb"), ("ps", "mb")):
+            if tier_type not in speaker_tiers:
+                continue
+            tier = self.tiers[speaker_tiers[tier_type]]
+            tier_runs = None
+            if len(runs[parent_type]) <= 1:         # the parent annotations are read in the order of their tier
+                tier_runs = self.find_single_run(tier, self.tiers[speaker_tiers[parent_type]])
+            if tier_runs is None:
+                tier_runs = self.find_runs(tier, self.get_order(parent_type, speaker_tiers, orders))
+            runs[tier_type] = tier_runs
+        for tier_type, tier_runs in runs.items():
+            cursors[tier_type] = TierCursor(self.path, self.tiers[speaker_tiers[tier_type]], tier_runs)
+        return cursors
+
+    def find_single_run(self, tier: TierHeader, parent_tier: TierHeader):
+        """
+        Checks whether the annotations of a tier are in the order of their parent annotations (the common case), by
+        scanning the parent tier in lockstep with the tier, so the parent annotations are not indexed.
+        :param parent_tier: a tier whose annotations are read in the order of the tier (i.e., a single run)
+        :return: the runs of the tier (a single run, or none if the tier is empty), or None if the tier is not in
+                 the order of its parent annotations
+        """
+        parent_ids = (attributes["ANNOTATION_ID"] for _, attributes in TierScanner(self.path, parent_tier).scan())
+        try:
+            start = None
+            parent_id = None
+            for offset, attributes in TierScanner(self.path, tier).scan():
+                if start is None:
+                    start = offset
+                ref_id = attributes.get("ANNOTATION_REF")
+                if ref_id is None:
+                    return None
+                while parent_id != ref_id:
+                    parent_id = next(parent_ids, None)
+                    if parent_id is None:
+                        return None
+            return [(start, tier.content_end)] if start is not None else []
+        finally:
+            parent_ids.close()
+
+    def get_order(self, tier_type: str, speaker_tiers: dict, orders: dict):
+        """
+        Indexes the annotations of the speaker's tx or mb tier by their place in the order of the records. It is needed
+        only for the tiers which are not in the order of their parent annotations.
+        :param orders: {tier type : {id of an annotation : its place in the order of the records}} of the tiers which
+                       were already indexed
+        """
+        if tier_type not in orders:
+            parent_order = self.get_order("tx", speaker_tiers, orders) if tier_type == "mb" else None
+            orders[tier_type] = {}
+            self.find_runs(self.tiers[speaker_tiers[tier_type]], parent_order, orders[tier_type])
+        return orders[tier_type]
+
+    def find_runs(self, tier: TierHeader, parent_order, order=None):
+        """
+        Splits the annotations of a tier into runs, such that the annotations of each run are in the order in which
+        their parent annotations are read (see read_speaker).
+        :param parent_order: {id of a parent annotation : its place in the order of the records}, or None for the
+                             tx tier (which is a single run)
+        :param order: a dict which is filled with {id of an annotation : its place in the order of the records}, for
+                      the tiers which are parents of other tiers, or None
+        :return: a list of (start offset, end offset) pairs of the runs
+        """
+        runs_starts = []
+        last_place = None
+        for offset, attributes in TierScanner(self.path, tier).scan():
+            if parent_order is None:
+                place = ()
+            else:
+                place = parent_order.get(attributes.get("ANNOTATION_REF"))
+                if place is None:
+                    raise Exception("Annotation " + attributes["ANNOTATION_ID"] + " of tier " + tier.ID + " in " +
+                                    self.path + " has no parent annotation, so the file cannot be streamed.")
+            if last_place is None or place < last_place:
+                runs_starts.append(offset)
+            last_place = place
+            if order is not None:       # the records take the annotations of each parent from the runs by their order
+                order[attributes["ANNOTATION_ID"]] = place + (len(runs_starts), len(order))
+        return [(start, runs_starts[i + 1] if i + 1 < len(runs_starts) else tier.content_end)
+                for i, start in enumerate(runs_starts)]
+
+
+class TierScanner:
+    """
+    Scans the annotations of a single tier of an eaf file, parsing only the bytes of the tier with expat.
+    """
+    PREFIX = b"<TIER_STREAM>"           # the tier is parsed as a part of a dummy document
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, eaf_path: str, tier: TierHeader):
+        self.path = eaf_path
+        self.tier = tier
+        self.depth = 0
+        self.annotation_offset = None
+        self.found = []                 # (offset, attributes) of the annotations which were found in the last chunk
+        self.parser = None
+
+    def scan(self):
+        """
+        :return: a generator of (offset of the ANNOTATION element, attributes of its inner element) pairs
+        """
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.parser.Parse(self.PREFIX, False)
+        with open(self.path, "rb") as eaf_file:
+            eaf_file.seek(self.tier.start)
+            remaining = self.tier.end - self.tier.start
+            while remaining > 0:
+                chunk = eaf_file.read(min(self.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                self.parser.Parse(chunk, False)
+                yield from self.found
+                self.found = []
+
+    def start_element(self, tag: str, attributes: dict):
+        self.depth += 1
+        if self.depth == 3:                         # TIER_STREAM > TIER > ANNOTATION
+            self.annotation_offset = self.tier.start + self.parser.CurrentByteIndex - len(self.PREFIX)
+        elif self.depth == 4:                       # the ALIGNABLE_ANNOTATION or REF_ANNOTATION element
+            self.found.append((self.annotation_offset, attributes))
+
+    def end_element(self, tag: str):
+        self.depth -= 1
+
+
+class TierCursor:
+    """
+    Parses the annotations of a single tier of an eaf file, reading only the bytes of the tier, and hands them out by
+    their parent annotations (see take). Each run of the tier (see EafStreamReader.find_runs) is read separately,
+    so only the next annotation of each run has to be kept until it is taken.
+    """
+
+    def __init__(self, eaf_path: str, tier: TierHeader, runs):
+        self.tier = tier
+        self.runs = [RunReader(eaf_path, start, end) for start, end in runs]
+
+    def read_all(self):
+        """
+        :return: a generator of all the annotations of the tier, in their order in the tier
+        """
+        for run in self.runs:
+            yield from run.annotations
+
+    def take(self, ref_id: str):
+        """
+        :return: a list of the annotations whose parent is ref_id, in their order in the tier
+        """
+        annotations = []
+        for run in self.runs:
+            annotations.extend(run.take(ref_id))
+        return annotations
+
+    def is_exhausted(self):
+        """
+        :return: True if all the annotations of the tier were taken
+        """
+        return all(run.is_exhausted() for run in self.runs)
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+
+
+class RunReader:
+    """
+    Parses a run of annotations of a tier, whose annotations are in the order of their parent annotations.
+    """
+
+    def __init__(self, eaf_path: str, start: int, end: int):
+        self.annotations = self.read_annotations(eaf_path, start, end)     # a generator of the AnnotationRecords
+        self.next_annotation = None                     # an annotation which was read, but not taken yet
+
+    @staticmethod
+    def read_annotations(eaf_path: str, start: int, end: int):
+        parser = ET.XMLPullParser(events=("start", "end"))
+        parser.feed(TierScanner.PREFIX)                 # the annotations of the run are its children
+        root = None
+        with open(eaf_path, "rb") as eaf_file:          # opened only when the first annotation is read
+            eaf_file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = eaf_file.read(min(TierScanner.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if root is None:
+                        root = element
+                    elif event == "end" and element.tag == "ANNOTATION":
+                        yield AnnotationRecord.from_element(element)
+                        root.remove(element)            # the annotations which were read are not kept
+
+    def take(self, ref_id: str):
+        """
+        :return: a list of the annotations whose parent is ref_id. Since the run is in the order of the parent
+                 annotations, the reading stops at the first annotation of another parent.
+        """
+        annotations = []
+        if self.next_annotation is None:
+            self.next_annotation = next(self.annotations, None)
+        while self.next_annotation is not None and self.next_annotation.ref_id == ref_id:
+            annotations.append(self.next_annotation)
+            self.next_annotation = next(self.annotations, None)
+        return annotations
+
+    def is_exhausted(self):
+        if self.next_annotation is None:
+            self.next_annotation = next(self.annotations, None)
+        return self.next_annotation is None
+
+    def close(self):
+        self.annotations.close()
+
+
+class EafStreamWriter:
+    """
+    Writes the utterance records of an EafStreamReader (after they were changed) to a new eaf file.
+    The annotations of each tier of the records are spooled to a temporary file (in memory while it is small), since
+    the annotations of a tier are contiguous in the file, while each record contains annotations of several tiers.
+    The rest of the input file (the header, the time slots, the other tiers, the linguistic types etc.) is copied as
+    it is. Every record of the reader should be written, in the order it was read, and then close must be called.
+    """
+    SPOOL_MAX_MEMORY = 1 << 20
+    LAST_USED_ANN_ID_PATTERN = re.compile(rb'(<PROPERTY NAME="lastUsedAnnotationId">)(\d+)(</PROPERTY>)')
+
+    def __init__(self, output_path: str, reader: EafStreamReader):
+        self.output_path = output_path
+        self.reader = reader
+        self.spools = {}            # {tier index : the spooled annotations of the tier}
+        for speaker_tiers in reader.tier_map.speakers.values():
+            for tier_idx in speaker_tiers.values():
+                self.spools[tier_idx] = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY)
+        self.max_ann_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def write(self, record: UtteranceRecord):
+        speaker_tiers = self.reader.tier_map.speakers[record.speaker]
+        for tier_type, annotation in record.get_annotations():
+            if tier_type not in speaker_tiers:
+                raise Exception("Speaker " + record.speaker + " has no " + tier_type + " tier in " + self.reader.path)
+            self.spools[speaker_tiers[tier_type]].write(annotation.to_xml())
+            self.max_ann_id = max(self.max_ann_id, get_ann_id_number(annotation.ID))
+
+    def close(self):
+        """
+        Writes the output file (atomically, so the output path may be the input path) and discards the spools.
+        :return: None
+        """
+        temp_path = self.output_path + ".tmp"
+        with open(self.reader.path, "rb") as input_file, open(temp_path, "wb") as output_file:
+            position = 0
+            for tier_idx, tier in enumerate(self.reader.tiers):
+                if tier_idx not in self.spools:
+                    continue                                    # copied as it is, with the rest of the file
+                if position == 0:
+                    output_file.write(self.update_header(read_bytes(input_file, 0, tier.start)))
+                else:
+                    copy_bytes(input_file, output_file, position, tier.start)
+                self.write_tier(input_file, output_file, tier, self.spools[tier_idx])
+                position = tier.end
+            input_file.seek(0, os.SEEK_END)
+            copy_bytes(input_file, output_file, position, input_file.tell())
+        os.replace(temp_path, self.output_path)
+        self.discard()
+
+    def discard(self):
+        for spool in self.spools.values():
+            spool.close()
+        self.spools = {}
+
+    def update_header(self, header: bytes):
+        """
+        :return: the bytes before the first rewritten tier, with a lastUsedAnnotationId that covers the new annotations
+        """
+        header_end = self.reader.header_end if self.reader.header_end is not None else len(header)
+        last_used = self.LAST_USED_ANN_ID_PATTERN.search(header, 0, header_end)
+        if last_used is None or int(last_used.group(2)) >= self.max_ann_id:
+            return header
+        return header[:last_used.start(2)] + str(self.max_ann_id).encode() + header[last_used.end(2):]
+
+    def write_tier(self, input_file, output_file, tier: TierHeader, spool):
+        """
+        Writes the TIER element with the spooled annotations, followed by the whitespace which followed it in the
+        input file.
+        """
+        tier_bytes_tail = read_bytes(input_file, max(tier.start, tier.end - 256), tier.end)
+        whitespace_after = tier_bytes_tail[tier_bytes_tail.rfind(b">") + 1:]
+        start_tag = "<TIER" + "".join(" " + name + '="' + escape(value, ATTRIBUTE_ENTITIES) + '"'
+                                      for name, value in tier.attributes.items())
+        spool.seek(0)
+        chunk = spool.read(TierScanner.CHUNK_SIZE)
+        if not chunk:
+            output_file.write((start_tag + " />").encode("utf-8") + whitespace_after)
+            return
+        output_file.write((start_tag + ">").encode("utf-8"))
+        while chunk:
+            output_file.write(chunk)
+            chunk = spool.read(TierScanner.CHUNK_SIZE)
+        output_file.write(("\n" + EAF_Parser.INDENT + "</TIER>").encode("utf-8") + whitespace_after)
+
+
+def read_bytes(input_file, start: int, end: int):
+    input_file.seek(start)
+    return input_file.read(end - start)
+
+
+def copy_bytes(input_file, output_file, start: int, end: int):
+    input_file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = input_file.read(min(TierScanner.CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        output_file.write(chunk)
+        remaining -= len(chunk)
@@ -0,0 +1,117 @@
+import xml.etree.ElementTree as ET
+from eaf_parser import EAF_Parser
+
+# The tiers of each speaker in the project's files: (tier type, linguistic type, parent tier type)
+TIER_TEMPLATE = (("ref", "ref", None),
+                 ("tx", "tx", "ref"),
+                 ("fte", "translation", "tx"),
+                 ("mb", "mb", "tx"),
+                 ("ge", "ge", "mb"),
+                 ("ps", "ps", "mb"),
+                 ("lxid", "lxid", "mb"),
+                 ("so", "so", "mb"),
+                 ("nt", "nt", "ref"),
+                 ("orig", "orig", "tx"))
+LINGUISTIC_TYPES = (("ref", None, "true"),                      # (linguistic type, constraint, time alignable)
+                    ("tx", "Included_In", "true"),
+                    ("translation", "Symbolic_Association", "false"),
+                    ("mb", "Symbolic_Subdivision", "false"),
+                    ("ge", "Symbolic_Association", "false"),
+                    ("ps", "Symbolic_Association", "false"),
+                    ("lxid", "Symbolic_Association", "false"),
+                    ("so", "Symbolic_Association", "false"),
+                    ("nt", "Symbolic_Association", "false"),
+                    ("orig", "Symbolic_Association", "false"))
+CONSTRAINTS = (("Symbolic_Subdivision", "Symbolic subdivision of a parent annotation. "
+                                        "Annotations refering to the same parent are ordered"),
+               ("Symbolic_Association", "1-1 association with a parent annotation"),
+               ("Included_In", "Time alignable annotations within the parent annotation's time interval, "
+                               "gaps are allowed"))
+
+
+class EafTemplate:
+    """
+    Builds a new eaf document with the project's tier template (ref, tx, fte, mb, ge, ps, lxid, so, nt and orig tiers
+    for each speaker), and adds utterances to it: a ref annotation and a tx annotation with their time slots, and an
+    fte annotation. The other tiers are left empty, as in the files before processing.
+    It is used for synthetic files (see SyntheticCorpusGenerator) and for analyzing raw utterances (see
+    AnalyzerService).
+    """
+
+    def __init__(self, speakers, urn: str):
+        """
+        :param speakers: the speakers' codes (the last char of the tier names, e.g., "A")
+        :param urn: the URN property of the header
+        """
+        self.root = ET.Element("ANNOTATION_DOCUMENT", {"AUTHOR": "", "DATE": "2000-01-01T00:00:00+00:00",
+                                                       "FORMAT": "3.0", "VERSION": "3.0",
+                                                       "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+                                                       "xsi:noNamespaceSchemaLocation":
+                                                           "http://www.mpi.nl/tools/elan/EAFv3.0.xsd"})
+        self.header = ET.SubElement(self.root, "HEADER", {"MEDIA_FILE": "", "TIME_UNITS": "milliseconds"})
+        self.header.append(make_property("URN", urn))
+        self.time_order = ET.SubElement(self.root, "TIME_ORDER")
+        self.tiers = {}                 # {tier id : TIER Element}
+        for speaker in speakers:
+            for tier_type, linguistic_type, parent_type in TIER_TEMPLATE:
+                attributes = {"DEFAULT_LOCALE": "en", "LINGUISTIC_TYPE_REF": linguistic_type,
+                              "PARTICIPANT": speaker, "TIER_ID": tier_type + "@" + speaker}
+                if parent_type is not None:
+                    attributes["PARENT_REF"] = parent_type + "@" + speaker
+                self.tiers[attributes["TIER_ID"]] = ET.SubElement(self.root, "TIER", attributes)
+        self.add_footer()
+        self.last_ann_id = 0
+
+    def add_footer(self):
+        for linguistic_type, constraint, time_alignable in LINGUISTIC_TYPES:
+            attributes = {"GRAPHIC_REFERENCES": "false", "LINGUISTIC_TYPE_ID": linguistic_type,
+                          "TIME_ALIGNABLE": time_alignable}
+            if constraint is not None:
+                attributes["CONSTRAINTS"] = constraint
+            ET.SubElement(self.root, "LINGUISTIC_TYPE", attributes)
+        ET.SubElement(self.root, "LOCALE", {"COUNTRY_CODE": "US", "LANGUAGE_CODE": "en"})
+        for stereotype, description in CONSTRAINTS:
+            ET.SubElement(self.root, "CONSTRAINT", {"DESCRIPTION": description, "STEREOTYPE": stereotype})
+
+    def add_utterance(self, speaker: str, start: int, end: int, ref_value: str, tx_value: str, fte_value: str):
+        """
+        Adds an utterance of the speaker between start and end (in milliseconds).
+        :return: the id of the new tx annotation
+        """
+        slots = []
+        for time_value in (start, start, end, end):             # ref and tx have separate time slots
+            slots.append("ts" + str(len(self.time_order) + 1))
+            ET.SubElement(self.time_order, "TIME_SLOT", {"TIME_SLOT_ID": slots[-1], "TIME_VALUE": str(time_value)})
+        ref_id, tx_id, fte_id = ("a" + str(self.last_ann_id + i) for i in (1, 2, 3))
+        self.last_ann_id += 3
+        add_alignable_annotation(self.tiers["ref@" + speaker], ref_id, slots[0], slots[2], ref_value)
+        add_alignable_annotation(self.tiers["tx@" + speaker], tx_id, slots[1], slots[3], tx_value)
+        add_ref_annotation(self.tiers["fte@" + speaker], fte_id, tx_id, fte_value)
+        return tx_id
+
+    def to_bytes(self):
+        """
+        :return: the document, indented like the files written by EAF_Parser.save_file. It can be written only once,
+                 since the lastUsedAnnotationId property is added to the header.
+        """
+        self.header.append(make_property("lastUsedAnnotationId", str(self.last_ann_id)))
+        ET.indent(self.root, space=EAF_Parser.INDENT)
+        return EAF_Parser.XML_DECLARATION + ET.tostring(self.root, encoding="UTF-8", xml_declaration=False) + b"\n"
+
+
+def make_property(name: str, value: str):
+    prop = ET.Element("PROPERTY", {"NAME": name})
+    prop.text = value
+    return prop
+
+
+def add_alignable_annotation(tier: ET.Element, ann_id: str, time_slot1: str, time_slot2: str, value: str):
+    annotation = ET.SubElement(ET.SubElement(tier, "ANNOTATION"), "ALIGNABLE_ANNOTATION",
+                               {"ANNOTATION_ID": ann_id, "TIME_SLOT_REF1": time_slot1, "TIME_SLOT_REF2": time_slot2})
+    ET.SubElement(annotation, "ANNOTATION_VALUE").text = value
+
+
+def add_ref_annotation(tier: ET.Element, ann_id: str, ref_id: str, value: str):
+    annotation = ET.SubElement(ET.SubElement(tier, "ANNOTATION"), "REF_ANNOTATION",
+                               {"ANNOTATION_ID": ann_id, "ANNOTATION_REF": ref_id})
+    ET.SubElement(annotation, "ANNOTATION_VALUE").text = value
@@ -1,44 +1,131 @@
+import hashlib
+import os
 import re
 from pprint import pprint
 
 from lemma import Lemma
+from input_files_handler import InputFilesHandler
 from openpyxl.worksheet.worksheet import Worksheet
 
 
 class glossesDictionaryParser:
+    CACHE_VERSION = 5           # must be incremented whenever the parsing or the Lemma class changes
 
     def __init__(self):
         self.adverbs = set()
+        self.dicts_fingerprint = None       # a hash of the parsed entries, see parse_dict_rows
+
+    def parse_dicts_from_file(self, excel_path: str, worksheet_name: str, cache_path: str = None):
+        """
+        Parses the glossing dictionary workbook. If cache_path is given, the parsed dicts are saved to a cache file,
+        and they are loaded from it in the next runs as long as the workbook has not changed.
+        :return: Two dicts (grammatical and lexical), as returned by parse_dicts
+        """
+        if cache_path is not None:
+            cached_dicts = self.read_cache(cache_path, excel_path, worksheet_name)
+            if cached_dicts is not None:
+                return cached_dicts
+        rows = InputFilesHandler.read_excel_worksheet_rows(excel_path, worksheet_name)
+        gram_dict, lex_dict = self.parse_dict_rows(rows)
+        if cache_path is not None:
+            self.write_cache(cache_path, excel_path, worksheet_name, gram_dict, lex_dict)
+        return gram_dict, lex_dict
+
+    def read_cache(self, cache_path: str, excel_path: str, worksheet_name: str):
+        """
+        Loads the parsed dicts from the cache file, if it is valid for the current workbook.
+        The workbook's size and modification time are checked first, and its content hash only if they differ.
+        :return: (gram_dict, lex_dict) or None if there is no valid cache
+        """
+        cache = InputFilesHandler.read_pickle(cache_path)
+        if not isinstance(cache, dict) or cache.get("version") != self.CACHE_VERSION \
+                or cache.get("worksheet_name") != worksheet_name:
+            return None
+        workbook_stat = os.stat(excel_path)
+        if (cache["size"], cache["mtime"]) != (workbook_stat.st_size, workbook_stat.st_mtime_ns):
+            if cache["sha256"] != InputFilesHandler.get_file_hash(excel_path):
+                return None
+            # same content with a new modification time (e.g., downloaded again) -> refresh the cache key
+            self.write_cache(cache_path, excel_path, worksheet_name, cache["gram_dict"], cache["lex_dict"],
+                             cache["adverbs"], cache["dicts_fingerprint"])
+        self.adverbs = cache["adverbs"]
+        self.dicts_fingerprint = cache["dicts_fingerprint"]
+        return cache["gram_dict"], cache["lex_dict"]
+
+    def write_cache(self, cache_path: str, excel_path: str, worksheet_name: str, gram_dict: dict, lex_dict: dict,
+                    adverbs: set = None, dicts_fingerprint: str = None):
+        workbook_stat = os.stat(excel_path)
+        cache = {"version": self.CACHE_VERSION,
+                 "worksheet_name": worksheet_name,
+                 "size": workbook_stat.st_size,
+                 "mtime": workbook_stat.st_mtime_ns,
+                 "sha256": InputFilesHandler.get_file_hash(excel_path),
+                 "gram_dict": gram_dict,
+                 "lex_dict": lex_dict,
+                 "adverbs": adverbs if adverbs is not None else self.adverbs,
+                 "dicts_fingerprint": dicts_fingerprint if dicts_fingerprint is not None else self.dicts_fingerprint}
+        InputFilesHandler.write_pickle(cache, cache_path)
 
     def parse_dicts(self, table: Worksheet):
         """
-        :return: Two dicts (grammatical and lexical) of the form: {mb : [lemma1, lemma2, ...]}
+        :return: Two dicts (grammatical and lexical) of the form: {mb : (lemma1, lemma2, ...)}
         Each key is linked to a list of possible pairs (tuples) for glossing.
         """
-        headers_to_idx_map = self.map_headers_to_indexes(table)
+        return self.parse_dict_rows(table.iter_rows(values_only=True))
+
+    def parse_dict_rows(self, rows):
+        """
+        Parses the glossing dictionary in one pass over its rows.
+        All the invalid lines are collected, and then reported together in a single exception.
+        A hash of the parsed entries is kept in self.dicts_fingerprint. Unlike the hash of the workbook file,
+        it changes only when the content of the dictionary changes.
+        :param rows: an iterable of the rows' values (tuples), starting with the headers row
+        :return: Two dicts (grammatical and lexical), as returned by parse_dicts
+        """
+        rows = iter(rows)
+        headers_to_idx_map = self.map_headers_to_indexes(next(rows, ()))
+        ignore_idx = headers_to_idx_map['Ignore?']
+        mb_idx = headers_to_idx_map['mb']
+        ge_idx = headers_to_idx_map['ge']
+        ps_idx = headers_to_idx_map['ps']
+        gender_idx = headers_to_idx_map['Gender']
+        so_idx = headers_to_idx_map['Source']
+        other_trans_idx = headers_to_idx_map['Other Translations']
+        common_misspellings_idx = headers_to_idx_map['Common Misspellings']
+        lemma_type_idx = headers_to_idx_map['Gram/Lex']
+        row_len = max(headers_to_idx_map.values()) + 1
         gram_dict = {}
         lex_dict = {}
-        for i in range(2, table.max_row + 1):
-            if table.cell(i, headers_to_idx_map['Ignore?']).value != "yes":
-                mb = table.cell(i, headers_to_idx_map['mb']).value
-                ge = str(table.cell(i, headers_to_idx_map['ge']).value)
-                ps = str(table.cell(i, headers_to_idx_map['ps']).value)
-                gender = table.cell(i, headers_to_idx_map['Gender']).value
-                so = table.cell(i, headers_to_idx_map['Source']).value
-                other_trans = table.cell(i, headers_to_idx_map['Other Translations']).value
-                other_trans_lst = self.parse_other_trans_field(other_trans)
-                common_misspellings = str(table.cell(i, headers_to_idx_map['Common Misspellings']).value)
-                lemma_type = table.cell(i, headers_to_idx_map['Gram/Lex']).value
+        invalid_lines = []
+        entries_hash = hashlib.sha256()
+        for i, row in enumerate(rows, start=2):
+            if len(row) < row_len:                  # in read-only mode, trailing empty cells may be missing
+                row = row + (None,) * (row_len - len(row))
+            if row[ignore_idx] != "yes":
+                mb = row[mb_idx]
+                ge = str(row[ge_idx])
+                ps = str(row[ps_idx])
+                gender = row[gender_idx]
+                so = row[so_idx]
+                other_trans = row[other_trans_idx]
+                common_misspellings = row[common_misspellings_idx]
+                if common_misspellings is not None:
+                    common_misspellings = str(common_misspellings)
+                lemma_type = row[lemma_type_idx]
                 if not mb and ge == "None":  # if it's an empty line -> ignore it
                     continue
                 elif not mb or ge == "None" or ps == "None" or not lemma_type or lemma_type not in {"L", "G"} \
                         or (gender is not None and gender not in {"m", "f", "c"}) \
                         or (so is not None and so not in {"Afrikaans", "English"}):
-                    raise Exception("Line " + str(i) + " in the glossing dictionary is invalid.")
+                    invalid_lines.append(i)
+                    continue
 
                 if ps == "adv":
                     self.adverbs.add(mb)
 
+                other_trans_lst = self.parse_other_trans_field(other_trans)
+                entries_hash.update(repr((mb, ge, ps, common_misspellings, gender, so, other_trans_lst,
+                                          lemma_type)).encode("utf-8"))
                 cur_lemma = Lemma(mb, ge, ps, common_misspellings,
                                   gender, so, other_trans_lst, lemma_type)
                 if lemma_type == "G":  # if it's a grammatical item
@@ -52,12 +139,24 @@ class glossesDictionaryParser:
                     else:
                         lex_dict[mb].append(cur_lemma)
 
+        if len(invalid_lines) == 1:
+            raise Exception("Line " + str(invalid_lines[0]) + " in the glossing dictionary is invalid.")
+        elif invalid_lines:
+            raise Exception("Lines " + ", ".join(str(line) for line in invalid_lines) +
+                            " in the glossing dictionary are invalid.")
+        self.dicts_fingerprint = entries_hash.hexdigest()
+        gram_dict = {mb: tuple(senses) for mb, senses in gram_dict.items()}     # the senses don't change anymore
+        lex_dict = {mb: tuple(senses) for mb, senses in lex_dict.items()}
         return gram_dict, lex_dict
 
-    def map_headers_to_indexes(self, table: Worksheet) -> dict:
+    def map_headers_to_indexes(self, headers_row: tuple) -> dict:
+        """
+        :param headers_row: the values of the first row of the worksheet
+        :return: dict of the form {header: index in the row (0-based)}
+        """
         headers_to_idx_map = dict()
-        for j in range(1, table.max_column + 1):
-            cur_header = table.cell(1, j).value
+        for j in range(len(headers_row)):
+            cur_header = headers_row[j]
             if cur_header:
                 headers_to_idx_map[cur_header] = j
         return headers_to_idx_map
@@ -65,6 +164,9 @@ class glossesDictionaryParser:
     def get_adverbs_set(self):
         return self.adverbs
 
+    def get_dicts_fingerprint(self):
+        return self.dicts_fingerprint
+
     def parse_other_trans_field(self, other_trans: str) -> list:
         res = []
         if other_trans:
@@ -1,6 +1,6 @@
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
-import main
+import config
 
 DICT_FOR_GLOSSES_ID = ""
 GOOGLE_API_CREDENTIALS_PATH = ''
@@ -19,5 +19,5 @@ def download_glosses_dictionary_from_googleDrive():
     # Download the file
     request = service.files().get_media(fileId=DICT_FOR_GLOSSES_ID)
     file_data = request.execute()
-    with open(main.GLOSSES_DICT_PATH, 'wb') as f:
+    with open(config.GLOSSES_DICT_PATH, 'wb') as f:
         f.write(file_data)
@@ -1,4 +1,7 @@
+import hashlib
 import json
+import os
+import pickle
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl import load_workbook
 
@@ -10,6 +13,47 @@ class InputFilesHandler:
         wb = load_workbook(excel_path)
         return wb[worksheet_name]
 
+    @staticmethod
+    def read_excel_worksheet_rows(excel_path: str, worksheet_name: str):
+        """
+        Reads the worksheet in read-only mode, so the rows are streamed and the workbook is not loaded in full.
+        :return: a generator of the rows' values (tuples)
+        """
+        wb = load_workbook(excel_path, read_only=True)
+        try:
+            yield from wb[worksheet_name].iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def read_pickle(pickle_path: str):
+        """
+        :return: the unpickled object, or None if the file is missing or cannot be unpickled
+        """
+        try:
+            with open(pickle_path, "rb") as pickle_file:
+                return pickle.load(pickle_file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    @staticmethod
+    def write_pickle(obj, pickle_path: str):
+        tmp_path = pickle_path + ".tmp"
+        with open(tmp_path, "wb") as pickle_file:
+            pickle.dump(obj, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, pickle_path)     # the file is replaced at once, so it is never read half-written
+
+    @staticmethod
+    def get_file_hash(path: str) -> str:
+        """
+        :return: the sha256 hash of the file's content (hexadecimal string)
+        """
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
     @staticmethod
     def read_json_into_dict(json_path: str) -> dict:
         with open(json_path, 'r', encoding="utf8") as json_file:
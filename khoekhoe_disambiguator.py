@@ -1,18 +1,80 @@
-from lemma import Lemma
 import re
+from lemma import Lemma
 
-FIRST_PERSON_CLITICS = {"=ta", "=khom", "=m", "=ge", "=se", "=da"}
-VERBAL_POS = {"v.tr.act", "v.intr.act", "v.ditr.act", "v.tr.st", "v.intr.st"}
-FIRST_PERSON_PGNS = {"-khom", "-m", "-ge", "-se", "-da"}
-SECOND_PERSON_PGNS = {"-ts", "-s", "-kho", "-ro", "-go", "-so", "-du"}
-ENGLISH_AUX_VERBS = {"am", "is", "are", "was", "were"}
-NOMINAL_SUFFIXES = {"-b", "-s", "-da", "-di", "-du", "-ge", "-go", "-hâ", "-i", "-in", "-n", "-kha", "-kho",
-                    "-khom", "-m", "-ra", "-se", "-so", "-ta", "-ts"}   # -gu is not included because it is also a verbal suffix
-VERBAL_SUFFIXES = {"-sen", "-ba", "-he"}
-GENDER_SUFFIXES_MAP = {"m": {"-b", "-kha", "-gu"},
-                       "f": {"-s", "-ra", "-di"},
-                       "c": {"-i", "-ra", "-n"}
+FIRST_PERSON_CLITICS = frozenset({"=ta", "=khom", "=m", "=ge", "=se", "=da"})
+VERBAL_POS = frozenset({"v.tr.act", "v.intr.act", "v.ditr.act", "v.tr.st", "v.intr.st"})
+FIRST_PERSON_PGNS = frozenset({"-khom", "-m", "-ge", "-se", "-da"})
+SECOND_PERSON_PGNS = frozenset({"-ts", "-s", "-kho", "-ro", "-go", "-so", "-du"})
+ENGLISH_AUX_VERBS = frozenset({"am", "is", "are", "was", "were"})
+NOMINAL_SUFFIXES = frozenset({"-b", "-s", "-da", "-di", "-du", "-ge", "-go", "-hâ", "-i", "-in", "-n", "-kha", "-kho",
+                              "-khom", "-m", "-ra", "-se", "-so", "-ta", "-ts"})   # -gu is not included because it is also a verbal suffix
+VERBAL_SUFFIXES = frozenset({"-sen", "-ba", "-he"})
+GENDER_SUFFIXES_MAP = {"m": frozenset({"-b", "-kha", "-gu"}),
+                       "f": frozenset({"-s", "-ra", "-di"}),
+                       "c": frozenset({"-i", "-ra", "-n"})
                        }
+HORTATIVE_PARTICLES = frozenset({"a", "ǀkhī", "ā"})
+NONVERBAL_FTE_LINES = frozenset({"[backchannel]", "[laughter]", "[cough]", "[gasp]",     # lowercase, as compared
+                                 "[nose]", "[throat]", "[moan]", "[groan]"})            # with the lowered fte
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class FteLine:
+    """
+    The free translation (fte) of an utterance, normalized once for all the morphemes of the utterance:
+    the lowered text, the set of its words, and the results of the regular expressions which were already searched
+    in it. The rules look for phrases with "in" (as substrings of the lowered text), and for words with has_any_word.
+    """
+    __slots__ = ("text", "words", "search_results")
+
+    def __init__(self, fte: str):
+        self.text = fte.lower()
+        self.words = frozenset(WORD_PATTERN.findall(self.text))
+        self.search_results = {}            # {compiled pattern : whether it is found in the text}
+
+    def __contains__(self, phrase: str):
+        return phrase in self.text
+
+    def __bool__(self):
+        return bool(self.text)
+
+    def has_any_word(self, words: frozenset):
+        return not self.words.isdisjoint(words)
+
+    def search(self, pattern: re.Pattern):
+        is_found = self.search_results.get(pattern)
+        if is_found is None:
+            is_found = self.search_results[pattern] = pattern.search(self.text) is not None
+        return is_found
+
+    def find(self, words: frozenset, pattern: re.Pattern):
+        """
+        :param words: the words pattern looks for, or None if it doesn't look for single words only
+        :param pattern: a regular expression which looks for the words (as whole words)
+        :return: whether any of the words is found. The words set is used when it is available,
+                 and the regular expression otherwise.
+        """
+        if words is not None:
+            return not self.words.isdisjoint(words)
+        return self.search(pattern)
+
+
+class AnnotationContext:
+    """
+    Everything the special cases (see SPECIAL_CASES) may need to know about the annotation being glossed.
+    """
+    __slots__ = ("morpheme", "tx_line", "fte_line", "mb_prev", "mb_next", "is_second_ge")
+
+    def __init__(self, morpheme: str, tx_line: str, fte_line: FteLine, mb_prev: str, mb_next: str,
+                 is_second_ge: bool):
+        self.morpheme = morpheme
+        self.tx_line = tx_line
+        self.fte_line = fte_line
+        self.mb_prev = mb_prev
+        self.mb_next = mb_next
+        self.is_second_ge = is_second_ge    # whether "ge" has already occurred in the utterance
 
 
 class KhoekhoeDisambiguator:
@@ -30,7 +92,7 @@ class KhoekhoeDisambiguator:
         return "2F.SG.OBJ", "pro"
 
     @staticmethod
-    def hort_vs_stata(cur_ann: str, fte_line: str, next_annotation: str):
+    def hort_vs_stata(cur_ann: str, fte_line: FteLine, next_annotation: str):
         if "let" in fte_line and next_annotation in FIRST_PERSON_CLITICS:
             return "HORT", "ptcl"
         elif cur_ann == "a":
@@ -40,20 +102,20 @@ class KhoekhoeDisambiguator:
         return cur_ann, cur_ann
 
     @staticmethod
-    def xa_postp(fte_line: str):                                 # xa postp          #TODO check the frequency of it, maybe it would be better than looking in the translation
+    def xa_postp(fte_line: FteLine):                                 # xa postp          #TODO check the frequency of it, maybe it would be better than looking in the translation
         # look for "by" or "about" in translation
         if "by " in fte_line:
             return "by", "postp"
         return "about", "postp"
 
     @staticmethod
-    def pgn_vs_recp(fte_line: str):                              # -gu
+    def pgn_vs_recp(fte_line: FteLine):                              # -gu
         if "each other" in fte_line:
             return "-RECP", "-vsf"
         return "-3M.PL", "-nsf"
 
     @staticmethod
-    def poss1_vs_quot_vs_1sg(tx_line: str, fte_line: str):       # ti
+    def poss1_vs_quot_vs_1sg(tx_line: str, fte_line: FteLine):       # ti
         if "my " in fte_line or "mine." in fte_line or "mine " in fte_line or "mine, " in fte_line:
             return "1SG.POSS", "pro"                             # TODO find a stronger indication for cases in which both "my" and "I" occur
         elif "i " in fte_line or "ti -ta" in tx_line:            # TODO better to check whether the next annotation is '-ta'
@@ -61,7 +123,7 @@ class KhoekhoeDisambiguator:
         return "QUOT", "ptcl"
 
     @staticmethod
-    def poss2_vs_2pro_1incl(fte_line: str, mb_next: str):                      # 'sa' morpheme
+    def poss2_vs_2pro_1incl(fte_line: FteLine, mb_next: str):                      # 'sa' morpheme
         if mb_next in FIRST_PERSON_PGNS:
             return "1INCL", "pro"
         elif mb_next in SECOND_PERSON_PGNS:
@@ -72,7 +134,7 @@ class KhoekhoeDisambiguator:
             return "sa", "sa"
 
     @staticmethod
-    def yes_vs_interj(fte):
+    def yes_vs_interj(fte: FteLine):
         if "yes" in fte or "yeah" in fte:
             return "yes", "interj"
         return "so_that", "conj"
@@ -84,19 +146,19 @@ class KhoekhoeDisambiguator:
         return "when", "conj"
 
     @staticmethod
-    def dist_vs_fall(fte: str):
+    def dist_vs_fall(fte: FteLine):
         if "fall" in fte:
             return "fall", "v.intr.act"
         return "DIST", "dem"
 
     @staticmethod
-    def we_vs_arrive(fte_line: str):                             # sī
+    def we_vs_arrive(fte_line: FteLine):                             # sī
         if "we " in fte_line:
             return "1EXCL", "pro"
         return "arrive", "vitr"
 
     @staticmethod
-    def particle_ha(ge_prev, fte: str):
+    def particle_ha(ge_prev, fte: FteLine):
         if ge_prev == "tama":
             return "NEG.AUX", "ptcl"
         elif ge_prev == "ǃnâ" or \
@@ -107,6 +169,12 @@ class KhoekhoeDisambiguator:
             return "COP.LOC", "cop"
         return "PFV", "ptcl"
 
+    @staticmethod
+    def ai_front(mb_next):
+        if mb_next == "-s":
+            return "front", "n"
+        return None                         # glossed according to the dictionary
+
     @staticmethod
     def axase_cop(ge_next):
         if ge_next == "=se":
@@ -120,10 +188,10 @@ class KhoekhoeDisambiguator:
         return "=se", "=se"
 
     @staticmethod
-    def disambiguate(possible_senses: list[Lemma], fte_line: str, next_mb: str) -> int:
+    def disambiguate(possible_senses: tuple[Lemma], fte_line: FteLine, next_mb: str) -> int:
         """
         :param possible_senses: A list of possible senses to gloss as pairs (tuples) of (ge, ps)
-        :param fte_line: string of the translation
+        :param fte_line: the translation, normalized once per utterance
         :param next_mb: string of the next mb annotation
         :return: The index which indicates the chosen option
         """
@@ -139,27 +207,45 @@ class KhoekhoeDisambiguator:
             return 0
 
         for i in range(len(possible_senses)):
-            ge = possible_senses[i].ge.replace('_', " ")
             ps = possible_senses[i].ps
             gender = possible_senses[i].gender
-            other_trans = possible_senses[i].other_translations
-            all_optional_trans = "(" + ge
-            for trans in other_trans:
-                all_optional_trans += "|" + trans
-            all_optional_trans += ")"
-            if re.search("\\b" + all_optional_trans + "\\b", fte_line):
+            if fte_line.find(possible_senses[i].translation_words, possible_senses[i].word_matcher):   # see Lemma
                 if is_noun and not is_verb and ps == "n":
                     # if next_mb in GENDER_SUFFIXES_MAP[gender]:        # not applicable now, because there is not much data in 'gender' column
                     return i
                 elif not is_noun and ps != "n":
                     return i
-            elif re.search(all_optional_trans, fte_line):
+            elif fte_line.search(possible_senses[i].substring_matcher):
                 if is_noun and not is_verb and ps == "n":
                     # if gender and next_mb in GENDER_SUFFIXES_MAP[gender]:
                     return i
                 elif not is_noun and ps != "n":
                     return i
-            elif not is_noun and ps in VERBAL_POS and ge[-1] == "e":
-                if re.search("\\b" + ge[:-1] + "ing\\b", fte_line):
+            elif not is_noun and ps in VERBAL_POS and possible_senses[i].ing_matcher is not None:
+                if fte_line.find(possible_senses[i].ing_words, possible_senses[i].ing_matcher):
                     return i
         return 0
+
+
+# The special cases of SingleEafGlosser.gloss_single_annotation, which are handled before the dictionary lookup:
+# {morpheme : function(AnnotationContext) -> (ge, ps)}. If the function returns None, the morpheme is glossed
+# according to the dictionary. A new ambiguity rule is added by adding its morphemes here.
+kkd = KhoekhoeDisambiguator
+SPECIAL_CASES = {
+    "ge": lambda context: kkd.decl_vs_pst(context.is_second_ge),
+    **dict.fromkeys(HORTATIVE_PARTICLES,
+                    lambda context: kkd.hort_vs_stata(context.morpheme, context.fte_line, context.mb_next)),
+    "o": lambda context: kkd.conj_o(context.tx_line, context.mb_prev),
+    "axa": lambda context: kkd.axase_cop(context.mb_next),
+    "ai": lambda context: kkd.ai_front(context.mb_next),
+    "xa": lambda context: kkd.xa_postp(context.fte_line),
+    "-gu": lambda context: kkd.pgn_vs_recp(context.fte_line),
+    "î": lambda context: kkd.yes_vs_interj(context.fte_line),
+    "ti": lambda context: kkd.poss1_vs_quot_vs_1sg(context.tx_line, context.fte_line),
+    **dict.fromkeys(("sa", "sā"), lambda context: kkd.poss2_vs_2pro_1incl(context.fte_line, context.mb_next)),
+    "sī": lambda context: kkd.we_vs_arrive(context.fte_line),
+    "si": lambda context: kkd.firstExcl_vs_femObj(context.mb_next),
+    "hâ": lambda context: kkd.particle_ha(context.mb_prev, context.fte_line),
+    "ǁnā": lambda context: kkd.dist_vs_fall(context.fte_line),
+    "=se": lambda context: kkd.manner_se(context.mb_prev),
+}
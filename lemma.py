@@ -1,11 +1,125 @@
+import re
+import sys
+
+SINGLE_WORD_PATTERN = re.compile(r"\w+")
+
+
 class Lemma:
+    """
+    A sense of a morpheme in the glossing dictionary.
+    Lemmas are immutable and have no per-instance __dict__, since the whole dictionary is kept in memory by every
+    worker process. The values of ps, gender, so and lemma_type repeat across the dictionary, so they are interned,
+    and the other translations are kept in a tuple. The matchers (see compile_translation_matchers) are compiled
+    when they are used for the first time, i.e., only for morphemes with several senses.
+    """
+    __slots__ = ("mb", "ge", "ps", "so", "gender", "other_translations", "lemma_type", "common_misspellings",
+                 "matchers")
+
     def __init__(self, mb: str, ge: str, ps: str, common_misspellings: str, gender: str, so: str,
                  other_translations: list[str], lemma_type: str):
-        self.mb = mb
-        self.ge = ge
-        self.ps = ps
-        self.so = so
-        self.gender = gender
-        self.other_translations = other_translations
-        self.lemma_type = lemma_type
-        self.common_misspellings = common_misspellings
+        set_attribute = object.__setattr__              # Lemma.__setattr__ doesn't allow changes
+        set_attribute(self, "mb", mb)
+        set_attribute(self, "ge", ge)
+        set_attribute(self, "ps", intern_value(ps))
+        set_attribute(self, "so", intern_value(so))
+        set_attribute(self, "gender", intern_value(gender))
+        set_attribute(self, "other_translations", tuple(other_translations))
+        set_attribute(self, "lemma_type", intern_value(lemma_type))
+        set_attribute(self, "common_misspellings", common_misspellings)     # None if there are none
+        set_attribute(self, "matchers", None)           # see get_matchers
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Lemma objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Lemma objects are immutable")
+
+    def __reduce__(self):               # pickled by its fields only, the matchers are compiled again when used
+        return Lemma, self.get_fields()
+
+    def __eq__(self, other):
+        return isinstance(other, Lemma) and self.get_fields() == other.get_fields()
+
+    def __hash__(self):
+        return hash(self.get_fields())
+
+    def get_fields(self):
+        return self.mb, self.ge, self.ps, self.common_misspellings, self.gender, self.so, self.other_translations, \
+            self.lemma_type
+
+    @property
+    def word_matcher(self):
+        return self.get_matchers()[0]
+
+    @property
+    def substring_matcher(self):
+        return self.get_matchers()[1]
+
+    @property
+    def ing_matcher(self):
+        return self.get_matchers()[2]
+
+    @property
+    def translation_words(self):
+        return self.get_matchers()[3]
+
+    @property
+    def ing_words(self):
+        return self.get_matchers()[4]
+
+    def get_matchers(self):
+        if self.matchers is None:
+            object.__setattr__(self, "matchers", self.compile_translation_matchers())
+        return self.matchers
+
+    def compile_translation_matchers(self):
+        """
+        Compiles (once per lemma) the regular expressions which KhoekhoeDisambiguator.disambiguate uses to look for
+        the translations of the lemma in the fte line:
+        word_matcher - any of the translations as whole words
+        substring_matcher - any of the translations anywhere in the line
+        ing_matcher - the "-ing" form of ge (e.g., "take" -> "taking"), or None if ge does not end with "e"
+        When all the translations are single words, the whole words are also kept as sets (translation_words and
+        ing_words), which are looked up in the words of the line instead of searching it (see FteLine.find).
+        Otherwise, the sets are None.
+        :return: a tuple of (word_matcher, substring_matcher, ing_matcher, translation_words, ing_words)
+        """
+        ge = self.ge.replace('_', " ")
+        all_optional_trans = [ge] + list(self.other_translations)
+        word_matcher = compile_alternatives(all_optional_trans, "\\b", "\\b")
+        substring_matcher = compile_alternatives(all_optional_trans)
+        translation_words = get_words_set(all_optional_trans)
+        ing_matcher = None
+        ing_words = None
+        if ge.endswith("e"):
+            try:
+                ing_matcher = re.compile("\\b" + ge[:-1] + "ing\\b")
+            except re.error:
+                ing_matcher = re.compile("\\b" + re.escape(ge[:-1]) + "ing\\b")
+            ing_words = get_words_set([ge[:-1] + "ing"])
+        return word_matcher, substring_matcher, ing_matcher, translation_words, ing_words
+
+
+def intern_value(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def compile_alternatives(alternatives: list[str], prefix: str = "", suffix: str = "") -> re.Pattern:
+    """
+    Compiles the pattern: prefix(alternative1|alternative2|...)suffix
+    The alternatives are used as regular expressions. If they are not valid ones, they are matched literally.
+    """
+    try:
+        return re.compile(prefix + "(" + "|".join(alternatives) + ")" + suffix)
+    except re.error:
+        return re.compile(prefix + "(" + "|".join(re.escape(alt) for alt in alternatives) + ")" + suffix)
+
+
+def get_words_set(words: list[str]):
+    """
+    :return: a frozenset of the words if each of them is a single word (so matching it as a whole word, between "\\b"s,
+             is the same as looking it up in the words of the line), None otherwise
+    """
+    if all(SINGLE_WORD_PATTERN.fullmatch(word) for word in words):
+        return frozenset(words)
+    return None
@@ -1,93 +1,505 @@
 import os
 import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
 from pprint import pprint
-from fix_glosses import fix_glosses
-import googleDrive_connection
 from input_files_handler import *
 from single_eaf_glosser import *
 from preprocessing import preprocessor
+from preprocessing.segmentation_cache import SegmentationCache
+from preprocessing.language_identifier import LanguageIdentifier
+from preprocessing.annotation_cleaner import AnnotationCleaner
 from glosses_dictionary_parser import glossesDictionaryParser
+from build_manifest import BuildManifest
+from morpheme_index import MorphemeIndex
+from pipeline_metrics import PipelineMetrics, NULL_METRICS
+from pipeline_profiler import PipelineProfiler
+from config import *
 
 
-GLOSSES_DICT_PATH = "input\\ISF_Khoekhoe_dictionary_for_glosses.xlsx"
-# GLOSSES_DICT_PATH = "input/ISF_Khoekhoe_dictionary_for_glosses.xlsx"        # for macOS
-INPUT_DIRECTORY_PATH = "input"
-OUTPUT_DIRECTORY_PATH = "output"
-CAPITALIZED_WORDS_LIST_PATH = "input\\capitalized_words.txt"
-# CAPITALIZED_WORDS_LIST_PATH = "input/capitalized_words.txt"                 # for macOS
-WORDS_NOT_TO_SEGMENT = "input\\words_not_to_segment.json"
-# WORDS_NOT_TO_SEGMENT = "input/words_not_to_segment.json"                    # for macOS
-PARALINGUISTIC_ITEMS_PATH = "input\\paralinguistic_items.json"
-# PARALINGUISTIC_ITEMS_PATH = "input/paralinguistic_items.json"               # for macOS
-GLOSSES_DICT_WORKSHEET_NAME = "KK_dict_for_glosses"
-
-
-def process_all_files(auto_detect_english=True):
+def process_all_files(auto_detect_english=True, in_memory=True, jobs=1, compact=False, force=False, metrics=None):
+    """
+    Processes all the eaf files in the input directory and writes the results to the output directory.
+    Files which are up to date according to the build manifest (the same input file, resources and settings as in
+    the run which wrote their output file) are skipped. If only the glossing dictionary changed, the affected
+    annotations are glossed again in place (see patch_glosses), instead of processing the files again.
+    :param auto_detect_english: whether to detect English parts automatically or not
+    :param in_memory: if True, each file is parsed once and written once (see process_single_file_in_memory).
+                      Otherwise, the output file is saved and re-read between the stages.
+    :param jobs: number of worker processes. If it is larger than 1, the files are processed in parallel
+                 (always in memory, see process_files_in_parallel).
+    :param compact: if True, the output files are written without indentation
+    :param force: if True, all the files are processed, even if they are up to date
+    :param metrics: a PipelineMetrics to which the times of the stages of all the files and the counters are added
+                    (see PipelineMetrics.write_report), or None
+    :return: None
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
     input_files_reader = InputFilesHandler()
     dicts_parser = glossesDictionaryParser()
-    glosses_dict_worksheet = input_files_reader.read_excel_worksheet(GLOSSES_DICT_PATH, GLOSSES_DICT_WORKSHEET_NAME)
-    glossing_dicts = dicts_parser.parse_dicts(glosses_dict_worksheet)
+    with metrics.time("dictionary loading"):
+        glossing_dicts = dicts_parser.parse_dicts_from_file(GLOSSES_DICT_PATH, GLOSSES_DICT_WORKSHEET_NAME,
+                                                            GLOSSES_DICT_CACHE_PATH)
     gram_dict = glossing_dicts[0]
     lexical_dict = glossing_dicts[1]
     adverbs = dicts_parser.get_adverbs_set()
     paralinguistic_items = input_files_reader.read_json_into_dict(PARALINGUISTIC_ITEMS_PATH)
     words_not_to_segment = input_files_reader.read_json_into_dict(WORDS_NOT_TO_SEGMENT)
     capitalized_words = input_files_reader.read_capitalized_words_file(CAPITALIZED_WORDS_LIST_PATH)
+    segmentation_cache = SegmentationCache()
+    segmentation_cache.load(SEGMENTATION_CACHE_PATH)            # the segmentations of previous runs, if any
+    language_identifier = LanguageIdentifier() if auto_detect_english else None
+    build_manifest = BuildManifest(BUILD_MANIFEST_PATH)
+    morpheme_index = MorphemeIndex()
+    morpheme_index.load(MORPHEME_INDEX_PATH)
+    settings = {"auto_detect_english": auto_detect_english, "compact": compact,
+                "parallel": jobs > 1}           # parallel runs use the capitalized words of all the files for each file
+    resources_hashes = get_resources_hashes(dicts_parser.get_dicts_fingerprint())
 
+    input_hashes = {}       # {file name : hash of the input file}
     for filename in os.listdir(INPUT_DIRECTORY_PATH):
         if filename.endswith(".eaf") and filename:
-            input_path = os.path.join(INPUT_DIRECTORY_PATH, filename)
-            output_path = os.path.join(OUTPUT_DIRECTORY_PATH, filename)
-
-            # Pre-process
-            cur_preprocessor = preprocessor.Preprocessor(input_path,
-                                                         output_path,
-                                                         CAPITALIZED_WORDS_LIST_PATH,
-                                                         auto_detect_english,
-                                                         capitalized_words,
-                                                         words_not_to_segment,
-                                                         paralinguistic_items,
-                                                         adverbs)
-            cur_preprocessor.preprocess_file()
-
-            # Tokenize \tx into \mb and copy \mb to \ge and \ps tiers
-            eaf = elan.read_eaf(output_path)
-            eaf_parser = EAF_Parser(eaf)
-            eaf_parser.tokenize_all_tx_tiers()
-            eaf_parser.save_file(output_path)
-
-            # Gloss
+            input_hashes[filename] = InputFilesHandler.get_file_hash(os.path.join(INPUT_DIRECTORY_PATH, filename))
+    if not force:
+        patch_glosses(morpheme_index, build_manifest, input_hashes, resources_hashes, settings, gram_dict,
+                      lexical_dict, adverbs, capitalized_words, paralinguistic_items)
+
+    files_paths = []
+    files_names = {}        # {input_path : file name}
+    for filename, input_hash in input_hashes.items():
+        input_path = os.path.join(INPUT_DIRECTORY_PATH, filename)
+        output_path = os.path.join(OUTPUT_DIRECTORY_PATH, filename)
+        if not force and build_manifest.is_up_to_date(filename, output_path, input_hash, resources_hashes, settings,
+                                                      capitalized_words):
+            continue
+        files_paths.append((input_path, output_path))
+        files_names[input_path] = filename
+        morpheme_index.remove_file(filename)
+    skipped_files_num = len(input_hashes) - len(files_paths)
+    metrics.count("files up to date", skipped_files_num)
+    if skipped_files_num:
+        print(str(skipped_files_num) + " files are up to date and were skipped (use --force to process them again)")
+
+    processed_paths = []
+    capitalized_lookups = {}      # {input_path : the capitalized words consulted for the file, see BuildManifest}
+    if jobs > 1:
+        resources = (auto_detect_english, capitalized_words, words_not_to_segment, paralinguistic_items, adverbs,
+                     gram_dict, lexical_dict, segmentation_cache, language_identifier, compact,
+                     metrics is not NULL_METRICS)
+        processed_paths = process_files_in_parallel(files_paths, jobs, resources, morpheme_index, metrics,
+                                                    capitalized_lookups)
+    else:
+        for input_path, output_path in files_paths:
+            file_capitalized_lookups = {}
+            with metrics.time_file(files_names[input_path]):
+                if in_memory:
+                    processed = process_single_file_in_memory(input_path, output_path, auto_detect_english,
+                                                              capitalized_words, words_not_to_segment,
+                                                              paralinguistic_items, adverbs, gram_dict, lexical_dict,
+                                                              CAPITALIZED_WORDS_LIST_PATH, segmentation_cache,
+                                                              language_identifier, compact, morpheme_index, metrics,
+                                                              file_capitalized_lookups)
+                else:
+                    processed = process_single_file(input_path, output_path, auto_detect_english, capitalized_words,
+                                                    words_not_to_segment, paralinguistic_items, adverbs, gram_dict,
+                                                    lexical_dict, segmentation_cache, language_identifier, compact,
+                                                    morpheme_index, metrics, file_capitalized_lookups)
+            if processed:
+                processed_paths.append(input_path)
+                capitalized_lookups[input_path] = file_capitalized_lookups
+    metrics.count("files processed", len(processed_paths))
+    metrics.count("segmentation cache hits", segmentation_cache.hits)
+    metrics.count("segmentation cache misses", segmentation_cache.misses)
+
+    segmentation_cache.save(SEGMENTATION_CACHE_PATH)
+    print(segmentation_cache.get_report())
+
+    for input_path in processed_paths:
+        filename = files_names[input_path]
+        build_manifest.update(filename, input_hashes[filename], resources_hashes, settings,
+                              capitalized_lookups[input_path])
+    build_manifest.retain(input_hashes)
+    build_manifest.save()
+
+    # now all the indexed files are glossed with the current dictionary
+    morpheme_index.retain(input_hashes)
+    morpheme_index.update_signatures(gram_dict, lexical_dict)
+    morpheme_index.dicts_fingerprint = dicts_parser.get_dicts_fingerprint()
+    morpheme_index.adverbs = frozenset(adverbs)
+    morpheme_index.save(MORPHEME_INDEX_PATH)
+
+
+def patch_glosses(morpheme_index, build_manifest, input_hashes, resources_hashes, settings, gram_dict, lexical_dict,
+                  adverbs, capitalized_words, paralinguistic_items):
+    """
+    If the glossing dictionary changed since the last run, glosses again only the \\ge and \\ps annotations whose
+    morphemes' senses changed (see MorphemeIndex), in the output files which are otherwise up to date.
+    Preprocessing and tokenization are not repeated. The build manifest entries of the patched files are updated,
+    so they are not processed again.
+    If the adverbs changed too, nothing is patched, since the segmentation depends on them.
+    :param input_hashes: {file name : hash of the input file}
+    :param resources_hashes: the current hashes of the resources (see get_resources_hashes)
+    :return: None
+    """
+    previous_dicts_fingerprint = morpheme_index.dicts_fingerprint
+    if previous_dicts_fingerprint is None or previous_dicts_fingerprint == resources_hashes["glossing dictionary"] \
+            or morpheme_index.adverbs != frozenset(adverbs):
+        return
+    previous_resources_hashes = dict(resources_hashes)
+    previous_resources_hashes["glossing dictionary"] = previous_dicts_fingerprint
+    affected_annotations = morpheme_index.find_affected_annotations(gram_dict, lexical_dict)
+    reglossed_num = 0
+    patched_files_num = 0
+    for filename in morpheme_index.get_files():
+        output_path = os.path.join(OUTPUT_DIRECTORY_PATH, filename)
+        if filename not in input_hashes or not build_manifest.is_up_to_date(filename, output_path,
+                                                                            input_hashes[filename],
+                                                                            previous_resources_hashes, settings,
+                                                                            capitalized_words):
+            continue
+        if filename in affected_annotations:
             glosser = SingleEafGlosser(output_path, capitalized_words, paralinguistic_items)
-            glosser.gloss_file(gram_dict, lexical_dict)
-            glosser.save_file(output_path)
+            reglossed_num += glosser.regloss_annotations(affected_annotations[filename], gram_dict, lexical_dict)
+            glosser.save_file(output_path, settings["compact"])
+            patched_files_num += 1
+        build_manifest.update(filename, input_hashes[filename], resources_hashes, settings,
+                              build_manifest.get_capitalized_lookups(filename))     # \tx is not cleaned again
+    print("The glossing dictionary changed: " + str(reglossed_num) + " annotations were glossed again in " +
+          str(patched_files_num) + " files")
 
 
-def check_input_args(args):
+def get_resources_hashes(dicts_fingerprint):
     """
-    checks the validity of the user arguments
-    :param args: a list of the arguments
-    :return: if input is valid - true, otherwise False
+    :param dicts_fingerprint: the fingerprint of the glossing dictionary's entries (see
+                              glossesDictionaryParser.parse_dict_rows). It is used instead of the hash of the workbook,
+                              so that a re-downloaded dictionary without changes in its entries doesn't make the
+                              output files stale.
+    :return: a dict of the hashes of all the resources which affect the output files, except for the capitalized words,
+             which are recorded for each file separately (see BuildManifest)
+    """
+    resources_hashes = {"glossing dictionary": dicts_fingerprint}
+    resources_paths = {"misspellings correction": AnnotationCleaner.MISSPELLINGS_DICTS_PATH,
+                       "words not to segment": WORDS_NOT_TO_SEGMENT,
+                       "paralinguistic items": PARALINGUISTIC_ITEMS_PATH}
+    for resource_name, resource_path in resources_paths.items():
+        resources_hashes[resource_name] = InputFilesHandler.get_file_hash(resource_path)
+    return resources_hashes
+
+
+def gloss_output_files(files_paths=None, jobs=1, compact=False):
+    """
+    Glosses again, in place, eaf files which were already processed (gloss-only mode). Preprocessing and tokenization
+    are not repeated, and manual corrections of the \\mb tiers are kept (see SingleEafGlosser.regloss_file).
+    The glossing dictionary and the rest of the resources are loaded once for all the files.
+    :param files_paths: the paths of the files to gloss again. If None, all the eaf files in the output directory
+    :param jobs: number of worker processes. If it is larger than 1, the files are glossed in parallel.
+    :param compact: if True, the files are written without indentation
+    :return: a list of the paths of the files which were glossed again
+    """
+    input_files_reader = InputFilesHandler()
+    dicts_parser = glossesDictionaryParser()
+    gram_dict, lexical_dict = dicts_parser.parse_dicts_from_file(GLOSSES_DICT_PATH, GLOSSES_DICT_WORKSHEET_NAME,
+                                                                 GLOSSES_DICT_CACHE_PATH)
+    paralinguistic_items = input_files_reader.read_json_into_dict(PARALINGUISTIC_ITEMS_PATH)
+    capitalized_words = input_files_reader.read_capitalized_words_file(CAPITALIZED_WORDS_LIST_PATH)
+    if files_paths is None:
+        files_paths = [os.path.join(OUTPUT_DIRECTORY_PATH, filename)
+                       for filename in os.listdir(OUTPUT_DIRECTORY_PATH) if filename.endswith(".eaf")]
+
+    resources = (gram_dict, lexical_dict, capitalized_words, paralinguistic_items, compact)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(resources,)) as executor:
+            files_morphemes = list(executor.map(gloss_output_file_in_worker, files_paths))
+    else:
+        files_morphemes = [gloss_output_file(path, gram_dict, lexical_dict, capitalized_words, paralinguistic_items,
+                                             compact) for path in files_paths]
+
+    # the annotations of the output files may have changed (e.g., new \ge annotations of manually added \mb ones)
+    morpheme_index = MorphemeIndex()
+    if morpheme_index.load(MORPHEME_INDEX_PATH):
+        output_directory = os.path.abspath(OUTPUT_DIRECTORY_PATH)
+        for path, morpheme_annotations in zip(files_paths, files_morphemes):
+            if os.path.dirname(os.path.abspath(path)) == output_directory:
+                morpheme_index.remove_file(os.path.basename(path))
+                morpheme_index.add_file(os.path.basename(path), morpheme_annotations)
+        morpheme_index.save(MORPHEME_INDEX_PATH)
+    print(str(len(files_paths)) + " files were glossed again")
+    return files_paths
+
+
+def gloss_output_file(path, gram_dict, lexical_dict, capitalized_words, paralinguistic_items, compact=False):
+    """
+    Glosses again a single file which was already processed, and writes it in place.
+    :return: {morpheme : [ids of the \\ge annotations glossed according to it]}
+    """
+    glosser = SingleEafGlosser(path, capitalized_words, paralinguistic_items)
+    glosser.regloss_file(gram_dict, lexical_dict)
+    glosser.save_file(path, compact)
+    return glosser.get_morpheme_annotations()
+
+
+def gloss_output_file_in_worker(path):
+    gram_dict, lexical_dict, capitalized_words, paralinguistic_items, compact = _worker_resources
+    return gloss_output_file(path, gram_dict, lexical_dict, capitalized_words, paralinguistic_items, compact)
+
+
+def process_files_in_parallel(files_paths, jobs, resources, morpheme_index=None, metrics=None,
+                              capitalized_lookups=None):
+    """
+    Fans the files out across a pool of worker processes.
+    The resources (parsed dictionaries, word lists etc.) are sent once to each worker when it starts, so the Excel
+    dictionary is not parsed again in the workers. In a first pass, the workers find the new capitalized words of all
+    the files, and only this (parent) process appends them to the file. Then all the files are processed with the same
+    capitalized words, so the results don't depend on the number of workers or on which worker processed each file
+    (unlike a serial run, where a file uses only the words found in it and in the files before it).
+    The results of the workers (new segmentations, the morphemes of the glossed files and the metrics) are merged into
+    the parent's segmentation cache, morpheme index and metrics in the order of the files.
+    :param files_paths: a list of (input_path, output_path) pairs
+    :param jobs: number of worker processes
+    :param resources: a tuple of (auto_detect_english, capitalized_words, words_not_to_segment,
+                      paralinguistic_items, adverbs, gram_dict, lexical_dict, segmentation_cache,
+                      language_identifier, compact, collect_metrics)
+    :param morpheme_index: a MorphemeIndex to which the glossed files are added, or None
+    :param metrics: a PipelineMetrics to which the metrics of the files are added, or None
+    :return: a list of the input paths of the files which were processed
     """
-    if not (len(args) <= 1):
+    capitalized_words = resources[1]
+    segmentation_cache = resources[7]
+    processed_paths = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(resources,)) as executor:
+        new_capitalized_words = set()
+        for file_capitalized_words in executor.map(find_capitalized_words_in_worker,
+                                                   [input_path for input_path, output_path in files_paths]):
+            new_capitalized_words.update(file_capitalized_words)
+        preprocessor.write_new_capitalized(new_capitalized_words, CAPITALIZED_WORDS_LIST_PATH)
+        capitalized_words.update(new_capitalized_words)
+
+        futures = [(executor.submit(process_file_in_worker, input_path, output_path, new_capitalized_words),
+                    input_path)
+                   for input_path, output_path in files_paths]
+        for future, input_path in futures:                      # in the order of the files, so the merge is deterministic
+            processed, segmentation_cache_updates, file_morpheme_index, file_metrics, file_capitalized_lookups = \
+                future.result()
+            if metrics is not None:
+                metrics.merge(file_metrics)
+            if processed:
+                processed_paths.append(input_path)
+                if capitalized_lookups is not None:
+                    capitalized_lookups[input_path] = file_capitalized_lookups
+                if morpheme_index is not None:
+                    morpheme_index.merge(file_morpheme_index)
+            segmentation_cache.merge_updates(segmentation_cache_updates)
+    return processed_paths
+
+
+_worker_resources = None        # the resources of the current worker process, set once by init_worker
+
+
+def init_worker(resources):          # resources is a tuple, whose items depend on the function the workers run
+    global _worker_resources
+    _worker_resources = resources
+
+
+def find_capitalized_words_in_worker(input_path):
+    """
+    Finds the new capitalized words of a single file in a worker process (the first pass of process_files_in_parallel).
+    :return: the set of capitalized words which were found in the file and are not in the capitalized words file
+    """
+    auto_detect_english, capitalized_words, words_not_to_segment, paralinguistic_items, adverbs, \
+        gram_dict, lexical_dict, segmentation_cache, language_identifier, compact, collect_metrics = _worker_resources
+    file_capitalized_words = set(capitalized_words)
+    preprocessor.Preprocessor(input_path, None, None, False, file_capitalized_words, words_not_to_segment,
+                              paralinguistic_items, adverbs, segmentation_cache=segmentation_cache)
+    return file_capitalized_words - capitalized_words
+
+
+def process_file_in_worker(input_path, output_path, new_capitalized_words):
+    """
+    Processes a single file in a worker process.
+    :param new_capitalized_words: the new capitalized words of all the files (see find_capitalized_words_in_worker)
+    :return: a tuple of whether the file was processed, the updates of the worker's segmentation cache (see
+             SegmentationCache.pop_updates), a MorphemeIndex of the file, the PipelineMetrics of the file (empty if
+             collect_metrics is False) and the capitalized words consulted for the file
+    """
+    auto_detect_english, capitalized_words, words_not_to_segment, paralinguistic_items, adverbs, \
+        gram_dict, lexical_dict, segmentation_cache, language_identifier, compact, collect_metrics = _worker_resources
+    file_morpheme_index = MorphemeIndex()
+    file_metrics = PipelineMetrics() if collect_metrics else NULL_METRICS
+    file_capitalized_lookups = {}
+    capitalized_words.update(new_capitalized_words)
+    with file_metrics.time_file(os.path.basename(input_path)):
+        processed = process_single_file_in_memory(input_path, output_path, auto_detect_english, capitalized_words,
+                                                  words_not_to_segment, paralinguistic_items, adverbs, gram_dict,
+                                                  lexical_dict, None, segmentation_cache, language_identifier,
+                                                  compact, file_morpheme_index, file_metrics, file_capitalized_lookups)
+    return processed, segmentation_cache.pop_updates(), file_morpheme_index, file_metrics, file_capitalized_lookups
+
+
+def process_single_file(input_path, output_path, auto_detect_english, capitalized_words, words_not_to_segment,
+                        paralinguistic_items, adverbs, gram_dict, lexical_dict, segmentation_cache=None,
+                        language_identifier=None, compact=False, morpheme_index=None, metrics=None,
+                        capitalized_lookups=None):
+    """
+    Processes a single eaf file, saving the output file after each stage and re-reading it in the next one.
+    :return: True
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
+
+    # Pre-process
+    with metrics.time("preprocessing"):
+        cur_preprocessor = preprocessor.Preprocessor(input_path,
+                                                     output_path,
+                                                     CAPITALIZED_WORDS_LIST_PATH,
+                                                     auto_detect_english,
+                                                     capitalized_words,
+                                                     words_not_to_segment,
+                                                     paralinguistic_items,
+                                                     adverbs,
+                                                     segmentation_cache=segmentation_cache,
+                                                     language_identifier=language_identifier,
+                                                     metrics=metrics)
+        cur_preprocessor.preprocess_file()
+
+    # Tokenize \tx into \mb and copy \mb to \ge and \ps tiers
+    with metrics.time("parsing"):
+        eaf = elan.read_eaf(output_path)
+    with metrics.time("tokenization"):
+        eaf_parser = EAF_Parser(eaf)
+        eaf_parser.tokenize_all_tx_tiers()
+    with metrics.time("saving"):
+        eaf_parser.save_file(output_path, compact)
+
+    # Gloss
+    with metrics.time("glossing"):
+        glosser = SingleEafGlosser(output_path, capitalized_words, paralinguistic_items, metrics=metrics)
+        glosser.gloss_file(gram_dict, lexical_dict)
+    with metrics.time("saving"):
+        glosser.save_file(output_path, compact)
+    if morpheme_index is not None:
+        morpheme_index.add_file(os.path.basename(input_path), glosser.get_morpheme_annotations())
+    if capitalized_lookups is not None:
+        capitalized_lookups.update(cur_preprocessor.annotation_cleaner.capitalized_lookups)
+        capitalized_lookups.update(glosser.annotation_cleaner.capitalized_lookups)
+    return True
+
+
+def process_single_file_in_memory(input_path, output_path, auto_detect_english, capitalized_words,
+                                  words_not_to_segment, paralinguistic_items, adverbs, gram_dict, lexical_dict,
+                                  capitalized_words_path, segmentation_cache=None, language_identifier=None,
+                                  compact=False, morpheme_index=None, metrics=None, capitalized_lookups=None):
+    """
+    Processes a single eaf file: the file is parsed once, the same Doc object is passed through preprocessing,
+    tokenization and glossing, and it is written once to output_path at the end.
+    :param capitalized_words_path: the file to which new capitalized words are appended. If None, the new words are
+                                   only added to capitalized_words.
+    :param segmentation_cache: a SegmentationCache shared between the files. If None, a new one is used for the file.
+    :param language_identifier: a LanguageIdentifier shared between the files. If None, a new one is used for the file.
+    :param compact: if True, the output file is written without indentation
+    :param morpheme_index: a MorphemeIndex to which the morphemes of the glossed file are added, or None
+    :param metrics: a PipelineMetrics to which the times of the stages are added, or None
+    :param capitalized_lookups: a dict to which the capitalized words consulted for the file are added
+                                ({word : whether it was a capitalized word}), or None
+    :return: True if the file was processed, False otherwise (e.g., if its tiers format is invalid)
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
+    with metrics.time("parsing"):
+        eaf = elan.read_eaf(input_path)
+
+    # Pre-process
+    with metrics.time("preprocessing"):
+        cur_preprocessor = preprocessor.Preprocessor(input_path,
+                                                     None,
+                                                     capitalized_words_path,
+                                                     auto_detect_english,
+                                                     capitalized_words,
+                                                     words_not_to_segment,
+                                                     paralinguistic_items,
+                                                     adverbs,
+                                                     eaf,
+                                                     segmentation_cache,
+                                                     language_identifier,
+                                                     metrics)
+        preprocessed = cur_preprocessor.preprocess_file()
+    if not preprocessed:
         return False
-    elif len(args) == 1:
-        if args[0] not in {"True", "False"}:
-            return False
+
+    # Tokenize \tx into \mb and copy \mb to \ge and \ps tiers
+    with metrics.time("tokenization"):
+        eaf_parser = EAF_Parser(eaf)
+        eaf_parser.tokenize_all_tx_tiers()
+
+    # Gloss
+    with metrics.time("glossing"):
+        glosser = SingleEafGlosser(input_path, capitalized_words, paralinguistic_items, eaf, metrics)
+        glosser.gloss_file(gram_dict, lexical_dict)
+    with metrics.time("saving"):
+        glosser.save_file(output_path, compact)
+    if morpheme_index is not None:
+        morpheme_index.add_file(os.path.basename(input_path), glosser.get_morpheme_annotations())
+    if capitalized_lookups is not None:
+        capitalized_lookups.update(cur_preprocessor.annotation_cleaner.capitalized_lookups)
+        capitalized_lookups.update(glosser.annotation_cleaner.capitalized_lookups)
     return True
 
 
+def parse_input_args(args):
+    """
+    Parses and checks the validity of the user arguments
+    :param args: a list of the arguments
+    :return: argparse.Namespace of the arguments
+    """
+    args_parser = argparse.ArgumentParser(description="Preprocessing and glossing of Khoekhoe ELAN files")
+    args_parser.add_argument("auto_detect_english", nargs="?", choices=["True", "False"], default="True",
+                             help="whether to detect English parts automatically (default: True)")
+    args_parser.add_argument("--jobs", type=int, default=1,
+                             help="number of worker processes for processing the files in parallel (default: 1)")
+    args_parser.add_argument("--compact", action="store_true",
+                             help="write the output files without indentation (smaller and faster to write)")
+    args_parser.add_argument("--force", action="store_true",
+                             help="process all the files, including the ones which are up to date")
+    args_parser.add_argument("--metrics", metavar="REPORT_FILE",
+                             help="write the time and the number of calls of each stage, and counters (e.g., "
+                                  "dictionary hits), to REPORT_FILE: as Prometheus text if it ends with .prom, "
+                                  "and as JSON otherwise")
+    args_parser.add_argument("--profile", metavar="REPORT_DIRECTORY",
+                             help="profile the run and write ranked reports (stages, files, misspelling rules and "
+                                  "dictionary entries) to REPORT_DIRECTORY")
+    args_parser.add_argument("--gloss-only", nargs="*", metavar="EAF_FILE",
+                             help="only gloss again already processed files, in place, keeping manual corrections "
+                                  "of \\mb (default: all the files in the output directory)")
+    parsed_args = args_parser.parse_args(args)
+    if parsed_args.jobs < 1:
+        args_parser.error("--jobs must be a positive integer")
+    return parsed_args
+
+
 def run_text_processing():
-    args_lst = sys.argv[1:]
-    if not check_input_args(args_lst):
-        raise Exception("The provided arguments are invalid.")
-    auto_detect_english = True
-    if len(args_lst) == 1 and args_lst[0] == "False":
-        auto_detect_english = False
-    process_all_files(auto_detect_english)
+    args = parse_input_args(sys.argv[1:])
+    if args.gloss_only is not None:
+        gloss_output_files(args.gloss_only or None, jobs=args.jobs, compact=args.compact)
+        return
+    auto_detect_english = args.auto_detect_english == "True"
+    if args.profile is not None:
+        if args.jobs > 1:
+            print("--profile processes all the files in this process, so --jobs is ignored")
+        profiler = PipelineProfiler(args.profile)
+        profiler.run(process_all_files, auto_detect_english, compact=args.compact, force=args.force,
+                     metrics=profiler.metrics)
+        metrics = profiler.metrics
+        print("The profile reports were written to " + profiler.write_reports())
+    else:
+        metrics = PipelineMetrics() if args.metrics else None
+        process_all_files(auto_detect_english, jobs=args.jobs, compact=args.compact, force=args.force,
+                          metrics=metrics)
+    if args.metrics:
+        metrics.write_report(args.metrics)
+        print("The metrics report was written to " + args.metrics)
 
 
 if __name__ == '__main__':
+    from fix_glosses import fix_glosses             # imported here, so the functions above can be imported without
+    import googleDrive_connection                   # the Google Drive client (e.g., by the tests)
     # googleDrive_connection.download_glosses_dictionary_from_googleDrive()
     run_text_processing()
     # fix_glosses.fix_multiple_files()
@@ -0,0 +1,101 @@
+import hashlib
+from input_files_handler import InputFilesHandler
+
+
+class MorphemeIndex:
+    """
+    An inverted index from each morpheme to the \\ge annotations (in each output file) which were glossed according
+    to it. For each morpheme, it also keeps the signature of its senses in the glossing dictionaries at the time of
+    glossing, so after the dictionary changes, only the annotations of the morphemes whose senses changed have to be
+    glossed again (see SingleEafGlosser.regloss_annotations).
+    """
+    VERSION = 1             # must be incremented whenever the glossing (SingleEafGlosser) changes
+
+    def __init__(self):
+        self.morphemes = {}             # {morpheme : {file name : [ids of \ge annotations]}}
+        self.signatures = {}            # {morpheme : signature of its senses (see get_senses_signature)}
+        self.dicts_fingerprint = None   # the fingerprint of the glossing dictionary all the files were glossed with
+        self.adverbs = frozenset()      # the adverbs of that dictionary, which the segmentation depends on
+
+    def add_file(self, file_name: str, morpheme_annotations: dict):
+        """
+        :param morpheme_annotations: {morpheme : [ids of \\ge annotations]}, see SingleEafGlosser.gloss_file
+        """
+        for morpheme, ann_ids in morpheme_annotations.items():
+            self.morphemes.setdefault(morpheme, {})[file_name] = ann_ids
+
+    def remove_file(self, file_name: str):
+        for morpheme in list(self.morphemes):
+            files = self.morphemes[morpheme]
+            if files.pop(file_name, None) is not None and not files:
+                del self.morphemes[morpheme]
+                self.signatures.pop(morpheme, None)
+
+    def retain(self, file_names):
+        """
+        Removes the annotations of files which are no longer in the input directory.
+        """
+        for file_name in self.get_files() - set(file_names):
+            self.remove_file(file_name)
+
+    def merge(self, other):
+        """
+        Adds the files of another index, e.g., the index of a single file which was glossed in a worker process.
+        """
+        for morpheme, files in other.morphemes.items():
+            self.morphemes.setdefault(morpheme, {}).update(files)
+
+    def get_files(self):
+        return {file_name for files in self.morphemes.values() for file_name in files}
+
+    def update_signatures(self, gram_glossing_dict: dict, lex_glossing_dict: dict):
+        self.signatures = {morpheme: get_senses_signature(morpheme, gram_glossing_dict, lex_glossing_dict)
+                           for morpheme in self.morphemes}
+
+    def find_affected_annotations(self, gram_glossing_dict: dict, lex_glossing_dict: dict):
+        """
+        Finds the annotations whose morphemes' senses are different in the given dictionaries.
+        :return: {file name : set of ids of \\ge annotations}
+        """
+        affected_annotations = {}
+        for morpheme, files in self.morphemes.items():
+            if self.signatures.get(morpheme) == get_senses_signature(morpheme, gram_glossing_dict, lex_glossing_dict):
+                continue
+            for file_name, ann_ids in files.items():
+                affected_annotations.setdefault(file_name, set()).update(ann_ids)
+        return affected_annotations
+
+    def load(self, index_path: str):
+        """
+        Loads the index saved by a previous run. Nothing is loaded if the file is missing or was saved by a
+        different version of the index.
+        :return: True if the index was loaded, False otherwise
+        """
+        index = InputFilesHandler.read_pickle(index_path)
+        if not isinstance(index, dict) or index.get("version") != self.VERSION:
+            return False
+        self.morphemes = index["morphemes"]
+        self.signatures = index["signatures"]
+        self.dicts_fingerprint = index["dicts_fingerprint"]
+        self.adverbs = index["adverbs"]
+        return True
+
+    def save(self, index_path: str):
+        index = {"version": self.VERSION,
+                 "morphemes": self.morphemes,
+                 "signatures": self.signatures,
+                 "dicts_fingerprint": self.dicts_fingerprint,
+                 "adverbs": self.adverbs}
+        InputFilesHandler.write_pickle(index, index_path)
+
+
+def get_senses_signature(morpheme: str, gram_glossing_dict: dict, lex_glossing_dict: dict) -> str:
+    """
+    :return: a hash of all the senses SingleEafGlosser.gloss_single_annotation may look up for the morpheme
+    """
+    senses = []
+    for glossing_dict, key in ((gram_glossing_dict, morpheme), (lex_glossing_dict, morpheme),
+                               (lex_glossing_dict, morpheme.lower())):
+        senses.append([(lemma.mb, lemma.ge, lemma.ps, lemma.gender, lemma.so, lemma.other_translations,
+                        lemma.lemma_type) for lemma in glossing_dict.get(key, ())])
+    return hashlib.sha256(repr(senses).encode("utf-8")).hexdigest()
@@ -0,0 +1,214 @@
+import json
+import re
+import time
+from contextlib import nullcontext
+
+
+class PipelineMetrics:
+    """
+    The time and the number of calls of each stage of the pipeline (stages may be nested), and counters of events,
+    in total and for each file. When nothing is measured, NULL_METRICS is used instead.
+    """
+    PROMETHEUS_PREFIX = "khoekhoe_"
+
+    def __init__(self, detailed: bool = False):
+        """
+        :param detailed: whether to measure also the rules which have many instances (each misspelling rule and each
+                         entry of the glossing dictionary), e.g., for profiling (see PipelineProfiler). They are not
+                         measured by default, since there are thousands of them.
+        """
+        self.detailed = detailed
+        self.stages = {}            # {(stage, rule) : [calls, seconds]}, rule is "" for stages without rules
+        self.counters = {}          # {counter : value}
+        self.files = {}             # {file name : {"stages": {stage : [calls, seconds]}, "counters": {counter : value}}}
+        self.cur_file = None        # the record (in self.files) of the file which is being processed, if any
+        self.start_time = time.perf_counter()
+
+    def time(self, stage: str, rule: str = ""):
+        """
+        :param rule: the rule of the stage (e.g., the morpheme of a disambiguation rule), if it has several rules
+        :return: a context manager which adds the time of its block to the stage
+        """
+        return StageTimer(self, stage, rule)
+
+    def call(self, stage: str, function, *args, rule: str = ""):
+        """
+        Calls function with args and adds the time of the call to the stage.
+        :return: the return value of function
+        """
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.add_time(stage, rule, time.perf_counter() - start)
+
+    def time_file(self, file_name: str):
+        """
+        :return: a context manager which attributes the stages and the counters of its block to the file, and adds
+                 the time of the whole block to its "file" stage
+        """
+        return FileTimer(self, file_name)
+
+    def add_time(self, stage: str, rule: str, seconds: float):
+        record = self.stages.get((stage, rule))
+        if record is None:
+            record = self.stages[(stage, rule)] = [0, 0.0]
+        record[0] += 1
+        record[1] += seconds
+        if self.cur_file is not None:
+            record = self.cur_file["stages"].setdefault(stage, [0, 0.0])       # the rules are summed for each file
+            record[0] += 1
+            record[1] += seconds
+
+    def count(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+        if self.cur_file is not None:
+            file_counters = self.cur_file["counters"]
+            file_counters[counter] = file_counters.get(counter, 0) + value
+
+    def merge(self, other):
+        """
+        Adds the measurements of another instance, e.g., of a file which was processed in a worker process.
+        """
+        for key, (calls, seconds) in other.stages.items():
+            record = self.stages.setdefault(key, [0, 0.0])
+            record[0] += calls
+            record[1] += seconds
+        for counter, value in other.counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        self.files.update(other.files)
+
+    def get_report(self):
+        """
+        :return: {"elapsed_seconds": wall time since the instance was created,
+                  "stages": {stage : {"calls": n, "seconds": s, "rules": {rule : {"calls": n, "seconds": s}}}},
+                  "counters": {counter : value},
+                  "files": {file name : {"stages": {stage : {"calls": n, "seconds": s}}, "counters": {...}}}}.
+                 "rules" appears only in stages which have rules.
+        """
+        stages = {}
+        for (stage, rule), (calls, seconds) in self.stages.items():
+            stage_report = stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            stage_report["calls"] += calls
+            stage_report["seconds"] += seconds
+            if rule:
+                stage_report.setdefault("rules", {})[rule] = {"calls": calls, "seconds": round(seconds, 6)}
+        for stage_report in stages.values():
+            stage_report["seconds"] = round(stage_report["seconds"], 6)
+        files = {file_name: {"stages": {stage: {"calls": calls, "seconds": round(seconds, 6)}
+                                        for stage, (calls, seconds) in record["stages"].items()},
+                             "counters": dict(record["counters"])}
+                 for file_name, record in self.files.items()}
+        return {"elapsed_seconds": round(time.perf_counter() - self.start_time, 6),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "files": files}
+
+    def to_json(self):
+        return json.dumps(self.get_report(), ensure_ascii=False, indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        :return: the report in the Prometheus text exposition format
+        """
+        report = self.get_report()
+        prefix = self.PROMETHEUS_PREFIX
+        lines = ["# HELP " + prefix + "elapsed_seconds Wall time of the run.",
+                 "# TYPE " + prefix + "elapsed_seconds gauge",
+                 prefix + "elapsed_seconds " + str(report["elapsed_seconds"])]
+        for metric, field, description in (("stage_seconds_total", "seconds", "Wall time spent in each stage."),
+                                           ("stage_calls_total", "calls", "Number of calls of each stage.")):
+            lines.append("# HELP " + prefix + metric + " " + description)
+            lines.append("# TYPE " + prefix + metric + " counter")
+            for (stage, rule), (calls, seconds) in sorted(self.stages.items()):
+                labels = {"stage": stage, "rule": rule} if rule else {"stage": stage}
+                value = calls if field == "calls" else round(seconds, 6)
+                lines.append(prefix + metric + format_labels(labels) + " " + str(value))
+            for file_name, file_report in sorted(report["files"].items()):
+                for stage, stage_report in sorted(file_report["stages"].items()):
+                    labels = {"stage": stage, "file": file_name}
+                    lines.append(prefix + "file_" + metric + format_labels(labels) + " " + str(stage_report[field]))
+        lines.append("# HELP " + prefix + "events_total Number of events of each kind (e.g., dictionary hits).")
+        lines.append("# TYPE " + prefix + "events_total counter")
+        for counter, value in sorted(report["counters"].items()):
+            lines.append(prefix + "events_total" + format_labels({"event": counter}) + " " + str(value))
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, report_path: str):
+        """
+        Writes the report as Prometheus text if report_path ends with ".prom", and as JSON otherwise.
+        """
+        report = self.to_prometheus() if report_path.endswith(".prom") else self.to_json() + "\n"
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            report_file.write(report)
+
+
+class NullMetrics(PipelineMetrics):
+    """
+    The metrics of runs without instrumentation: nothing is measured.
+    """
+    NULL_CONTEXT = nullcontext()
+
+    def time(self, stage: str, rule: str = ""):
+        return self.NULL_CONTEXT
+
+    def call(self, stage: str, function, *args, rule: str = ""):
+        return function(*args)
+
+    def time_file(self, file_name: str):
+        return self.NULL_CONTEXT
+
+    def count(self, counter: str, value: int = 1):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class StageTimer:
+    __slots__ = ("metrics", "stage", "rule", "start")
+
+    def __init__(self, metrics: PipelineMetrics, stage: str, rule: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.rule = rule
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.stage, self.rule, time.perf_counter() - self.start)
+        return False
+
+
+class FileTimer(StageTimer):
+    __slots__ = ("file_name", "previous_file")
+
+    def __init__(self, metrics: PipelineMetrics, file_name: str):
+        super().__init__(metrics, "file", "")
+        self.file_name = file_name
+        self.previous_file = None
+
+    def __enter__(self):
+        self.previous_file = self.metrics.cur_file
+        self.metrics.cur_file = self.metrics.files.setdefault(self.file_name, {"stages": {}, "counters": {}})
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self.metrics.cur_file = self.previous_file
+        return False
+
+
+LABEL_ESCAPES = re.compile(r'[\\"\n]')
+
+
+def format_labels(labels: dict):
+    """
+    :return: the labels in the Prometheus format, e.g., {stage="cleaning",rule="ge"}
+    """
+    escapes = {"\\": "\\\\", '"': '\\"', "\n": "\\n"}
+    return "{" + ",".join(name + '="' + LABEL_ESCAPES.sub(lambda match: escapes[match.group()], value) + '"'
+                          for name, value in labels.items()) + "}"
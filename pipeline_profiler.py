@@ -0,0 +1,118 @@
+import cProfile
+import io
+import os
+import pstats
+from pipeline_metrics import PipelineMetrics
+
+
+class PipelineProfiler:
+    """
+    Profiles a run of the pipeline with cProfile and detailed metrics, and ranks the stages, the files, the misspelling
+    rules and the entries of the glossing dictionary by their time.
+    """
+    # (file name, function name, stage) of the functions which implement the stages. The stages may be nested.
+    STAGE_FUNCTIONS = (("glosses_dictionary_parser.py", "parse_dicts_from_file", "dictionary loading"),
+                       ("elan.py", "read_eaf", "parsing"),
+                       ("preprocessor.py", "find_capitalized_words", "capitalized words detection"),
+                       ("preprocessor.py", "preprocess_file", "preprocessing"),
+                       ("annotation_cleaner.py", "validate_encoding", "encoding validation"),
+                       ("language_identifier.py", "identify_english", "language detection"),
+                       ("annotation_cleaner.py", "clean_annotation", "cleaning"),
+                       ("spelling_corrector.py", "correct", "misspellings correction"),
+                       ("morpheme_breaker.py", "break_annotation_to_morphemes", "segmentation"),
+                       ("eaf_parser.py", "tokenize_all_tx_tiers", "tokenization"),
+                       ("single_eaf_glosser.py", "gloss_all_annotations", "glossing"),
+                       ("khoekhoe_disambiguator.py", "disambiguate", "dictionary disambiguation"),
+                       ("eaf_parser.py", "save_file", "saving"))
+    REPORT_FILE_NAME = "profile_report.txt"        # the ranked reports and the functions with the most cumulative time
+    PROFILE_FILE_NAME = "profile.pstats"           # the raw profile, for pstats or other profile viewers
+    METRICS_FILE_NAME = "metrics.json"             # the detailed metrics (see PipelineMetrics.get_report)
+    TOP_ENTRIES = 20                    # the number of entries in each ranked report
+
+    def __init__(self, report_directory: str, top_entries: int = TOP_ENTRIES):
+        self.report_directory = report_directory
+        self.top_entries = top_entries
+        self.metrics = PipelineMetrics(detailed=True)
+        self.profile = cProfile.Profile()
+
+    def run(self, function, *args, **kwargs):
+        """
+        Calls function (e.g., main.process_all_files) under the profiler. It should add its measurements to
+        self.metrics.
+        :return: the return value of function
+        """
+        return self.profile.runcall(function, *args, **kwargs)
+
+    def get_stages_times(self, stats: pstats.Stats):
+        """
+        :return: a list of (stage, calls, cumulative seconds) tuples, sorted by the cumulative time
+        """
+        stages_functions = {(file_name, function_name): stage
+                            for file_name, function_name, stage in self.STAGE_FUNCTIONS}
+        stages_times = {}
+        for (file_path, _, function_name), (_, calls, _, cumulative, _) in stats.stats.items():
+            stage = stages_functions.get((os.path.basename(file_path), function_name))
+            if stage is not None:
+                stage_calls, stage_time = stages_times.get(stage, (0, 0.0))
+                stages_times[stage] = (stage_calls + calls, stage_time + cumulative)
+        return sorted(((stage, calls, cumulative) for stage, (calls, cumulative) in stages_times.items()),
+                      key=lambda stage_time: -stage_time[2])
+
+    def get_ranked_rules(self, stage: str):
+        """
+        :return: a list of the top (rule, calls, seconds) tuples of the stage, sorted by the total time of the rule
+        """
+        rules = [(rule, calls, seconds) for (cur_stage, rule), (calls, seconds) in self.metrics.stages.items()
+                 if cur_stage == stage and rule]
+        rules.sort(key=lambda rule_time: -rule_time[2])
+        return rules[:self.top_entries]
+
+    def get_slowest_files(self):
+        """
+        :return: a list of the top (file name, seconds) tuples, sorted by the processing time of the file
+        """
+        files = [(file_name, record["stages"]["file"][1]) for file_name, record in self.metrics.files.items()
+                 if "file" in record["stages"]]
+        files.sort(key=lambda file_time: -file_time[1])
+        return files[:self.top_entries]
+
+    def format_report(self, stats: pstats.Stats):
+        lines = ["Time by stage (cumulative time of the stage's functions; the stages may be nested)"]
+        for stage, calls, cumulative in self.get_stages_times(stats):
+            lines.append("  {:<30} {:>10.3f}s {:>10} calls".format(stage, cumulative, calls))
+
+        lines.append("")
+        lines.append("Slowest files")
+        for file_name, seconds in self.get_slowest_files():
+            lines.append("  {:>10.3f}s  {}".format(seconds, file_name))
+
+        for stage, title in (("misspelling rules", "Slowest misspelling rules (misspellings_correction.json)"),
+                             ("dictionary disambiguation",
+                              "Most expensive entries of the glossing dictionary (in disambiguate)")):
+            lines.append("")
+            lines.append(title)
+            for rule, calls, seconds in self.get_ranked_rules(stage):
+                lines.append("  {:>10.4f}s {:>8} calls {:>10.1f}us/call  {}".format(seconds, calls,
+                                                                                   seconds / calls * 1e6, rule))
+
+        lines.append("")
+        lines.append("Functions with the highest cumulative time")
+        functions_stream = io.StringIO()
+        pstats.Stats(self.profile, stream=functions_stream).sort_stats("cumulative").print_stats(self.top_entries)
+        lines.append(functions_stream.getvalue())
+        return "\n".join(lines)
+
+    def write_reports(self):
+        """
+        Writes the report files (see REPORT_FILE_NAME etc.) to the report directory.
+        :return: the path of the main report
+        """
+        os.makedirs(self.report_directory, exist_ok=True)
+        self.profile.create_stats()
+        stats = pstats.Stats(self.profile)
+        stats.dump_stats(os.path.join(self.report_directory, self.PROFILE_FILE_NAME))
+        self.metrics.write_report(os.path.join(self.report_directory, self.METRICS_FILE_NAME))
+        report_path = os.path.join(self.report_directory, self.REPORT_FILE_NAME)
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            report_file.write(self.format_report(stats))
+        return report_path
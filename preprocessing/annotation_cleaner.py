@@ -1,5 +1,6 @@
 import json
-import re
+from preprocessing.spelling_corrector import SpellingCorrector
+from pipeline_metrics import PipelineMetrics
 
 class AnnotationCleaner:
     MISSPELLINGS_DICTS_PATH = "input\\misspellings_correction.json"
@@ -15,13 +16,31 @@ class AnnotationCleaner:
                                    ("ī", "ī"), ("Ī", "Ī"), ("ō", "ō"), ("Ō", "Ō"), ("ū", "ū"), ("Ū", "Ū")]
     CLICK_CHARS_VALIDITY_LIST = [("!", "ǃ"), ("#", "ǂ"), ("||", "ǁ"), ("|", "ǀ"), ("=", "ǂ")]
 
-    def __init__(self):
+    def __init__(self, metrics: PipelineMetrics = None, spelling_corrector: SpellingCorrector = None):
+        """
+        :param metrics: if it is detailed, the time of each misspelling rule is added to it (see SpellingCorrector)
+        :param spelling_corrector: the misspellings rules, already compiled (see create_spelling_corrector). If None,
+                                   they are read from MISSPELLINGS_DICTS_PATH and compiled for this instance
+        """
         self.cur_annotation = None                                                 # cur_annotation is a list of strings
-        self.misspellings_dicts = self.read_misspellings_dicts_json()
-        self.misspellings_patterns_and_replacements = self.misspellings_dicts['misspellingsPatternsAndReplacements']       # a dict
+        self.capitalized_lookups = {}       # {word : whether it was a capitalized word}, see decapitalize_annotation
+        if spelling_corrector is None:
+            spelling_corrector = self.create_spelling_corrector(metrics)
+        self.spelling_corrector = spelling_corrector
+
+    @classmethod
+    def create_spelling_corrector(cls, metrics: PipelineMetrics = None):
+        """
+        Reads the misspellings rules and compiles them once, so they can be shared by several instances.
+        :return: SpellingCorrector
+        """
+        misspellings_dicts = cls.read_misspellings_dicts_json()
+        misspellings_patterns_and_replacements = misspellings_dicts['misspellingsPatternsAndReplacements']     # a dict
+        return SpellingCorrector(misspellings_patterns_and_replacements, metrics)
 
-    def read_misspellings_dicts_json(self):
-        with open(self.MISSPELLINGS_DICTS_PATH, encoding="utf8") as json_file:
+    @classmethod
+    def read_misspellings_dicts_json(cls):
+        with open(cls.MISSPELLINGS_DICTS_PATH, encoding="utf8") as json_file:
             return json.load(json_file)
 
     def set_annotation(self, annotation: str):
@@ -47,9 +66,7 @@ class AnnotationCleaner:
     def fix_orthography_in_tx_tier(self):
         ann_str_result = (" ".join(self.cur_annotation)).replace("  ", " ").strip()
         ann_str_result = ann_str_result.replace("   ", " ").strip()
-        for pattern in self.misspellings_patterns_and_replacements:
-            ann_str_result = re.sub(pattern, self.misspellings_patterns_and_replacements[pattern], ann_str_result)
-        return ann_str_result
+        return self.spelling_corrector.correct(ann_str_result)
 
     def validate_fte_backchannel(self, fte: str):
         if fte.lower().replace(" ", "") in {"[backchannel]", "[backchanel]", "[backhannel]",
@@ -93,7 +110,9 @@ class AnnotationCleaner:
         return word
 
     def decapitalize_annotation(self, capitalized_words_set):
-        if self.cur_annotation[0] not in capitalized_words_set:
+        is_capitalized = self.cur_annotation[0] in capitalized_words_set
+        self.capitalized_lookups[self.cur_annotation[0]] = is_capitalized     # the output depends only on these words
+        if not is_capitalized:
             self.cur_annotation[0] = self.cur_annotation[0].lower()
 
     def handle_lexical_backchannel(self, fte: str):
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+from langdetect.lang_detect_exception import LangDetectException
+
+
+class LangdetectBackend:
+    """
+    The default language identification backend, based on langdetect.
+    The language profiles are loaded once per process (and not per annotation or per file), and each detection is
+    seeded, so the same text is always classified the same way.
+    """
+    _factory = None             # the DetectorFactory with the loaded profiles, shared by all the instances
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    def __call__(self, text: str):
+        """
+        :return: the code of the detected language (e.g., "en"), or None if no language can be detected in text
+        """
+        if LangdetectBackend._factory is None:
+            factory = DetectorFactory()
+            factory.load_profile(PROFILES_DIRECTORY)
+            LangdetectBackend._factory = factory
+        detector = LangdetectBackend._factory.create()
+        detector.seed = self.seed
+        detector.append(text)
+        try:
+            return detector.detect()
+        except LangDetectException:         # e.g., the text contains only digits and punctuation
+            return None
+
+
+class LanguageIdentifier:
+    """
+    Identifies which tx annotations are in English.
+    Texts that contain Khoekhoe characters (clicks or vowels with circumflex/macron) are never sent to the backend,
+    and the results of the backend are cached by the normalized text.
+    """
+    NON_ENGLISH_CHARACTERS = frozenset("ǃǂǁǀâêîôûāēīōūÂÊÎÔÛĀĒĪŌŪ")
+    ENGLISH_CODE = "en"
+    DEFAULT_CACHE_SIZE = 100000
+
+    def __init__(self, detect_language=None, seed: int = 0, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param detect_language: a function that gets a text and returns its language code. If None, langdetect is used
+                                (see LangdetectBackend)
+        :param seed: the seed of the default backend
+        """
+        self.detect_language = detect_language if detect_language is not None else LangdetectBackend(seed)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()          # normalized text -> whether it is in English
+
+    def identify_english(self, texts):
+        """
+        Classifies a batch of texts (e.g., all the tx annotations of a file). Each distinct text is classified once.
+        :return: a list of booleans, True for each text in English
+        """
+        normalized_texts = [normalize_text(text) for text in texts]
+        results = {}
+        for normalized_text in normalized_texts:
+            if normalized_text not in results:
+                results[normalized_text] = self.is_english(normalized_text)
+        return [results[normalized_text] for normalized_text in normalized_texts]
+
+    def is_english(self, normalized_text: str):
+        if not self.NON_ENGLISH_CHARACTERS.isdisjoint(normalized_text):
+            return False
+        is_english = self.cache.get(normalized_text)
+        if is_english is not None:
+            self.cache.move_to_end(normalized_text)
+            return is_english
+        is_english = self.detect_language(normalized_text) == self.ENGLISH_CODE
+        self.cache[normalized_text] = is_english
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return is_english
+
+
+def normalize_text(text: str):
+    return " ".join(text.split())
@@ -1,9 +1,17 @@
+import hashlib
 import re
+from preprocessing.suffix_trie import SuffixTrie
+from preprocessing.segmentation_cache import SegmentationCache
 
 
 class MorphemeBreaker:
     PGN_MORPHEMES = ["ta", "khom", "ge", "da", "ts", "kho", "ro", "go", "so", "du", "b", "s", "kha", "ra", "gu", "di", "n"]
                     # PGN_MORPHEMES is a list because the order matters! For example, "ts" should be checked before "s"
+    PGN_SUFFIX_TRIE = SuffixTrie(PGN_MORPHEMES)                 # keeps the order of PGN_MORPHEMES
+    VALENCY_CHANGING_SUFFIXES = ["bahe", "he", "basen", "sen", "babi", "basi", "bate", "ba"]        # the order matters
+    VALENCY_CHANGING_SUFFIX_TRIE = SuffixTrie(VALENCY_CHANGING_SUFFIXES)
+    OBLIQUE_ENDINGS = ["ga", "de", "a", "e"]                    # the order matters
+    OBLIQUE_ENDINGS_TRIE = SuffixTrie(OBLIQUE_ENDINGS)
     OBLIQUE_SUFFIXES = {"khoma", "tsa"}
     CONJUNCTIONS = {"î", "o", "osa", "xawe", "tsî", "hîa", "amaga", "ǁnā-amaga", "ǃnâ", "so", "tamas_ka_i_o",
                     "tsîna", "tare-i_ǃaroma", "tamas_kara_i_o", "maar", "want", "xuige", "xui-ao", "îa", "hîna"}
@@ -18,27 +26,52 @@ class MorphemeBreaker:
     CLITIC_SEPARATOR = "="
     SUFFIX_SEPARATOR = "-"
     CLICKS_SET = {"ǃ", "ǂ", "ǁ", "ǀ"}
+    CONTEXT_NEXT_WORDS = FIRST_PERSON_PGNS | {"ai"}     # the only next words that can change a word's segmentation
 
-    def __init__(self, tx_annotation: str, fte_annotation: str, forms_not_to_segment: set,
-                 nominals_not_to_segment: set, paralinguistic_items: dict, adverbs: set):
-        self.forms_not_to_segment = forms_not_to_segment
-        self.nominals_not_to_segment = nominals_not_to_segment
-        self.ann_lst = tx_annotation.split()
-        self.fte_annotation = fte_annotation
+    def __init__(self, forms_not_to_segment: set, nominals_not_to_segment: set, paralinguistic_items: dict,
+                 adverbs: set, segmentation_cache: SegmentationCache = None):
+        """
+        A MorphemeBreaker is created once and then used for all the annotations, so the lookup sets
+        (including the unions of sets which are checked together) are built here only once.
+        :param segmentation_cache: a cache of word segmentations, which may be shared by several MorphemeBreakers
+                                   with the same resources. If None, a new cache is used.
+        """
+        self.forms_not_to_segment = frozenset(forms_not_to_segment)
+        self.nominals_not_to_segment = frozenset(nominals_not_to_segment)
+        self.adverbs = frozenset(adverbs)
+        self.back_channels = frozenset(paralinguistic_items["BackChannels"])
+        self.fillers = frozenset(paralinguistic_items["Fillers"])
+        self.paralinguistic_words = self.back_channels | self.fillers
+        self.words_not_to_segment = self.forms_not_to_segment | self.nominals_not_to_segment
+        self.conjunctions_and_adverbs = frozenset(self.CONJUNCTIONS) | self.adverbs
+        self.clitic_hosts = self.conjunctions_and_adverbs | self.forms_not_to_segment     # words that PGN is a clitic of
+        self.ann_lst = []
+        self.fte_annotation = ""
         self.cur_word = None
         self.previous_word = None
         self.next_word = None
         self.skip_next = False
-        self.back_channels = set(paralinguistic_items["BackChannels"])
-        self.fillers = set(paralinguistic_items["Fillers"])
-        self.adverbs = adverbs
+        self.is_english_fte = False
+        self.is_reflexive_fte = False
+        self.segmentation_cache = segmentation_cache if segmentation_cache is not None else SegmentationCache()
+        self.segmentation_cache.bind(get_resources_fingerprint(forms_not_to_segment, nominals_not_to_segment,
+                                                               paralinguistic_items, adverbs))
 
-    def break_annotation_to_morphemes(self):
+    def break_annotation_to_morphemes(self, tx_annotation: str, fte_annotation: str):
         """
-        Performs morpheme segmentation of self.cur_word.
+        Performs morpheme segmentation of all the words in tx_annotation.
+        :param tx_annotation: the (clean) tx annotation to segment
+        :param fte_annotation: its translation
         :return: the result as a String
         """
+        self.ann_lst = tx_annotation.split()
+        self.fte_annotation = fte_annotation
+        self.cur_word = None
+        self.previous_word = None
+        self.next_word = None
         self.skip_next = False
+        self.is_english_fte = fte_annotation == "[English]"
+        self.is_reflexive_fte = "self" in fte_annotation or "selves" in fte_annotation
         for i in range(len(self.ann_lst)):
             if i > 0:
                 self.previous_word = self.ann_lst[i-1]
@@ -50,63 +83,89 @@ class MorphemeBreaker:
             if self.skip_next:
                 self.skip_next = False
                 continue
-            # The following condition must appear here, before calling "is_breakable" method
-            if self.cur_word in self.back_channels or self.cur_word in self.fillers:
-                self.ann_lst[i] = "[" + self.ann_lst[i] + "]"
-                continue
+            context_key = self.get_context_key(i)
+            segmentation = self.segmentation_cache.get(context_key)
+            if segmentation is None:
+                segmentation = self.segment_word(i)
+                self.segmentation_cache.put(context_key, segmentation)
+            self.ann_lst[i], is_next_word_clitic = segmentation
+            if is_next_word_clitic:                 # a PGN separated by space from a hortative particle
+                self.ann_lst[i+1] = self.CLITIC_SEPARATOR + self.ann_lst[i+1]
+            self.skip_next = is_next_word_clitic
+        return " ".join(self.ann_lst)
 
-            if self.segment_hortatives():
-                self.ann_lst[i] = self.cur_word
-                if self.next_word:
-                    self.ann_lst[i+1] = self.next_word
-                continue
+    def get_context_key(self, i):
+        """
+        The segmentation of the i-th word depends only on the word itself and on the features in this key,
+        so it is used as the key of the segmentation cache.
+        """
+        next_word = self.next_word if self.next_word in self.CONTEXT_NEXT_WORDS else None
+        return (self.cur_word, self.get_previous_word_class(), next_word, i == 0, i == len(self.ann_lst) - 1,
+                self.ann_lst[0] == "inaudible", self.is_english_fte, self.is_reflexive_fte)
 
-            if self.cur_word.startswith("tsîna"):
-                self.ann_lst[i] = self.segment_oblique(self.cur_word)
-                continue
+    def get_previous_word_class(self):
+        """
+        :return: the class of self.previous_word, as far as segment_free_pgn is concerned
+        """
+        if not self.previous_word:
+            return None
+        elif self.previous_word in self.CONJUNCTIONS:
+            return "conjunction"
+        elif self.previous_word in self.PERSONAL_PRO_STEMS:
+            return "personal_pronoun"
+        elif self.previous_word in self.DEMONSTRATIVES:
+            return "demonstrative"
+        return "other"
 
-            if not self.is_breakable():               # If a word should not be segmented --> continue to the next iteration
-                continue
+    def segment_word(self, i):
+        """
+        Performs morpheme segmentation of self.cur_word, the i-th word of the annotation.
+        :return: a tuple of the segmented word and whether the next word should be marked as its clitic
+        """
+        # The following condition must appear here, before calling "is_breakable" method
+        if self.cur_word in self.paralinguistic_words:
+            return "[" + self.cur_word + "]", False
 
-            if self.segment_adv():                    # Segments =se =MANNER from axase and tamase
-                self.ann_lst[i] = self.cur_word
-                continue
-            if self.segment_free_pgn():               # handle free PGNs, as 'ta' (1SG) and 'da' (1PL)
-                if i == 0 and self.cur_word[0] in {"-", "="}:
-                    self.cur_word = self.cur_word[1:]
-                self.ann_lst[i] = self.cur_word
-                continue
-            if self.segment_hyphened_pgn():
-                self.ann_lst[i] = self.cur_word
-                continue
-            segmented_val_changing = self.segment_valency_changing_operators(self.cur_word, i)
-            if segmented_val_changing:
-                self.ann_lst[i] = segmented_val_changing
-                continue
-            pgn_segmented = self.segment_pgn(self.cur_word)
-            if pgn_segmented:
-                if i == 0 and self.cur_word[0] in {"-", "="}:
-                    self.cur_word = self.cur_word[1:]
-                self.ann_lst[i] = pgn_segmented
-                continue
-            segmented_oblique = self.segment_oblique(self.cur_word)
-            if segmented_oblique:
-                self.ann_lst[i] = segmented_oblique
+        if self.segment_hortatives():
+            return self.cur_word, self.skip_next
 
-        return " ".join(self.ann_lst)
+        if self.cur_word.startswith("tsîna"):
+            return self.segment_oblique(self.cur_word), False
+
+        if not self.is_breakable():                   # If a word should not be segmented --> continue to the next word
+            return self.cur_word, False
+
+        if self.segment_adv():                        # Segments =se =MANNER from axase and tamase
+            return self.cur_word, False
+        if self.segment_free_pgn():                   # handle free PGNs, as 'ta' (1SG) and 'da' (1PL)
+            if i == 0 and self.cur_word[0] in {"-", "="}:
+                self.cur_word = self.cur_word[1:]
+            return self.cur_word, False
+        if self.segment_hyphened_pgn():
+            return self.cur_word, False
+        segmented_val_changing = self.segment_valency_changing_operators(self.cur_word, i)
+        if segmented_val_changing:
+            return segmented_val_changing, False
+        pgn_segmented = self.segment_pgn(self.cur_word)
+        if pgn_segmented:
+            return pgn_segmented, False
+        segmented_oblique = self.segment_oblique(self.cur_word)
+        if segmented_oblique:
+            return segmented_oblique, False
+        return self.cur_word, False
 
     def is_breakable(self):
         """
         Checks whether self.cur_word can be segmented or not.
         :return: True if the given word can be segmented, otherwise False.
         """
-        if self.fte_annotation == "[English]":                    # if it's a sentence in English
+        if self.is_english_fte:                                   # if it's a sentence in English
             return False
         elif self.ann_lst[0] and self.ann_lst[0] == "inaudible":
             return False
-        elif self.cur_word in self.forms_not_to_segment.union(self.nominals_not_to_segment):
+        elif self.cur_word in self.words_not_to_segment:
             return False
-        elif self.cur_word in self.CONJUNCTIONS.union(self.adverbs):
+        elif self.cur_word in self.conjunctions_and_adverbs:
             return False
         elif self.cur_word.endswith("se") and self.cur_word not in self.ADVERBIAL_CLAUSES:
             return False
@@ -159,26 +218,25 @@ class MorphemeBreaker:
         Segments pgn suffixes and enclitics of a given word.
         :return: If word ends with pgn --> returns the segmented string, otherwise --> returns None
         """
-        for morpheme in self.PGN_MORPHEMES:
-            if word.endswith(morpheme):
-                prefix = word[:-len(morpheme)]
-                if len(prefix) == 0 or prefix[-1] in self.CLICKS_SET:
-                    continue
-                if prefix in self.DIMINUTIZED_FORMS:                                        # -DIM suffix
-                    prefix = prefix[:-2] + " -ro"
-                if prefix in self.CONJUNCTIONS.union(self.forms_not_to_segment).union(self.adverbs):
-                    if prefix == "ai" and morpheme == "s" and self.next_word == "ai":       # if it is: "ais ai"
-                        separator_type = self.SUFFIX_SEPARATOR
-                    elif prefix in self.PERSONAL_PRO_STEMS:                                 # for example: tita, sādu --> ti -ta, sā -du
-                        separator_type = self.SUFFIX_SEPARATOR
-                    else:
-                        separator_type = self.CLITIC_SEPARATOR
-                else:
+        for morpheme in self.PGN_SUFFIX_TRIE.find_suffixes(word):          # only the PGNs that word ends with
+            prefix = word[:-len(morpheme)]
+            if len(prefix) == 0 or prefix[-1] in self.CLICKS_SET:
+                continue
+            if prefix in self.DIMINUTIZED_FORMS:                                        # -DIM suffix
+                prefix = prefix[:-2] + " -ro"
+            if prefix in self.clitic_hosts:
+                if prefix == "ai" and morpheme == "s" and self.next_word == "ai":       # if it is: "ais ai"
+                    separator_type = self.SUFFIX_SEPARATOR
+                elif prefix in self.PERSONAL_PRO_STEMS:                                 # for example: tita, sādu --> ti -ta, sā -du
                     separator_type = self.SUFFIX_SEPARATOR
-                return prefix + " " + separator_type + morpheme
+                else:
+                    separator_type = self.CLITIC_SEPARATOR
+            else:
+                separator_type = self.SUFFIX_SEPARATOR
+            return prefix + " " + separator_type + morpheme
         if word.endswith("i") and self.segment_i_pgn(word):               # 3C.SG PGN ('i')
             return word[:-1] + " -i"
-        if word.endswith("m") and word[:-1] in self.CONJUNCTIONS.union(self.adverbs):
+        if word.endswith("m") and word[:-1] in self.conjunctions_and_adverbs:
             return word[:-1] + " " + self.CLITIC_SEPARATOR + "m"          # Cases like: 'xawem', 'tsî'
 
         return None
@@ -195,25 +253,28 @@ class MorphemeBreaker:
         return False
 
     def segment_valency_changing_operators(self, word, idx):
-        if word.endswith("bahe"):                                         # APPL + PASS
-            return word[:-4] + " -ba" + " -he"
-        elif word.endswith("he") and len(word) > 2:                       # PASS
-            return word[:-2] + " -he"
-        elif word.endswith("basen"):                                      # APPL + REFL
-            return word[:-5] + " -ba" + " -sen"
-        elif word.endswith("sen"):
-            if "self" in self.fte_annotation or "selves" in self.fte_annotation:
-                return word[:-3] + " -sen"
-            else:
-                return word
-        elif word.endswith("babi") or word.endswith("basi") or word.endswith("bate"):         # APPL + OBJ marker
-            return word[:-4] + " -ba " + word[-2:]                                            # OBJ markers should be separated with space
-        elif word.endswith("ba") and idx == len(self.ann_lst) - 1:                            # APPL in the end of sentences
-            return word[:-2] + " -ba"
+        for suffix in self.VALENCY_CHANGING_SUFFIX_TRIE.find_suffixes(word):    # ordered as VALENCY_CHANGING_SUFFIXES
+            if suffix == "bahe":                                                # APPL + PASS
+                return word[:-4] + " -ba" + " -he"
+            elif suffix == "he" and len(word) > 2:                              # PASS
+                return word[:-2] + " -he"
+            elif suffix == "basen":                                             # APPL + REFL
+                return word[:-5] + " -ba" + " -sen"
+            elif suffix == "sen":
+                if self.is_reflexive_fte:
+                    return word[:-3] + " -sen"
+                else:
+                    return word
+            elif suffix in {"babi", "basi", "bate"}:                            # APPL + OBJ marker
+                return word[:-4] + " -ba " + word[-2:]                          # OBJ markers should be separated with space
+            elif suffix == "ba" and idx == len(self.ann_lst) - 1:               # APPL in the end of sentences
+                return word[:-2] + " -ba"
         return None
 
     def segment_oblique(self, word):
-        if word.endswith("ga"):
+        endings = self.OBLIQUE_ENDINGS_TRIE.find_suffixes(word)
+        ending = endings[0] if endings else None
+        if ending == "ga":
             if word[-3] not in self.CLICKS_SET:
                 pgn_segmented = self.segment_pgn(word[:-2] + "gu")
                 if pgn_segmented:
@@ -226,15 +287,15 @@ class MorphemeBreaker:
             if optional_clitic:
                 return "tsîn -a =" + optional_clitic
             return "tsîn -a"
-        elif word.endswith("de"):
+        elif ending == "de":
             pgn_segmented = self.segment_pgn(word[:-2] + "di")
             if pgn_segmented:
                 return pgn_segmented + " -a"
-        elif word.endswith("a"):
+        elif ending == "a":
             pgn_segmented = self.segment_pgn(word[:-1])
             if pgn_segmented:
                 return pgn_segmented + " -a"
-        elif word.endswith("e"):                        # xamme > xamm -i -a
+        elif ending == "e":                             # xamme > xamm -i -a
             if self.segment_i_pgn(word[:-1] + "i"):
                 return word[:-1] + " -i" + " -a"
         else:
@@ -260,3 +321,12 @@ class MorphemeBreaker:
                         self.cur_word = hortative + " " + self.CLITIC_SEPARATOR + rest_of_word
                         return True
             return False
+
+
+def get_resources_fingerprint(forms_not_to_segment, nominals_not_to_segment, paralinguistic_items: dict, adverbs):
+    """
+    :return: a hash of the resources that the segmentation depends on, used for validating the segmentation cache
+    """
+    resources = (sorted(forms_not_to_segment), sorted(nominals_not_to_segment),
+                 sorted(paralinguistic_items["BackChannels"]), sorted(paralinguistic_items["Fillers"]), sorted(adverbs))
+    return hashlib.sha256(repr(resources).encode("utf-8")).hexdigest()
@@ -2,7 +2,10 @@ from speach import elan
 import eaf_parser
 import preprocessing.annotation_cleaner as annotation_cleaner
 import preprocessing.morpheme_breaker as morpheme_breaker
-import langdetect
+from preprocessing.segmentation_cache import SegmentationCache
+from preprocessing.language_identifier import LanguageIdentifier
+from preprocessing.spelling_corrector import SpellingCorrector
+from pipeline_metrics import PipelineMetrics, NULL_METRICS
 
 
 class Preprocessor:
@@ -11,24 +14,51 @@ class Preprocessor:
     NON_CAPITALIZED_WORDS = {"Skoli", "Skol", "Tsî", "ǁNā", "ǀGui", "ǁÎb", "Ā", "ǂGuro", "ǁAri", "Xawe"}
 
     def __init__(self, input_eaf_path, output_eaf_path, capitalized_words_path, auto_detect_english: bool,
-                 capitalized_words: set, words_not_to_segment: dict, paralinguistic_items: dict, adverbs: set):
+                 capitalized_words: set, words_not_to_segment: dict, paralinguistic_items: dict, adverbs: set,
+                 eaf: elan.Doc = None, segmentation_cache: SegmentationCache = None,
+                 language_identifier: LanguageIdentifier = None, metrics: PipelineMetrics = None,
+                 spelling_corrector: SpellingCorrector = None):
+        """
+        :param output_eaf_path: if None, the preprocessed file is not saved, and the result is kept only in self.eaf
+        :param capitalized_words_path: if None, new capitalized words are only added to capitalized_words
+                                       and are not written to the file
+        :param eaf: an already parsed Doc object of the input file. If None, it is read from input_eaf_path
+        :param segmentation_cache: a cache of word segmentations shared between files. If None, a new one is used
+        :param language_identifier: used for detecting English parts (if auto_detect_english is True).
+                                    If None, a new one is used
+        :param metrics: the PipelineMetrics to which the times of the preprocessing stages are added, or None
+        :param spelling_corrector: the compiled misspellings rules, shared between files. If None, they are read and
+                                   compiled for this file (see AnnotationCleaner)
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
         self.adverbs = adverbs
         self.forms_not_to_segment = set(words_not_to_segment["FormsNotToSegment"])
         self.nominals_not_to_segment = set(words_not_to_segment["NominalsNotToSegment"])
         self.input_path = input_eaf_path
         self.output_path = output_eaf_path
-        self.eaf = elan.read_eaf(input_eaf_path)            # Doc object
+        self.eaf = eaf if eaf is not None else elan.read_eaf(input_eaf_path)            # Doc object
         self.eaf_parser = eaf_parser.EAF_Parser(self.eaf)
+        self.tiers = self.eaf_parser.tiers                                              # the Tier objects, taken from the document's TierMap
         self.tx_indexes = self.eaf_parser.get_tx_indexes()
         self.speakers_num = len(self.tx_indexes)
         self.tx_to_fte = self.eaf_parser.get_tx_fte_annotations_mapping()
         self.tx_to_orig_idx_dict = self.eaf_parser.get_tx_to_orig_tiers_mapping()      # mapping between indexes of tx tiers to their corresponding orig tier indexes
-        self.annotation_cleaner = annotation_cleaner.AnnotationCleaner()
+        self.annotation_cleaner = annotation_cleaner.AnnotationCleaner(self.metrics, spelling_corrector)
         self.capitalized_words_set = capitalized_words
         self.paralinguistic_items = paralinguistic_items
-        new_capitalized_words = self.find_capitalized_words()                       # find and add new capitalized words to capitalized_words_set
-        write_new_capitalized(new_capitalized_words, capitalized_words_path)        # write the new capitalized words to the file
+        with self.metrics.time("capitalized words detection"):
+            new_capitalized_words = self.find_capitalized_words()                   # find and add new capitalized words to capitalized_words_set
+        if capitalized_words_path is not None:
+            write_new_capitalized(new_capitalized_words, capitalized_words_path)    # write the new capitalized words to the file
         self.automatically_detect_English = auto_detect_english
+        self.language_identifier = language_identifier
+        if auto_detect_english and language_identifier is None:
+            self.language_identifier = LanguageIdentifier()
+        self.morpheme_breaker = morpheme_breaker.MorphemeBreaker(self.forms_not_to_segment,
+                                                                 self.nominals_not_to_segment,
+                                                                 self.paralinguistic_items,
+                                                                 self.adverbs,
+                                                                 segmentation_cache)  # used for all the annotations
 
     def preprocess_file(self):
         """
@@ -39,54 +69,70 @@ class Preprocessor:
         4. Fixing misspellings in tx tier
         5. Cleaning - removing punctuation and decapitalizing
         6. Morphological segmentation
-        7. Saving as a new output file
+        7. Saving as a new output file (only if an output path was given)
+        :return: True if the file was preprocessed, False if its tiers format is invalid
         """
         if len(self.tx_indexes) != len(self.eaf_parser.orig_indexes) or \
                 len(self.tx_indexes) != len(self.eaf_parser.fte_indexes):
             print("There is a problem with the tiers format of input file " + self.input_path)
-            return
+            return False
 
         for tx_idx in self.tx_indexes:
             dst_orig_idx = self.tx_to_orig_idx_dict[tx_idx]
-            for tx_annotation in self.eaf.tiers()[tx_idx]:
-                self.annotation_cleaner.set_annotation(tx_annotation.value)
-                tx_annotation.value = self.annotation_cleaner.validate_encoding()            # validation of encoding must be done before copying to original tier
+            tx_annotations = list(self.tiers[tx_idx])
+            for tx_annotation in tx_annotations:
+                with self.metrics.time("encoding validation"):
+                    self.annotation_cleaner.set_annotation(tx_annotation.value)
+                    tx_annotation.value = self.annotation_cleaner.validate_encoding()        # validation of encoding must be done before copying to original tier
                 self.copy_tx_to_orig(dst_orig_idx, tx_annotation)
 
+            if self.automatically_detect_English:                   # all the annotations of the tier are classified at once
+                with self.metrics.time("language detection"):
+                    is_english_list = self.language_identifier.identify_english([ann.value for ann in tx_annotations])
+            else:
+                is_english_list = [False] * len(tx_annotations)
+
+            for tx_annotation, is_english in zip(tx_annotations, is_english_list):
+                self.metrics.count("utterances")
+                self.annotation_cleaner.set_annotation(tx_annotation.value)
                 cur_fte_annotation = ""  # Sometimes there is no translation available, so we first initiate this value to be an empty string
                 if tx_annotation.ID in self.tx_to_fte.keys():
                     cur_fte_annotation = self.eaf.annotation(self.tx_to_fte[tx_annotation.ID]).value  # the corresponding translation/fte annotation (String)
-                    cur_fte_annotation = self.annotation_cleaner.validate_fte_backchannel(cur_fte_annotation)
-                    cur_fte_annotation = self.annotation_cleaner.handle_lexical_backchannel(cur_fte_annotation)
+                    with self.metrics.time("cleaning"):
+                        cur_fte_annotation = self.annotation_cleaner.validate_fte_backchannel(cur_fte_annotation)
+                        cur_fte_annotation = self.annotation_cleaner.handle_lexical_backchannel(cur_fte_annotation)
                     self.eaf.annotation(self.tx_to_fte[tx_annotation.ID]).value = cur_fte_annotation
 
-                if (self.automatically_detect_English and langdetect.detect(tx_annotation.value) == "en") or \
-                        ("[english]" in cur_fte_annotation.lower()):                                 # English detection
+                if is_english or ("[english]" in cur_fte_annotation.lower()):                       # English detection
                     tx_annotation.value = "<English> " + tx_annotation.value
+                    self.metrics.count("English utterances")
                     continue
 
-                tx_annotation.value = self.annotation_cleaner.clean_annotation(self.capitalized_words_set)          # clean annotation
-                tx_annotation.value = self.annotation_cleaner.fix_orthography_in_tx_tier()
-                cur_morpheme_breaker = morpheme_breaker.MorphemeBreaker(tx_annotation.value,
-                                                                        cur_fte_annotation,
-                                                                        self.forms_not_to_segment,
-                                                                        self.nominals_not_to_segment,
-                                                                        self.paralinguistic_items,
-                                                                        self.adverbs)
-                tx_annotation.value = cur_morpheme_breaker.break_annotation_to_morphemes()                          # break/segment annotation to morphemes
+                with self.metrics.time("cleaning"):
+                    tx_annotation.value = self.annotation_cleaner.clean_annotation(self.capitalized_words_set)      # clean annotation
+                    tx_annotation.value = self.annotation_cleaner.fix_orthography_in_tx_tier()
+                with self.metrics.time("segmentation"):
+                    tx_annotation.value = self.morpheme_breaker.break_annotation_to_morphemes(tx_annotation.value,
+                                                                                              cur_fte_annotation)   # break/segment annotation to morphemes
 
-                self.annotation_cleaner.set_annotation(tx_annotation.value)
-                tx_annotation.value = self.annotation_cleaner.fix_orthography_in_tx_tier()
+                with self.metrics.time("cleaning"):
+                    self.annotation_cleaner.set_annotation(tx_annotation.value)
+                    tx_annotation.value = self.annotation_cleaner.fix_orthography_in_tx_tier()
 
-        self.eaf.save(self.output_path)                 # save and export to a new output eaf file
+        if self.output_path is not None:
+            with self.metrics.time("saving"):
+                self.eaf.save(self.output_path)         # save and export to a new output eaf file
+        return True
 
     def copy_tx_to_orig(self, dst_orig_idx, tx_annotation):
-        for orig_annotation in self.eaf.tiers()[dst_orig_idx]:
-            if orig_annotation.ref_id == tx_annotation.ID:                  # if there is already an existing annotation in orig
-                orig_annotation.value = tx_annotation.value                     # update the value
-                return
+        orig_tier = self.tiers[dst_orig_idx]
+        orig_annotation = self.eaf_parser.get_ref_id_index(dst_orig_idx).get(tx_annotation.ID)
+        if orig_annotation is not None:                                     # if there is already an existing annotation in orig
+            orig_annotation.value = tx_annotation.value                         # update the value
+            return
         # if there is no existing orig annotation, we will create a new one:
-        self.eaf.tiers()[dst_orig_idx].new_annotation(tx_annotation.value, ann_ref_id=tx_annotation.ID)          # copy to orig
+        orig_annotation = orig_tier.new_annotation(tx_annotation.value, ann_ref_id=tx_annotation.ID)          # copy to orig
+        self.eaf_parser.add_to_ref_id_index(orig_tier, orig_annotation)
 
     def find_capitalized_words(self):
         """
@@ -95,7 +141,7 @@ class Preprocessor:
         """
         new_capitalized_words = set()
         for tx_idx in self.tx_indexes:
-            cur_tx = self.eaf.tiers()[tx_idx]
+            cur_tx = self.tiers[tx_idx]
             for tx_annotation in cur_tx:
                 annot_word_list = tx_annotation.value.split()
                 for i in range(1, len(annot_word_list)):                   # iterating over all non-initial words in the tier
@@ -118,8 +164,9 @@ class Preprocessor:
                             if len(cur_word) > 1:
                                 char_to_check = cur_word[1]
                         if char_to_check.isupper():
-                            if cur_word not in self.capitalized_words_set.union(morpheme_breaker.MorphemeBreaker.CONJUNCTIONS,
-                                                                                self.forms_not_to_segment):
+                            if cur_word not in self.capitalized_words_set and \
+                                    cur_word not in morpheme_breaker.MorphemeBreaker.CONJUNCTIONS and \
+                                    cur_word not in self.forms_not_to_segment:
                                 new_capitalized_words.add(cur_word)
                                 self.capitalized_words_set.add(cur_word)
         return new_capitalized_words
@@ -127,5 +174,5 @@ class Preprocessor:
 
 def write_new_capitalized(new_capitalized_words, capitalized_words_path):
     with open(capitalized_words_path, "a", encoding='utf-8') as file:
-        for word in new_capitalized_words:
+        for word in sorted(new_capitalized_words):          # sorted, so the file doesn't depend on the order of the set
             file.write(word + "\n")
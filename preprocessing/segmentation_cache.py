@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from input_files_handler import InputFilesHandler
+
+
+class SegmentationCache:
+    """
+    A bounded (least recently used) cache of word segmentations.
+    The keys are built by MorphemeBreaker.get_context_key, i.e., a word together with all the context features that
+    its segmentation depends on, and the values are the results of MorphemeBreaker.segment_word.
+    """
+    VERSION = 1                 # must be incremented whenever the segmentation rules (MorphemeBreaker) change
+    DEFAULT_MAX_SIZE = 100000
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.new_entries = {}               # entries added since the last call to pop_updates
+        self.resources_fingerprint = None   # the fingerprint of the MorphemeBreaker resources the entries depend on
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, resources_fingerprint: str):
+        """
+        Binds the cache to the resources (words not to segment, adverbs etc.) of a MorphemeBreaker.
+        If the cached entries were computed with different resources, they are dropped.
+        """
+        if self.resources_fingerprint != resources_fingerprint:
+            self.entries.clear()
+            self.new_entries.clear()
+            self.resources_fingerprint = resources_fingerprint
+
+    def get(self, key):
+        """
+        :return: the cached segmentation, or None if key is not in the cache
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.new_entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)            # evict the least recently used entry
+
+    def pop_updates(self):
+        """
+        Used for sending the work of a worker process back to the parent process (see merge_updates).
+        :return: a tuple of (new entries, hits, misses) since the last call, and resets them
+        """
+        updates = (self.new_entries, self.hits, self.misses)
+        self.new_entries = {}
+        self.hits = 0
+        self.misses = 0
+        return updates
+
+    def merge_updates(self, updates):
+        new_entries, hits, misses = updates
+        for key, value in new_entries.items():
+            self.put(key, value)
+        self.hits += hits
+        self.misses += misses
+
+    def get_hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get_report(self):
+        return "Segmentation cache: {} hits, {} misses ({:.1%} hit rate), {} cached words".format(
+            self.hits, self.misses, self.get_hit_rate(), len(self.entries))
+
+    def load(self, cache_path: str):
+        """
+        Loads the entries saved by a previous run. Nothing is loaded if the file is missing or was saved by a
+        different version of the cache.
+        :return: True if the entries were loaded, False otherwise
+        """
+        cache = InputFilesHandler.read_pickle(cache_path)
+        if not isinstance(cache, dict) or cache.get("version") != self.VERSION:
+            return False
+        self.entries = OrderedDict(cache["entries"])
+        self.new_entries = {}
+        self.resources_fingerprint = cache["resources_fingerprint"]
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return True
+
+    def save(self, cache_path: str):
+        cache = {"version": self.VERSION,
+                 "resources_fingerprint": self.resources_fingerprint,
+                 "entries": self.entries}
+        InputFilesHandler.write_pickle(cache, cache_path)
@@ -0,0 +1,169 @@
+import re
+from itertools import product
+from pipeline_metrics import PipelineMetrics, NULL_METRICS
+
+try:
+    from re import _parser as sre_parse         # Python 3.11+
+except ImportError:
+    import sre_parse
+
+
+class SpellingCorrector:
+    """
+    Applies the misspellings rules (pairs of regex pattern and replacement) in their order, as a sequence of re.sub
+    calls, but without running the rules that cannot match.
+    For each rule, a set of literal strings is extracted from its pattern, such that every match of the pattern
+    contains one of them (e.g., "\\bsu(p|b)use\\b" -> {"supuse", "subuse"}). A rule is applied only if one of its
+    literals is found in the current annotation, so the result is exactly the same as applying all the rules.
+    All the literals are also compiled into a single trie-shaped regex, so an annotation which contains none of them
+    (which is the common case) is checked in one scan.
+    If detailed metrics are given, the time of each rule is added to their "misspelling rules" stage, with the rule's
+    pattern as the rule name.
+    """
+    MAX_LITERALS_PER_RULE = 64
+
+    def __init__(self, patterns_and_replacements: dict, metrics: PipelineMetrics = None):
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.rules = []                   # list of (compiled pattern, replacement, literals or None)
+        all_literals = set()
+        has_unconditional_rules = False
+        for pattern, replacement in patterns_and_replacements.items():
+            literals = self.find_required_literals(pattern)
+            if literals is None:
+                has_unconditional_rules = True
+            else:
+                all_literals.update(literals)
+            self.rules.append((re.compile(pattern), replacement, literals))
+        self.any_literal = None
+        if not has_unconditional_rules and all_literals:
+            self.any_literal = compile_trie_regex(all_literals)
+
+    def correct(self, annotation: str) -> str:
+        """
+        :return: the annotation after applying all the rules in their order
+        """
+        if self.any_literal is not None and self.any_literal.search(annotation) is None:
+            return annotation               # none of the rules can match
+        for pattern, replacement, literals in self.rules:
+            if literals is None or any(literal in annotation for literal in literals):
+                if self.metrics.detailed:
+                    annotation = self.metrics.call("misspelling rules", pattern.sub, replacement, annotation,
+                                                   rule=pattern.pattern)
+                else:
+                    annotation = pattern.sub(replacement, annotation)
+        return annotation
+
+    def find_required_literals(self, pattern: str):
+        """
+        Finds a set of literals such that every match of the pattern contains at least one of them.
+        The longest sequence of the pattern which can be expanded into a (small) set of strings is chosen.
+        :return: a tuple of literals, or None if there is no such set (then the rule is always applied)
+        """
+        try:
+            parsed = sre_parse.parse(pattern)
+        except re.error:
+            return None
+        if parsed.state.flags & re.IGNORECASE:
+            return None
+        best = None
+        cur = {""}
+        for item in parsed:
+            expanded = self.expand_item(item)
+            if expanded is not None:
+                cur = self.concat(cur, expanded)
+            if expanded is None or cur is None:
+                best = self.choose_more_selective(best, cur)
+                cur = {""}
+        best = self.choose_more_selective(best, cur)
+        return tuple(sorted(best)) if best is not None else None
+
+    def expand_item(self, item):
+        """
+        Expands a single item of a parsed pattern into the set of strings that it can match.
+        :return: a set of strings, or None if it cannot be expanded
+        """
+        op, av = item
+        if op is sre_parse.LITERAL:
+            return {chr(av)}
+        elif op is sre_parse.AT:                    # zero-width assertions (e.g., \b) do not consume characters
+            return {""}
+        elif op is sre_parse.IN:
+            if all(in_op is sre_parse.LITERAL for in_op, _ in av):
+                return {chr(val) for _, val in av}
+        elif op is sre_parse.SUBPATTERN:
+            add_flags = av[1]
+            if not add_flags & re.IGNORECASE:
+                return self.expand_sequence(av[-1])
+        elif op is sre_parse.BRANCH:
+            res = set()
+            for branch in av[1]:
+                expanded = self.expand_sequence(branch)
+                if expanded is None:
+                    return None
+                res.update(expanded)
+            return res if len(res) <= self.MAX_LITERALS_PER_RULE else None
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            min_count, max_count, sub_pattern = av
+            expanded = self.expand_sequence(sub_pattern)
+            if expanded is not None and max_count <= 3:
+                res = set()
+                for count in range(min_count, max_count + 1):
+                    repeated = {""}
+                    for _ in range(count):
+                        repeated = self.concat(repeated, expanded)
+                        if repeated is None:
+                            return None
+                    res.update(repeated)
+                return res if len(res) <= self.MAX_LITERALS_PER_RULE else None
+        return None
+
+    def expand_sequence(self, sub_pattern):
+        res = {""}
+        for item in sub_pattern:
+            expanded = self.expand_item(item)
+            if expanded is None:
+                return None
+            res = self.concat(res, expanded)
+            if res is None:
+                return None
+        return res
+
+    def concat(self, prefixes: set, suffixes: set):
+        if len(prefixes) * len(suffixes) > self.MAX_LITERALS_PER_RULE:
+            return None
+        return {prefix + suffix for prefix, suffix in product(prefixes, suffixes)}
+
+    @staticmethod
+    def choose_more_selective(literals1, literals2):
+        """
+        A set of literals is more selective if its shortest literal is longer. A set which contains the empty string
+        (i.e., it may match nothing) is not valid at all.
+        """
+        candidates = [lits for lits in (literals1, literals2) if lits and "" not in lits]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda lits: (min(len(lit) for lit in lits), -len(lits)))
+
+
+def compile_trie_regex(words) -> re.Pattern:
+    """
+    Compiles a regex which matches any of the given words. The words are arranged in a trie,
+    so that words with a common prefix share the same branch of the regex (e.g., ["tae", "tai"] -> "ta(?:e|i)").
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}                           # end of a word
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        res = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node:                          # a word ends here, so the rest is optional
+            res = "(?:" + res + ")?"
+        return res
+
+    return re.compile(build(trie))
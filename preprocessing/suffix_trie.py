@@ -0,0 +1,37 @@
+class SuffixTrie:
+    """
+    A trie of suffixes which are stored reversed, so all the suffixes of a given word are found in a single
+    right-to-left scan of the word, no matter how many suffixes there are.
+    The suffixes are returned in the order in which they were added (i.e., by priority), and not by their length.
+    """
+
+    def __init__(self, suffixes=()):
+        self.root = {}
+        self.size = 0
+        for suffix in suffixes:
+            self.add(suffix)
+
+    def add(self, suffix: str):
+        node = self.root
+        for char in reversed(suffix):
+            node = node.setdefault(char, {})
+        if None not in node:                    # the None key marks the end of a suffix: (priority, suffix)
+            node[None] = (self.size, suffix)
+            self.size += 1
+
+    def find_suffixes(self, word: str) -> list:
+        """
+        :return: a list of all the suffixes that word ends with, ordered by their priority
+        """
+        node = self.root
+        matches = []
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None)
+            if match is not None:
+                matches.append(match)
+        if len(matches) > 1:
+            matches.sort()
+        return [suffix for _, suffix in matches]
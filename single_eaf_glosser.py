@@ -1,52 +1,128 @@
 from speach import elan
 from eaf_parser import *
 from khoekhoe_disambiguator import KhoekhoeDisambiguator as kkd
+from khoekhoe_disambiguator import AnnotationContext, FteLine, SPECIAL_CASES, NONVERBAL_FTE_LINES
 import preprocessing.annotation_cleaner as annotation_cleaner
+from preprocessing.spelling_corrector import SpellingCorrector
+from pipeline_metrics import PipelineMetrics, NULL_METRICS
 
 
 class SingleEafGlosser:
-    HORTATIVE_PARTICLES = {"a", "ǀkhī", "ā"}
 
-    def __init__(self, input_eaf_path: str, capitalized_words: set, paralinguistic_items: dict):
-        self.eaf = elan.read_eaf(input_eaf_path)            # eaf is an object of type Doc. Doc object consists of Tier objects, which consist of Annotation objects
+    def __init__(self, input_eaf_path: str, capitalized_words: set, paralinguistic_items: dict, eaf: Doc = None,
+                 metrics: PipelineMetrics = None, spelling_corrector: SpellingCorrector = None):
+        """
+        :param eaf: an already parsed (and tokenized) Doc object. If None, the Doc is read from input_eaf_path
+        :param metrics: the PipelineMetrics to which the times of the disambiguation rules and the dictionary hits
+                        and misses are added, or None
+        :param spelling_corrector: the compiled misspellings rules, shared between files. If None, they are read and
+                                   compiled for this file (see AnnotationCleaner)
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.eaf = eaf if eaf is not None else elan.read_eaf(input_eaf_path)            # eaf is an object of type Doc. Doc object consists of Tier objects, which consist of Annotation objects
         self.eaf_parser = EAF_Parser(self.eaf)
+        self.tiers = self.eaf_parser.tiers                  # the Tier objects, taken from the document's TierMap
         self.ge_indexes = self.eaf_parser.get_ge_indexes()
         self.tx_indexes = self.eaf_parser.get_tx_indexes()
         self.ge_to_ps = self.eaf_parser.get_ge_to_ps_tiers_mapping()
         self.tx_to_fte = self.eaf_parser.get_tx_fte_annotations_mapping()
         self.tx_to_orig_idx_dict = self.eaf_parser.get_tx_to_orig_tiers_mapping()
         self.cur_tx_id = 0
+        self.cur_tx_line = ""                       # the current utterance as tokenized in \mb, see update_cur_tx_ann
+        self.cur_fte = FteLine("")                          # the fte of the current tx annotation, see update_cur_tx_ann
         self.is_second_ge = False
-        self.annotation_cleaner = annotation_cleaner.AnnotationCleaner()
+        self.annotation_cleaner = annotation_cleaner.AnnotationCleaner(self.metrics, spelling_corrector)
         self.capitalized_words_set = capitalized_words
         self.back_channels = set(paralinguistic_items["BackChannels"])
         self.fillers = set(paralinguistic_items["Fillers"])
+        self.morpheme_annotations = {}          # {morpheme : [ids of the \ge annotations glossed according to it]}
 
     def gloss_file(self, gram_glossing_dict, lex_glossing_dict):
+        self.gloss_all_annotations(gram_glossing_dict, lex_glossing_dict)
+        with self.metrics.time("final tx cleaning"):
+            self.copy_orig_to_tx()
+            self.final_tx_cleaning()
+            self.add_brackets_to_tx()
+
+    def regloss_file(self, gram_glossing_dict, lex_glossing_dict):
+        """
+        Glosses again a file which was already tokenized and glossed (i.e., an output file), according to its current
+        \\mb tiers, so manual corrections of \\mb are kept. Preprocessing and tokenization are not repeated, and the
+        \\tx tiers are not changed.
+        :return: None
+        """
+        self.eaf_parser.copy_mb_to_ge_and_ps()
+        self.gloss_all_annotations(gram_glossing_dict, lex_glossing_dict)
+
+    def gloss_all_annotations(self, gram_glossing_dict, lex_glossing_dict):
         for ge_idx in self.ge_indexes:
             ps_idx = self.ge_to_ps[ge_idx]
             mb_idx = self.eaf_parser.get_mb_idx_according_to_ge(ge_idx)
-            ge = self.eaf.tiers()[ge_idx]                   # ge, ps and mb are Tier objects
-            ps = self.eaf.tiers()[ps_idx]
-            mb = self.eaf.tiers()[mb_idx]
+            ge = self.tiers[ge_idx]                         # ge, ps and mb are Tier objects
+            ps = self.tiers[ps_idx]
+            mb = self.tiers[mb_idx]
 
             for i in range(len(ge.annotations)):            # iterate over all annotations
-                self.update_cur_tx_ann(ge, i)
+                self.update_cur_tx_ann(ge, mb, i)
+                ge_ann = ge.annotations[i]
+                self.morpheme_annotations.setdefault(ge_ann.value, []).append(ge_ann.ID)
+                self.gloss_single_annotation(ge, ps, mb, i, gram_glossing_dict, lex_glossing_dict)
+
+    def regloss_annotations(self, ann_ids: set, gram_glossing_dict, lex_glossing_dict):
+        """
+        Glosses again only the given \\ge annotations (and their \\ps annotations) of an already glossed file,
+        e.g., after their entries in the glossing dictionary were changed (see MorphemeIndex).
+        They are glossed according to their current \\mb annotations, so manual corrections of \\mb are kept.
+        The \\tx tiers are not changed, since they were already cleaned when the file was glossed.
+        :param ann_ids: ids of \\ge annotations
+        :return: the number of annotations which were glossed again
+        """
+        reglossed_num = 0
+        for ge_idx in self.ge_indexes:
+            ps = self.tiers[self.ge_to_ps[ge_idx]]
+            mb = self.tiers[self.eaf_parser.get_mb_idx_according_to_ge(ge_idx)]
+            ge = self.tiers[ge_idx]
+            for i in range(len(ge.annotations)):
+                self.update_cur_tx_ann(ge, mb, i)
+                if ge.annotations[i].ID not in ann_ids:
+                    if mb.annotations[i].value == "ge":        # as if it was glossed (see gloss_single_annotation)
+                        self.is_second_ge = True
+                    continue
+                ge.annotations[i].value = ps.annotations[i].value = mb.annotations[i].value
                 self.gloss_single_annotation(ge, ps, mb, i, gram_glossing_dict, lex_glossing_dict)
+                reglossed_num += 1
+        return reglossed_num
 
-        self.copy_orig_to_tx()
-        self.final_tx_cleaning()
-        self.add_brackets_to_tx()
+    def get_morpheme_annotations(self):
+        return self.morpheme_annotations
 
-    def update_cur_tx_ann(self, ge: Tier, cur_index: int):                      # cur_index --> index of cur annotation
+    def update_cur_tx_ann(self, ge: Tier, mb: Tier, cur_index: int):            # cur_index --> index of cur annotation
         cur_ge_ann = ge.annotations[cur_index]
         next_tx_id = self.eaf.annotation(cur_ge_ann.ref_id).ref_id                 # tx.id -> ref_id(mb) -> ref_id(ref_id(ge))
         if next_tx_id != self.cur_tx_id:
             self.cur_tx_id = next_tx_id
             self.is_second_ge = False
+            self.cur_tx_line = self.get_mb_line(mb, cur_index)
+            fte_id = self.tx_to_fte.get(next_tx_id)
+            self.cur_fte = FteLine(self.eaf.annotation(fte_id).value if fte_id is not None else "")    # once per utterance
+
+    def get_mb_line(self, mb: Tier, first_index: int):
+        """
+        The \\tx line of the special cases is rebuilt from the \\mb annotations of the utterance (as they were split by
+        EAF_Parser.tokenize_single_tx_ann), since in output files \\tx was already restored from \\orig and cleaned,
+        and \\mb may have been corrected manually.
+        :param first_index: index of the first \\mb annotation of the utterance
+        :return: the \\mb values of the utterance, separated by spaces
+        """
+        tx_id = mb.annotations[first_index].ref_id
+        mb_values = []
+        for mb_ann in mb.annotations[first_index:]:
+            if mb_ann.ref_id != tx_id:
+                break
+            mb_values.append(mb_ann.value)
+        return " ".join(mb_values)
 
     def gloss_single_annotation(self, ge: Tier, ps: Tier, mb: Tier, i: int, gram_glossing_dict, lex_glossing_dict):     # i --> index of cur annotation
-        tx_ann = self.eaf.annotation(self.cur_tx_id).value
         ge_ann = ge.annotations[i]
         ge_ann_val = ge_ann.value
         ps_ann = ps.annotations[i]
@@ -57,71 +133,63 @@ class SingleEafGlosser:
             mb_next = mb.annotations[i+1].value
         else:
             mb_next = None
-        res = (ge.annotations[i].value, ps.annotations[i].value)
-        cur_fte = ""
-        if self.cur_tx_id in self.tx_to_fte.keys():
-            cur_fte = self.eaf.annotation(self.tx_to_fte[self.cur_tx_id]).value.lower()
+        res = None
+        cur_fte = self.cur_fte
+        special_case = SPECIAL_CASES.get(ge_ann_val)                 # a single lookup for all the special cases
+        if cur_fte.text in NONVERBAL_FTE_LINES and ge_ann_val != "ge":     # cur_fte.text is lowered!
+            res = cur_fte.text.upper(), cur_fte.text.upper()
+            self.metrics.count("nonverbal glosses")
+        elif special_case is not None:
+            context = AnnotationContext(ge_ann_val, self.cur_tx_line, cur_fte,
+                                        mb_prev, mb_next, self.is_second_ge)
+            res = self.metrics.call("special cases", special_case, context, rule=ge_ann_val)   # None if it should be glossed by the dictionary
+            if res is not None:
+                self.metrics.count("special case glosses")
         if ge_ann_val == "ge":
-            res = kkd.decl_vs_pst(self.is_second_ge)
             self.is_second_ge = True
-        elif cur_fte in ["[backchannel]", "[laughter]", "[cough]", "[gasp]",                # cur_fte is lowered above!
-                         "[nose]", "[throat]", "[moan]", "[groan]"]:
-            res = cur_fte.upper(), cur_fte.upper()
-        elif ge_ann_val in self.HORTATIVE_PARTICLES:
-            res = kkd.hort_vs_stata(ge_ann_val, cur_fte, mb_next)
-        elif ge_ann_val == "o":
-            res = kkd.conj_o(tx_ann, mb_prev)
-        elif ge_ann_val == "axa":
-            res = kkd.axase_cop(mb_next)
-        elif ge_ann_val == "ai" and mb_next == "-s":
-            res = "front", "n"
-        elif ge_ann_val == "xa":
-            res = kkd.xa_postp(cur_fte)
-        elif ge_ann_val == "-gu":
-            res = kkd.pgn_vs_recp(cur_fte)
-        elif ge_ann_val == "î":
-            res = kkd.yes_vs_interj(cur_fte)
-        elif ge_ann_val == "ti":
-            res = kkd.poss1_vs_quot_vs_1sg(self.eaf.annotation(self.cur_tx_id).value, cur_fte)
-        elif ge_ann_val == "sa" or ge_ann_val == "sā":
-            res = kkd.poss2_vs_2pro_1incl(cur_fte, mb_next)
-        elif ge_ann_val == "sī":
-            res = kkd.we_vs_arrive(cur_fte)
-        elif ge_ann_val == "si":
-            res = kkd.firstExcl_vs_femObj(mb_next)
-        elif ge_ann_val == "hâ":
-            res = kkd.particle_ha(mb_prev, cur_fte.lower())
-        elif ge_ann_val == "ǁnā":
-            res = kkd.dist_vs_fall(cur_fte.lower())
-        elif ge_ann_val == "=se":
-            res = kkd.manner_se(mb_prev)
-        elif ge_ann_val in gram_glossing_dict:                      # if there is no ambiguity or a special case --> search in the grammatical glossing dictionary
-            possible_senses = gram_glossing_dict[ge_ann_val]        # each sense is an instance of Lemma class
-            chosen_idx = kkd.disambiguate(possible_senses, cur_fte, mb_next)
-            res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
-        elif ge_ann_val in lex_glossing_dict:                       # otherwise, search in the lexical dictionary
-            possible_senses = lex_glossing_dict[ge_ann_val]
-            chosen_idx = kkd.disambiguate(possible_senses, cur_fte, mb_next)
-            res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
-        elif ge_ann_val.lower() in lex_glossing_dict:
-            possible_senses = lex_glossing_dict[ge_ann_val.lower()]
-            chosen_idx = kkd.disambiguate(possible_senses, cur_fte, mb_next)
-            res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
+
+        if res is None:
+            if ge_ann_val in gram_glossing_dict:                    # if there is no ambiguity or a special case --> search in the grammatical glossing dictionary
+                possible_senses = gram_glossing_dict[ge_ann_val]    # each sense is an instance of Lemma class
+                self.metrics.count("grammatical dictionary hits")
+                chosen_idx = self.metrics.call("dictionary disambiguation", kkd.disambiguate, possible_senses,
+                                               cur_fte, mb_next, rule=self.get_entry_rule(ge_ann_val))
+                res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
+            elif ge_ann_val in lex_glossing_dict:                   # otherwise, search in the lexical dictionary
+                possible_senses = lex_glossing_dict[ge_ann_val]
+                self.metrics.count("lexical dictionary hits")
+                chosen_idx = self.metrics.call("dictionary disambiguation", kkd.disambiguate, possible_senses,
+                                               cur_fte, mb_next, rule=self.get_entry_rule(ge_ann_val))
+                res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
+            elif ge_ann_val.lower() in lex_glossing_dict:
+                possible_senses = lex_glossing_dict[ge_ann_val.lower()]
+                self.metrics.count("lexical dictionary hits (lowercased)")
+                chosen_idx = self.metrics.call("dictionary disambiguation", kkd.disambiguate, possible_senses,
+                                               cur_fte, mb_next, rule=self.get_entry_rule(ge_ann_val.lower()))
+                res = possible_senses[chosen_idx].ge, possible_senses[chosen_idx].ps
+            else:
+                self.metrics.count("dictionary misses")
+                res = ge_ann_val, ps_ann.value
 
         ge_ann.value, ps_ann.value = res[0], res[1]
 
+    def get_entry_rule(self, entry: str):
+        """
+        :return: the name of a dictionary entry as a rule of the metrics, only if they are detailed (see PipelineMetrics)
+        """
+        return entry if self.metrics.detailed else ""
+
     def copy_orig_to_tx(self):
         for tx_idx in self.tx_indexes:
-            equivalent_orig_idx = self.tx_to_orig_idx_dict[tx_idx]
-            for tx_annotation in self.eaf.tiers()[tx_idx]:
-                for orig_annotation in self.eaf.tiers()[equivalent_orig_idx]:
-                    if orig_annotation.ref_id == tx_annotation.ID:
-                        tx_annotation.value = orig_annotation.value
-                        break
+            orig_by_ref_id = self.eaf_parser.get_ref_id_index(self.tx_to_orig_idx_dict[tx_idx])
+            for tx_annotation in self.tiers[tx_idx]:
+                orig_annotation = orig_by_ref_id.get(tx_annotation.ID)
+                if orig_annotation is not None:
+                    tx_annotation.value = orig_annotation.value
 
     def final_tx_cleaning(self):
         for tx_idx in self.tx_indexes:
-            for tx_annotation in self.eaf.tiers()[tx_idx]:
+            for tx_annotation in self.tiers[tx_idx]:
                 self.annotation_cleaner.set_annotation(tx_annotation.value)
                 tx_annotation.value = self.annotation_cleaner.clean_annotation(self.capitalized_words_set)
                 tx_annotation.value = self.annotation_cleaner.fix_orthography_in_tx_tier()
@@ -132,21 +200,22 @@ class SingleEafGlosser:
         :return: None
         """
         for tx_idx in self.tx_indexes:
-            equivalent_orig_idx = self.tx_to_orig_idx_dict[tx_idx]
-            for tx_annotation in self.eaf.tiers()[tx_idx]:
-                for orig_annotation in self.eaf.tiers()[equivalent_orig_idx]:
-                    if orig_annotation.ref_id == tx_annotation.ID:
-                        tx_lst = tx_annotation.value.split()
-                        for i in range(len(tx_lst)):
-                            if "tare" in tx_lst[i] and "tae" in orig_annotation.value:
-                                tx_lst[i] = tx_lst[i].replace("tare", "ta(r)e")
-                            elif "tari" in tx_lst[i] and "tai" in orig_annotation.value:
-                                tx_lst[i] = tx_lst[i].replace("tari", "ta(r)i")
-                            elif tx_lst[i] == "garu" and "gau" in orig_annotation.value:
-                                tx_lst[i] = "ga(r)u"
-                            elif tx_lst[i] in self.back_channels or tx_lst[i] in self.fillers:
-                                tx_lst[i] = "[" + tx_lst[i] + "]"
-                        tx_annotation.value = " ".join(tx_lst)
-
-    def save_file(self, output_path: str):
-        self.eaf.save(output_path)
\ No newline at end of file
+            orig_by_ref_id = self.eaf_parser.get_ref_id_index(self.tx_to_orig_idx_dict[tx_idx])
+            for tx_annotation in self.tiers[tx_idx]:
+                orig_annotation = orig_by_ref_id.get(tx_annotation.ID)
+                if orig_annotation is None:
+                    continue
+                tx_lst = tx_annotation.value.split()
+                for i in range(len(tx_lst)):
+                    if "tare" in tx_lst[i] and "tae" in orig_annotation.value:
+                        tx_lst[i] = tx_lst[i].replace("tare", "ta(r)e")
+                    elif "tari" in tx_lst[i] and "tai" in orig_annotation.value:
+                        tx_lst[i] = tx_lst[i].replace("tari", "ta(r)i")
+                    elif tx_lst[i] == "garu" and "gau" in orig_annotation.value:
+                        tx_lst[i] = "ga(r)u"
+                    elif tx_lst[i] in self.back_channels or tx_lst[i] in self.fillers:
+                        tx_lst[i] = "[" + tx_lst[i] + "]"
+                tx_annotation.value = " ".join(tx_lst)
+
+    def save_file(self, output_path: str, compact: bool = False):
+        self.eaf_parser.save_file(output_path, compact)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import shutil
+import sys
+
+import openpyxl
+import pytest
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+import config
+import main
+from preprocessing.annotation_cleaner import AnnotationCleaner
+
+RESOURCES = ("capitalized_words.txt", "misspellings_correction.json", "paralinguistic_items.json",
+             "words_not_to_segment.json")
+DICTIONARY_COLUMNS = ("Ignore?", "mb", "ge", "ps", "Gender", "Source", "Other Translations", "Common Misspellings",
+                      "Gram/Lex")
+# (mb, ge, ps, Gram/Lex) rows of a small glossing dictionary
+DICTIONARY_ROWS = (("ti", "QUOT", "ptcl", "G"), ("-ta", "1SG", "-pgn", "G"), ("o", "when", "conj", "G"),
+                   ("ra", "PROG", "ptcl", "G"), ("ge", "DECL", "ptcl", "G"), ("ǃgû", "go", "v.intr.act", "L"),
+                   ("ta", "1SG", "pro", "G"), ("-b", "3M.SG", "-nsf", "G"), ("khoe", "person", "n", "L"),
+                   ("mû", "see", "v.tr.act", "L"))
+# utterances whose glosses depend on the special cases of the \tx line ("ti -ta", sentence initial "o")
+UTTERANCES_PATH = os.path.join(REPO_PATH, "tests", "data", "utterances.eaf")
+
+
+class Workspace:
+    """
+    A working directory with the input and output directories of main, the project's resources and a small glossing
+    dictionary. The paths of config (and their copies in main) are replaced by paths in the working directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.input_path = os.path.join(path, "input")
+        self.output_path = os.path.join(path, "output")
+
+    def write_dictionary(self, other_translations=None):
+        """
+        :param other_translations: {mb : the Other Translations of its entry}
+        """
+        other_translations = other_translations if other_translations is not None else {}
+        workbook = openpyxl.Workbook()
+        worksheet = workbook.active
+        worksheet.title = main.GLOSSES_DICT_WORKSHEET_NAME
+        worksheet.append(DICTIONARY_COLUMNS)
+        for mb, ge, ps, gram_or_lex in DICTIONARY_ROWS:
+            worksheet.append((None, mb, ge, ps, None, None, other_translations.get(mb), None, gram_or_lex))
+        workbook.save(main.GLOSSES_DICT_PATH)
+
+    def write_input_file(self, filename):
+        shutil.copy(UTTERANCES_PATH, os.path.join(self.input_path, filename))
+
+    def read_output_file(self, filename):
+        with open(os.path.join(self.output_path, filename), "rb") as f:
+            return f.read()
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    workspace = Workspace(str(tmp_path))
+    os.mkdir(workspace.input_path)
+    os.mkdir(workspace.output_path)
+    for filename in RESOURCES:
+        shutil.copy(os.path.join(REPO_PATH, "input", filename), workspace.input_path)
+    monkeypatch.chdir(tmp_path)
+    for name, filename in (("GLOSSES_DICT_PATH", "ISF_Khoekhoe_dictionary_for_glosses.xlsx"),
+                           ("GLOSSES_DICT_CACHE_PATH", "ISF_Khoekhoe_dictionary_for_glosses.cache"),
+                           ("CAPITALIZED_WORDS_LIST_PATH", "capitalized_words.txt"),
+                           ("WORDS_NOT_TO_SEGMENT", "words_not_to_segment.json"),
+                           ("PARALINGUISTIC_ITEMS_PATH", "paralinguistic_items.json"),
+                           ("SEGMENTATION_CACHE_PATH", "segmentation.cache")):
+        monkeypatch.setattr(config, name, os.path.join("input", filename))
+        monkeypatch.setattr(main, name, os.path.join("input", filename))
+    monkeypatch.setattr(AnnotationCleaner, "MISSPELLINGS_DICTS_PATH",
+                        os.path.join("input", "misspellings_correction.json"))
+    workspace.write_dictionary()
+    return workspace
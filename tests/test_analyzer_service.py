@@ -0,0 +1,46 @@
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from analyzer_service import AnalyzerService, AnalyzerServer
+
+
+@pytest.fixture
+def start_server(workspace):
+    servers = []
+
+    def start(max_requests=AnalyzerService.DEFAULT_MAX_REQUESTS):
+        server = AnalyzerServer(("127.0.0.1", 0), AnalyzerService(False, max_requests))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_eaf_without_tx_tiers_is_a_request_error(start_server):
+    connection = http.client.HTTPConnection(*start_server(), timeout=10)
+    connection.request("POST", "/eaf", b"<x/>")
+    response = connection.getresponse()
+    assert response.status == 400
+    assert json.loads(response.read()) == {"error": "The eaf file has no tx tiers."}
+
+
+def test_rejected_request_is_answered_before_its_body_is_sent(start_server):
+    with socket.create_connection(start_server(max_requests=0), timeout=10) as connection:
+        connection.sendall(b"POST /eaf HTTP/1.1\r\nHost: localhost\r\nContent-Length: 1000\r\n\r\n")
+        assert connection.recv(1024).startswith(b"HTTP/1.0 503 ")
+
+
+@pytest.mark.parametrize("content_length_header, status", [(b"", 411), (b"Content-Length: abc\r\n", 400),
+                                                           (b"Content-Length: -1\r\n", 400)])
+def test_invalid_content_length_is_rejected_before_admission(start_server, content_length_header, status):
+    with socket.create_connection(start_server(max_requests=0), timeout=10) as connection:
+        connection.sendall(b"POST /eaf HTTP/1.1\r\nHost: localhost\r\n" + content_length_header + b"\r\n")
+        assert connection.recv(1024).startswith(b"HTTP/1.0 " + str(status).encode() + b" ")
@@ -0,0 +1,137 @@
+import os
+import re
+
+from speach import elan
+
+import main
+from eaf_parser import EAF_Parser
+from eaf_stream import EafStreamReader, EafStreamWriter, AnnotationRecord
+from eaf_template import EafTemplate, add_ref_annotation
+
+UTTERANCES = (("ref1", "Ti ta ra ǃgû.", "He says that I am going."), ("ref2", "Tita ge ra ǃgû.", "Then I go."),
+              ("ref3", "O ti ta ra khoeb mû.", "When I see the man."))
+
+
+def write_template(path, orig_order=(), mb_order=()):
+    """
+    Writes a file of the utterances with empty mb, ge and ps tiers (and other empty tiers).
+    :param orig_order: the indexes of the utterances whose orig annotations are added, in the order of the orig tier
+    :param mb_order: the indexes of the utterances whose tokens are added to the mb tier (each with a ge annotation
+                     of the same value), in the order of the mb tier
+    """
+    document = EafTemplate("A", "urn:test")
+    tx_ids = [document.add_utterance("A", i * 1000, (i + 1) * 1000, ref_value, tx_value, fte_value)
+              for i, (ref_value, tx_value, fte_value) in enumerate(UTTERANCES)]
+    for i in orig_order:
+        document.last_ann_id += 1
+        add_ref_annotation(document.tiers["orig@A"], "a" + str(document.last_ann_id), tx_ids[i], UTTERANCES[i][1])
+    for i in mb_order:
+        for token in UTTERANCES[i][1].split():
+            mb_id, ge_id = "a" + str(document.last_ann_id + 1), "a" + str(document.last_ann_id + 2)
+            document.last_ann_id += 2
+            add_ref_annotation(document.tiers["mb@A"], mb_id, tx_ids[i], token)
+            add_ref_annotation(document.tiers["ge@A"], ge_id, mb_id, token)
+    with open(path, "wb") as f:
+        f.write(document.to_bytes())
+
+
+def stream_copy(input_path, output_path, change_record=None):
+    reader = EafStreamReader(input_path)
+    with EafStreamWriter(output_path, reader) as writer:
+        for record in reader:
+            if change_record is not None:
+                change_record(record)
+            writer.write(record)
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def get_orig_values(path):
+    """
+    :return: {tx value : the value of its orig annotation}
+    """
+    eaf = elan.read_eaf(path)
+    parser = EAF_Parser(eaf)
+    orig_by_ref_id = parser.get_ref_id_index(parser.get_tx_to_orig_tiers_mapping()[parser.get_tx_indexes()[0]])
+    return {tx.value: orig_by_ref_id[tx.ID].value for tx in parser.tiers[parser.get_tx_indexes()[0]]}
+
+
+def test_processed_file_is_copied_unchanged(workspace):
+    workspace.write_input_file("t.eaf")
+    main.process_all_files(auto_detect_english=False)
+    output_path = os.path.join(workspace.output_path, "t.eaf")
+    stream_copy(output_path, os.path.join(workspace.path, "copy.eaf"))
+    # EAF_Parser.save_file doesn't update lastUsedAnnotationId after tokenization, and the writer does
+    max_ann_id = max(int(ann_id) for ann_id in re.findall(rb'ANNOTATION_ID="a(\d+)"', read_bytes(output_path)))
+    expected = EafStreamWriter.LAST_USED_ANN_ID_PATTERN.sub(rb"\g<1>" + str(max_ann_id).encode() + rb"\g<3>",
+                                                            read_bytes(output_path))
+    assert read_bytes(os.path.join(workspace.path, "copy.eaf")) == expected
+
+
+def test_tiers_in_order_are_read_without_indexing_their_parents(workspace, monkeypatch):
+    workspace.write_input_file("t.eaf")
+    main.process_all_files(auto_detect_english=False)
+    output_path = os.path.join(workspace.output_path, "t.eaf")
+
+    def get_order(*args):
+        raise AssertionError("the parent annotations were indexed")
+
+    monkeypatch.setattr(EafStreamReader, "get_order", get_order)
+    records = list(EafStreamReader(output_path))
+    assert len(records) == 5 and all(record.mb and len(record.ge) == len(record.mb) for record in records)
+
+
+def test_empty_tiers_are_copied_unchanged(tmp_path):
+    input_path = str(tmp_path / "input.eaf")
+    write_template(input_path, orig_order=(0, 1, 2))
+    assert b'TIER_ID="mb@A" PARENT_REF="tx@A" />' in read_bytes(input_path)
+    stream_copy(input_path, str(tmp_path / "output.eaf"))
+    assert read_bytes(str(tmp_path / "output.eaf")) == read_bytes(input_path)
+
+
+def test_orig_tier_out_of_order_is_joined_with_its_tx_annotations(tmp_path):
+    input_path = str(tmp_path / "input.eaf")
+    write_template(input_path, orig_order=(2, 0, 1))          # three runs in the orig tier
+    records = list(EafStreamReader(input_path))
+    assert [(record.tx.value, record.orig.value, record.orig.ref_id) for record in records] == \
+           [(record.tx.value, record.tx.value, record.tx.ID) for record in records]
+
+    output_path = str(tmp_path / "output.eaf")
+    stream_copy(input_path, output_path)
+    assert get_orig_values(output_path) == get_orig_values(input_path)
+
+
+def test_mb_tier_out_of_order_is_joined_with_its_tx_and_ge_annotations(tmp_path):
+    input_path = str(tmp_path / "input.eaf")
+    write_template(input_path, orig_order=(0, 1, 2), mb_order=(1, 2, 0))    # the ge tier follows the order of mb
+    records = list(EafStreamReader(input_path))
+    assert [[mb.value for mb in record.mb] for record in records] == [tx.split() for ref, tx, fte in UTTERANCES]
+    assert all([ge.value for ge in record.ge] == [mb.value for mb in record.mb] for record in records)
+
+
+def test_new_annotations_update_last_used_annotation_id(tmp_path):
+    input_path = str(tmp_path / "input.eaf")
+    write_template(input_path, orig_order=(0, 1, 2))
+    new_ids = iter(range(100, 200))
+
+    def tokenize(record):
+        for token in record.tx.value.split():
+            attributes = {"ANNOTATION_ID": "a" + str(next(new_ids)), "ANNOTATION_REF": record.tx.ID}
+            if record.mb:
+                attributes["PREVIOUS_ANNOTATION"] = record.mb[-1].ID
+            record.mb.append(AnnotationRecord("REF_ANNOTATION", attributes, token))
+            for tier_annotations in (record.ge, record.ps):
+                dependent_attributes = {"ANNOTATION_ID": "a" + str(next(new_ids)),
+                                        "ANNOTATION_REF": attributes["ANNOTATION_ID"]}
+                tier_annotations.append(AnnotationRecord("REF_ANNOTATION", dependent_attributes, token))
+
+    output_path = str(tmp_path / "output.eaf")
+    stream_copy(input_path, output_path, tokenize)
+    last_used = EafStreamWriter.LAST_USED_ANN_ID_PATTERN.search(read_bytes(output_path)).group(2)
+    assert int(last_used) == next(new_ids) - 1
+    eaf = elan.read_eaf(output_path)
+    assert [ann.value for ann in eaf["mb@A"]] == " ".join(tx for ref, tx, fte in UTTERANCES).split()
+    assert [ann.value for ann in eaf["ge@A"]] == [ann.value for ann in eaf["mb@A"]]
@@ -0,0 +1,24 @@
+import os
+
+import main
+
+
+def test_patched_glosses_equal_forced_processing(workspace, capsys):
+    workspace.write_input_file("t.eaf")
+    main.process_all_files(auto_detect_english=False)
+    workspace.write_dictionary(other_translations={"ti": "say"})         # only the annotations of "ti" are affected
+
+    main.process_all_files(auto_detect_english=False)
+    assert "glossed again in 1 files" in capsys.readouterr().out
+    patched = workspace.read_output_file("t.eaf")
+    main.process_all_files(auto_detect_english=False, force=True)
+    assert patched == workspace.read_output_file("t.eaf")
+
+
+def test_gloss_only_of_fresh_output_changes_nothing(workspace):
+    workspace.write_input_file("t.eaf")
+    main.process_all_files(auto_detect_english=False)
+    processed = workspace.read_output_file("t.eaf")
+
+    assert main.gloss_output_files() == [os.path.join(main.OUTPUT_DIRECTORY_PATH, "t.eaf")]
+    assert workspace.read_output_file("t.eaf") == processed
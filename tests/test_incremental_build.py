@@ -0,0 +1,52 @@
+import os
+
+import main
+from pipeline_metrics import PipelineMetrics
+
+
+def process_all_files():
+    """
+    :return: the number of files which were processed (i.e., not up to date)
+    """
+    metrics = PipelineMetrics()
+    main.process_all_files(auto_detect_english=False, metrics=metrics)
+    return metrics.counters["files processed"]
+
+
+def write_input_file_with(workspace, filename, old, new):
+    """
+    Writes the input file of the utterances, with new instead of old
+    """
+    workspace.write_input_file(filename)
+    path = os.path.join(workspace.input_path, filename)
+    with open(path, "rb") as f:
+        content = f.read()
+    with open(path, "wb") as f:
+        f.write(content.replace(old.encode("utf-8"), new.encode("utf-8")))
+
+
+def read_capitalized_words():
+    with open(main.CAPITALIZED_WORDS_LIST_PATH, encoding="utf-8") as f:
+        return f.read().split()
+
+
+def test_new_file_with_new_capitalized_word_makes_only_itself_stale(workspace):
+    workspace.write_input_file("a.eaf")
+    assert process_all_files() == 1
+    write_input_file_with(workspace, "b.eaf", "ra khoeb mû", "ra Gobabeb mû")        # a new capitalized word
+
+    assert process_all_files() == 1
+    assert "Gobabeb" in read_capitalized_words()
+    assert process_all_files() == 0
+
+
+def test_file_which_uses_new_capitalized_word_is_processed_again(workspace):
+    write_input_file_with(workspace, "a.eaf", "Tita ge ra ǃgû.", "Gobabeb ge ra ǃgû.")
+    assert process_all_files() == 1
+    write_input_file_with(workspace, "b.eaf", "ra khoeb mû", "ra Gobabeb mû")        # a new capitalized word
+
+    assert process_all_files() == 1         # only b.eaf, since Gobabeb is known only after it is processed
+    assert "gobabeb" in workspace.read_output_file("a.eaf").decode("utf-8")
+    assert process_all_files() == 1         # a.eaf, whose \tx begins with the new capitalized word
+    assert "gobabeb" not in workspace.read_output_file("a.eaf").decode("utf-8")
+    assert process_all_files() == 0
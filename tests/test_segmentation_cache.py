@@ -0,0 +1,57 @@
+import os
+import shutil
+
+from speach import elan
+
+import main
+from conftest import REPO_PATH
+from eaf_parser import EAF_Parser
+from input_files_handler import InputFilesHandler
+from pipeline_metrics import PipelineMetrics
+from preprocessing.morpheme_breaker import MorphemeBreaker
+from preprocessing.segmentation_cache import SegmentationCache
+
+
+def read_mb_values(path):
+    eaf = elan.read_eaf(path)
+    parser = EAF_Parser(eaf)
+    return [[ann.value for ann in parser.tiers[mb_idx]] for mb_idx in parser.mb_indexes]
+
+
+def read_segmentation_resources():
+    input_files_reader = InputFilesHandler()
+    words_not_to_segment = input_files_reader.read_json_into_dict(main.WORDS_NOT_TO_SEGMENT)
+    paralinguistic_items = input_files_reader.read_json_into_dict(main.PARALINGUISTIC_ITEMS_PATH)
+    return words_not_to_segment, paralinguistic_items
+
+
+def test_warm_cache_gives_the_same_segmentation(workspace):
+    shutil.copy(os.path.join(REPO_PATH, "input", "elan_try.eaf"), workspace.input_path)
+    output_path = os.path.join(workspace.output_path, "elan_try.eaf")
+    cold_metrics = PipelineMetrics()
+    main.process_all_files(auto_detect_english=False, metrics=cold_metrics)
+    cold_mb_values = read_mb_values(output_path)
+
+    warm_metrics = PipelineMetrics()
+    main.process_all_files(auto_detect_english=False, force=True, metrics=warm_metrics)
+    assert cold_metrics.counters["segmentation cache hits"] < warm_metrics.counters["segmentation cache hits"]
+    assert warm_metrics.counters["segmentation cache misses"] == 0
+    assert any(cold_mb_values)
+    assert read_mb_values(output_path) == cold_mb_values
+
+
+def test_bind_drops_entries_of_other_resources(workspace):
+    words_not_to_segment, paralinguistic_items = read_segmentation_resources()
+    cache = SegmentationCache()
+    breaker = MorphemeBreaker(set(words_not_to_segment["FormsNotToSegment"]),
+                              set(words_not_to_segment["NominalsNotToSegment"]), paralinguistic_items, set(), cache)
+    assert breaker.break_annotation_to_morphemes("tita ge ra ǃgû", "") == "ti -ta ge ra ǃgû"
+    cache.save(main.SEGMENTATION_CACHE_PATH)
+
+    loaded_cache = SegmentationCache()
+    assert loaded_cache.load(main.SEGMENTATION_CACHE_PATH) and loaded_cache.entries
+    breaker = MorphemeBreaker(set(words_not_to_segment["FormsNotToSegment"]) | {"tita"},
+                              set(words_not_to_segment["NominalsNotToSegment"]), paralinguistic_items, set(),
+                              loaded_cache)
+    assert not any(key[0] == "tita" for key in loaded_cache.entries)
+    assert breaker.break_annotation_to_morphemes("tita ge ra ǃgû", "") == "tita ge ra ǃgû"
@@ -0,0 +1,53 @@
+import json
+import os
+import re
+
+from conftest import REPO_PATH
+from preprocessing.spelling_corrector import SpellingCorrector
+
+with open(os.path.join(REPO_PATH, "input", "misspellings_correction.json"), encoding="utf8") as json_file:
+    MISSPELLINGS_RULES = json.load(json_file)["misspellingsPatternsAndReplacements"]
+# rules which are not reduced to literals (IGNORECASE) or whose literals are only a part of the pattern
+# (backreference, lookaround)
+FALLBACK_RULES = {"(?i)\\bnamas\\b": "Namas", "(ǃg|ǁg)(a)\\2b": "\\1ab", "(?<=ǃ)hoa(?= ǀ)": "hôa",
+                  "(?<!ǂ)khoen\\b": "khoena", "\\bta(?!r)e": "te"}
+
+
+def apply_all_rules(rules, annotation):
+    """
+    The plain application of the rules, as it was before SpellingCorrector
+    """
+    for pattern, replacement in rules.items():
+        annotation = re.sub(pattern, replacement, annotation)
+    return annotation
+
+
+def annotations_for(corrector):
+    """
+    Annotations which contain the literals of each rule, alone, inside other words, capitalized and all together
+    """
+    all_literals = []
+    for pattern, replacement, literals in corrector.rules:
+        if literals is None:                    # the fallback rules are covered by the last annotation
+            continue
+        all_literals.extend(literals)
+        yield " ".join(literals)
+        yield " ".join("x" + literal + "y" for literal in literals)
+        yield " ".join(literal.capitalize() + "," for literal in literals)
+    yield " ".join(all_literals)
+    yield "ǃhoa ǀgau ǃgaab ǁgaab tae i ǃaroma Namas khoen ǂkhoen NAMAS, namas"
+
+
+def test_corrector_equals_applying_all_rules():
+    rules = dict(MISSPELLINGS_RULES, **FALLBACK_RULES)
+    corrector = SpellingCorrector(rules)
+    assert corrector.rules[list(rules).index("(?i)\\bnamas\\b")][2] is None
+    for annotation in annotations_for(corrector):
+        assert corrector.correct(annotation) == apply_all_rules(rules, annotation), annotation
+
+
+def test_corrector_without_fallback_rules_equals_applying_all_rules():
+    corrector = SpellingCorrector(MISSPELLINGS_RULES)
+    assert corrector.any_literal is not None            # all the rules of the project are reduced to literals
+    for annotation in annotations_for(corrector):
+        assert corrector.correct(annotation) == apply_all_rules(MISSPELLINGS_RULES, annotation), annotation
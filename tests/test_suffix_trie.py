@@ -0,0 +1,44 @@
+from itertools import product
+
+import pytest
+
+from preprocessing.morpheme_breaker import MorphemeBreaker
+from preprocessing.suffix_trie import SuffixTrie
+
+SUFFIX_LISTS = {"PGN": MorphemeBreaker.PGN_MORPHEMES, "valency": MorphemeBreaker.VALENCY_CHANGING_SUFFIXES,
+                "oblique": MorphemeBreaker.OBLIQUE_ENDINGS}
+# suffixes of each list which are the tail of another suffix of the same list
+TAILS = {"PGN": [("ts", "s")], "valency": [("bahe", "he"), ("basen", "sen")], "oblique": [("ga", "a"), ("de", "e")]}
+
+
+def find_suffixes_by_scan(suffixes, word):
+    """
+    The ordered scan of the suffixes list, as it was before SuffixTrie
+    """
+    return [suffix for suffix in suffixes if word.endswith(suffix)]
+
+
+def words_for(suffixes):
+    all_suffixes = [suffix for suffix_list in SUFFIX_LISTS.values() for suffix in suffix_list]
+    for prefix, suffix in product(["", "x", "ǃa", "ǁkhā", "b", "s"], all_suffixes):
+        yield prefix + suffix
+    for suffix1, suffix2 in product(suffixes, repeat=2):
+        yield suffix1 + suffix2
+    yield ""
+
+
+@pytest.mark.parametrize("name", SUFFIX_LISTS)
+def test_trie_equals_ordered_scan(name):
+    suffixes = SUFFIX_LISTS[name]
+    trie = SuffixTrie(suffixes)
+    for longer, shorter in TAILS[name]:
+        assert {longer, shorter} <= set(trie.find_suffixes("ǃa" + longer))
+        assert trie.find_suffixes("ǃa" + longer) == find_suffixes_by_scan(suffixes, "ǃa" + longer)
+    for word in words_for(suffixes):
+        assert trie.find_suffixes(word) == find_suffixes_by_scan(suffixes, word), word
+
+
+def test_tries_of_morpheme_breaker_keep_the_lists_order():
+    assert MorphemeBreaker.PGN_SUFFIX_TRIE.find_suffixes("ǃgâts") == ["ts", "s"]
+    assert MorphemeBreaker.VALENCY_CHANGING_SUFFIX_TRIE.find_suffixes("ǃgûbahe") == ["bahe", "he"]
+    assert MorphemeBreaker.OBLIQUE_ENDINGS_TRIE.find_suffixes("ǃnaga") == ["ga", "a"]
@@ -0,0 +1,133 @@
+import weakref
+from speach.elan import Doc
+
+
+class TierMap:
+    """
+    The tiers of a Doc, classified by their types and mapped to each other (tx -> orig, ge -> ps etc.).
+    It is built once per document (see TierMap.of) and shared by EAF_Parser, Preprocessor and SingleEafGlosser,
+    so the tiers are not searched again for each stage, tier or annotation.
+    It assumes that no tiers are added to the Doc after it is built.
+    It may also be built from the tiers' headers only (see eaf_stream.TierHeader), without parsing the document.
+    """
+    SPEAKER_SEPARATOR = "@"             # tier names are of the form: "tx@A", "mb@A", where "A" is the speaker
+    _tier_maps = weakref.WeakKeyDictionary()        # {Doc : TierMap}
+
+    def __init__(self, tiers):
+        """
+        :param tiers: a sequence of all the tiers of the document, as Tier objects (or objects with the same name,
+                      parent_ref and linguistic_type attributes)
+        """
+        self.tiers = tiers                          # a tuple of all Tier objects (eaf.tiers() builds a new tuple each call)
+        self.tx_indexes, self.fte_indexes, self.orig_indexes, self.ge_indexes, self.ps_indexes, self.mb_indexes = \
+            self.find_tiers_indexes()
+        self.tx_to_orig = {}                        # {tx_tier_idx : orig_tier_idx}
+        self.ge_to_ps = {}                          # {ge_tier_idx : ps_tier_idx}
+        self.ge_to_mb = {}                          # {ge_tier_idx : mb_tier_idx}
+        self.speakers = {}                          # {speaker : {tier_type : tier_idx}}, see map_speakers
+        self.map_tiers()
+        self.map_speakers()
+
+    @classmethod
+    def of(cls, eaf: Doc):
+        """
+        :return: the TierMap of eaf. It is built only on the first call for each Doc object.
+        """
+        tier_map = cls._tier_maps.get(eaf)
+        if tier_map is None:
+            tier_map = cls(eaf.tiers())
+            cls._tier_maps[eaf] = tier_map
+        return tier_map
+
+    def find_tiers_indexes(self):
+        tx_indexes = []
+        fte_indexes = []
+        orig_indexes = []
+        ge_indexes = []
+        ps_indexes = []
+        mb_index = []
+
+        for i, cur_tier in enumerate(self.tiers):
+            if cur_tier.linguistic_type.ID == "tx":
+                tx_indexes.append(i)
+            elif "fte" in cur_tier.name:
+                fte_indexes.append(i)
+            elif cur_tier.linguistic_type.ID == "orig":
+                orig_indexes.append(i)
+            elif "ge" in cur_tier.name:
+                ge_indexes.append(i)
+            elif cur_tier.linguistic_type.ID == "ps":
+                ps_indexes.append(i)
+            elif cur_tier.linguistic_type.ID == "mb":
+                mb_index.append(i)
+        return tx_indexes, fte_indexes, orig_indexes, ge_indexes, ps_indexes, mb_index
+
+    def map_tiers(self):
+        """
+        Maps each tx tier to its orig tier (the orig tier's parent is the tx tier), and each ge tier to its mb tier
+        (the ge tier's parent) and to its ps tier (which has the same parent). If there are several candidates, the
+        first tier is chosen, except for orig tiers, where the last one is chosen.
+        :return: None
+        """
+        tx_by_name = self.index_by(self.tx_indexes, "name")
+        for orig_idx in self.orig_indexes:
+            tx_idx = tx_by_name.get(self.tiers[orig_idx].parent_ref)
+            if tx_idx is not None:
+                self.tx_to_orig[tx_idx] = orig_idx
+        ps_by_parent = self.index_by(self.ps_indexes, "parent_ref")
+        mb_by_name = self.index_by(self.mb_indexes, "name")
+        for ge_idx in self.ge_indexes:
+            ge_parent = self.tiers[ge_idx].parent_ref
+            if ge_parent in ps_by_parent:
+                self.ge_to_ps[ge_idx] = ps_by_parent[ge_parent]
+            if ge_parent in mb_by_name:
+                self.ge_to_mb[ge_idx] = mb_by_name[ge_parent]
+
+    def map_speakers(self):
+        """
+        Maps each speaker to the indexes of its tiers: {speaker : {"tx": idx, "orig": idx, "fte": idx, "mb": idx,
+        "ge": idx, "ps": idx}}. A tier type is missing from the inner dict if the speaker doesn't have such a tier.
+        :return: None
+        """
+        fte_by_parent = self.index_by(self.fte_indexes, "parent_ref")
+        mb_by_parent = self.index_by(self.mb_indexes, "parent_ref")
+        ge_by_parent = self.index_by(self.ge_indexes, "parent_ref")
+        for tx_idx in self.tx_indexes:
+            tx_name = self.tiers[tx_idx].name
+            speaker_tiers = {"tx": tx_idx}
+            if tx_idx in self.tx_to_orig:
+                speaker_tiers["orig"] = self.tx_to_orig[tx_idx]
+            if tx_name in fte_by_parent:
+                speaker_tiers["fte"] = fte_by_parent[tx_name]
+            if tx_name in mb_by_parent:
+                mb_idx = mb_by_parent[tx_name]
+                speaker_tiers["mb"] = mb_idx
+                ge_idx = ge_by_parent.get(self.tiers[mb_idx].name)
+                if ge_idx is not None:
+                    speaker_tiers["ge"] = ge_idx
+                    if ge_idx in self.ge_to_ps:
+                        speaker_tiers["ps"] = self.ge_to_ps[ge_idx]
+            self.speakers.setdefault(get_speaker(tx_name), speaker_tiers)
+
+    def index_by(self, tiers_indexes, attribute: str):
+        """
+        :param attribute: the attribute of Tier which is used as the key (e.g., "name")
+        :return: dict of {key : the index of the first tier with this key}
+        """
+        index = {}
+        for tier_idx in tiers_indexes:
+            index.setdefault(getattr(self.tiers[tier_idx], attribute), tier_idx)
+        return index
+
+    def get_speaker_tiers(self, speaker: str):
+        """
+        :return: dict of {tier_type : Tier} of the speaker's tiers (see map_speakers)
+        """
+        return {tier_type: self.tiers[tier_idx] for tier_type, tier_idx in self.speakers[speaker].items()}
+
+
+def get_speaker(tier_name: str):
+    """
+    :return: the speaker of a tier (e.g., "A" for "tx@A")
+    """
+    return tier_name.rsplit(TierMap.SPEAKER_SEPARATOR, 1)[-1]